@@ -1,10 +1,14 @@
 """Flask 应用主文件"""
+import time
+_import_started = time.perf_counter()
+
 import os
 from flask import Flask, render_template
 from backend.config import Config
-from backend.database import init_db
+from backend.database import init_db, SessionLocal
 from backend.api.chat_api import chat_bp
 from backend.api.health_api import health_bp
+from backend.api.banking_api import banking_bp
 import logging
 
 # 配置日志
@@ -17,6 +21,7 @@ logger = logging.getLogger(__name__)
 
 def create_app():
     """应用工厂函数"""
+    started = time.perf_counter()
     # 创建 Flask 应用
     app = Flask(__name__, template_folder='frontend')
     app.secret_key = Config.SECRET_KEY
@@ -24,23 +29,34 @@ def create_app():
     # 注册蓝图
     app.register_blueprint(chat_bp)
     app.register_blueprint(health_bp)
+    app.register_blueprint(banking_bp)
+
+    @app.teardown_appcontext
+    def remove_db_session(exception=None):
+        """请求结束后归还数据库连接"""
+        SessionLocal.remove()
 
     @app.route('/')
     def index():
         """首页1"""
         return render_template('index.html')
     
-    # 初始化数据库
-    try:
-        init_db()
-        logger.info("数据库初始化成功")
-    except Exception as e:
-        logger.error(f"数据库初始化失败: {str(e)}")
-        # 在生产环境中，如果数据库初始化失败，记录错误但不阻止启动
-        # 这样可以先部署应用，再配置数据库
-        if os.getenv("FLASK_ENV") == "production":
-            logger.warning("生产环境数据库初始化失败，请检查数据库配置")
+    # 建表和初始化数据默认由 python init_db.py 在部署时执行一次，worker 启动时不访问数据库
+    if Config.DB_AUTO_INIT:
+        try:
+            init_db()
+            logger.info("数据库初始化成功")
+        except Exception as e:
+            logger.error(f"数据库初始化失败: {str(e)}")
+            # 在生产环境中，如果数据库初始化失败，记录错误但不阻止启动
+            # 这样可以先部署应用，再配置数据库
+            if os.getenv("FLASK_ENV") == "production":
+                logger.warning("生产环境数据库初始化失败，请检查数据库配置")
     
+    logger.info(
+        f"应用启动完成：导入 {(started - _import_started) * 1000:.0f}ms，"
+        f"create_app {(time.perf_counter() - started) * 1000:.0f}ms (pid={os.getpid()})"
+    )
     return app
 
 # 创建应用实例（gunicorn 会使用这个）
@@ -0,0 +1,129 @@
+"""ASGI 应用入口（异步模式）
+
+聊天接口以协程方式运行：等待 DeepSeek 响应期间不占用线程，
+单个进程即可同时处理大量进行中的对话。其余路由仍由 Flask 应用处理。
+
+运行方式：
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+"""
+import json
+import uuid
+import asyncio
+import logging
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from app import app as flask_app
+from backend.config import Config
+from backend.database import SessionLocal
+from backend.service.chat_service import ChatService
+from backend.service.conversation_service import ConversationService
+from backend.service.llm_resilience import Deadline
+
+logger = logging.getLogger(__name__)
+
+def get_or_create_session_id(request: Request) -> str:
+    """获取或创建会话ID"""
+    if 'session_id' not in request.session:
+        request.session['session_id'] = str(uuid.uuid4())
+    return request.session['session_id']
+
+def format_sse(event: str, data: dict) -> str:
+    """格式化 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def new_db_session():
+    """
+    创建独立的数据库会话
+    会话会在线程池的不同线程中依次使用，因此不能使用按线程划分的 scoped_session
+    """
+    return SessionLocal.session_factory()
+
+async def read_message(request: Request) -> str:
+    """读取请求中的用户消息"""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    return (body or {}).get("message", "").strip()
+
+async def chat(request: Request):
+    """处理聊天请求"""
+    deadline = Deadline.from_headers(request.headers)
+    db = new_db_session()
+    try:
+        user_input = await read_message(request)
+        if not user_input:
+            return JSONResponse({"reply": "❌ 请输入您的问题。"}, status_code=400)
+
+        session_id = get_or_create_session_id(request)
+        chat_service = ChatService(db)
+        reply, status = await chat_service.achat(session_id, user_input, deadline)
+        return JSONResponse({"reply": reply}, status_code=status)
+
+    except Exception as e:
+        logger.error(f"Chat error: {str(e)}", exc_info=True)
+        return JSONResponse({"reply": f"❌ 系统错误：{str(e)}。请稍后重试。"}, status_code=500)
+    finally:
+        await asyncio.to_thread(db.close)
+
+async def chat_stream(request: Request):
+    """流式处理聊天请求（Server-Sent Events）"""
+    deadline = Deadline.from_headers(request.headers)
+    user_input = await read_message(request)
+    if not user_input:
+        return JSONResponse({"reply": "❌ 请输入您的问题。"}, status_code=400)
+
+    session_id = get_or_create_session_id(request)
+
+    async def generate():
+        db = new_db_session()
+        try:
+            chat_service = ChatService(db)
+            async for event, data in chat_service.achat_stream(session_id, user_input, deadline):
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+            yield format_sse("done", {"reply": f"❌ 系统错误：{str(e)}。请稍后重试。", "error": True})
+        finally:
+            await asyncio.to_thread(db.close)
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+async def clear_conversation(request: Request):
+    """清除对话历史"""
+    db = new_db_session()
+    try:
+        session_id = get_or_create_session_id(request)
+        conversation_service = ConversationService(db)
+        await asyncio.to_thread(conversation_service.clear_conversation, session_id)
+        return JSONResponse({"status": "success", "message": "对话历史已清除"})
+    except Exception as e:
+        logger.error(f"Clear conversation error: {str(e)}", exc_info=True)
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+    finally:
+        await asyncio.to_thread(db.close)
+
+app = Starlette(
+    routes=[
+        Route('/chat', chat, methods=['POST']),
+        Route('/chat/stream', chat_stream, methods=['POST']),
+        Route('/clear', clear_conversation, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    middleware=[
+        Middleware(SessionMiddleware, secret_key=Config.SECRET_KEY, session_cookie='bank_session'),
+    ],
+)
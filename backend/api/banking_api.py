@@ -0,0 +1,90 @@
+"""银行业务 API"""
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from sqlalchemy.orm import Session
+from backend.config import Config
+from backend.database import get_db
+from backend.service.banking_service import BankingService
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+banking_bp = Blueprint('banking', __name__)
+
+@banking_bp.route('/transfers/batch', methods=['POST'])
+def batch_transfer():
+    """批量转账：所有转账在一个事务中执行，返回每一笔的结果"""
+    try:
+        transfers = (request.json or {}).get("transfers")
+        if not isinstance(transfers, list) or not transfers:
+            return jsonify({"status": "error", "message": "transfers 必须是非空列表"}), 400
+        if len(transfers) > Config.BATCH_TRANSFER_MAX_ITEMS:
+            return jsonify({
+                "status": "error",
+                "message": f"单次最多 {Config.BATCH_TRANSFER_MAX_ITEMS} 笔转账"
+            }), 400
+        if not all(isinstance(transfer, dict) for transfer in transfers):
+            return jsonify({"status": "error", "message": "每笔转账必须包含 from_name、to_name、amount"}), 400
+        
+        db: Session = next(get_db())
+        banking_service = BankingService(db)
+        result = banking_service.batch_transfer(transfers)
+        return jsonify({"status": "success", **result})
+    
+    except Exception as e:
+        logger.error(f"Batch transfer error: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@banking_bp.route('/accounts/<name>/transactions', methods=['GET'])
+def transaction_history(name: str):
+    """分页查询交易记录：limit 指定每页条数，cursor 为上一页返回的 next_cursor"""
+    try:
+        limit = request.args.get("limit", 20, type=int)
+        cursor = request.args.get("cursor") or None
+        
+        db: Session = next(get_db())
+        banking_service = BankingService(db)
+        page = banking_service.get_transaction_page(name, limit, cursor)
+        if page is None:
+            return jsonify({"status": "error", "message": f"未找到账户：{name}"}), 404
+        return jsonify({"status": "success", **page})
+    
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Transaction history error: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@banking_bp.route('/accounts', methods=['GET'])
+def list_accounts():
+    """分页查询账户：type 按账户类型筛选，prefix 按名称前缀筛选，after 为上一页返回的 next_after"""
+    try:
+        db: Session = next(get_db())
+        banking_service = BankingService(db)
+        page = banking_service.get_account_page(
+            account_type=request.args.get("type") or None,
+            name_prefix=request.args.get("prefix") or None,
+            limit=request.args.get("limit", type=int),
+            after=request.args.get("after") or None,
+        )
+        return jsonify({"status": "success", **page})
+    
+    except Exception as e:
+        logger.error(f"List accounts error: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@banking_bp.route('/accounts/export', methods=['GET'])
+def export_accounts():
+    """以 NDJSON 流式导出账户（每行一个账户），支持 type、prefix 筛选"""
+    db: Session = next(get_db())
+    account_service = BankingService(db).account_service
+    accounts = account_service.iter_accounts(
+        account_type=request.args.get("type") or None,
+        name_prefix=request.args.get("prefix") or None,
+    )
+    
+    def generate():
+        for account in accounts:
+            yield json.dumps(account, ensure_ascii=False) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
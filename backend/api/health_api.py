@@ -1,5 +1,16 @@
 """健康检查 API"""
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify
+from backend.database import get_pool_stats, replica_router
+from backend.metrics import render_metrics
+from backend.llm_client import llm_clients
+from backend.service.intent_router import router_stats
+from backend.service.history_cache import history_cache
+from backend.service.conversation_writer import conversation_writer
+from backend.service.account_cache import account_cache, account_name_index
+from backend.service.response_cache import response_cache
+from backend.service.context_service import context_stats
+from backend.service.llm_metrics import llm_stats
+from backend.service.llm_resilience import llm_breaker
 
 health_bp = Blueprint('health', __name__)
 
@@ -8,3 +19,44 @@ def health():
     """健康检查接口"""
     return jsonify({"status": "ok", "service": "银行智能体"})
 
+@health_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 指标（多 worker 部署时汇总所有 worker）"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@health_bp.route('/health/db', methods=['GET'])
+def db_pool_health():
+    """数据库连接池状态（主库和只读副本）"""
+    return jsonify({"status": "ok", "pool": get_pool_stats(), "replicas": replica_router.get_stats()})
+
+@health_bp.route('/health/llm', methods=['GET'])
+def llm_client_health():
+    """模型 API 连接复用状态、调用统计（延迟、token 用量、前缀缓存命中）与熔断器状态"""
+    return jsonify({"status": "ok", "connections": llm_clients.get_stats(), "calls": llm_stats.to_dict(),
+                    "breaker": llm_breaker.get_stats()})
+
+@health_bp.route('/health/router', methods=['GET'])
+def intent_router_health():
+    """本地意图路由命中统计"""
+    return jsonify({"status": "ok", "router": router_stats.to_dict()})
+
+@health_bp.route('/health/history', methods=['GET'])
+def history_cache_health():
+    """对话历史缓存命中统计与异步写入队列状态"""
+    return jsonify({"status": "ok", "cache": history_cache.get_stats(), "writer": conversation_writer.get_stats()})
+
+@health_bp.route('/health/context', methods=['GET'])
+def context_health():
+    """提示词 token 统计"""
+    return jsonify({"status": "ok", "context": context_stats.to_dict()})
+
+@health_bp.route('/health/accounts', methods=['GET'])
+def account_cache_health():
+    """账户信息缓存命中统计（names 为账户名称检查的统计）"""
+    return jsonify({"status": "ok", "cache": account_cache.get_stats(), "names": account_name_index.get_stats()})
+
+@health_bp.route('/health/responses', methods=['GET'])
+def response_cache_health():
+    """通用问答回复缓存命中统计"""
+    return jsonify({"status": "ok", "cache": response_cache.get_stats()})
@@ -9,8 +9,25 @@ class Config:
     
     # DeepSeek API 配置
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "sk-b7a3837bd39d403aa961e2e95026ee35")
-    DEEPSEEK_BASE_URL = "https://api.deepseek.com"
-    DEEPSEEK_MODEL = "deepseek-chat"
+    DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")  # 任意 OpenAI 兼容服务，压测时指向本地模拟服务
+    DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+    
+    # 模型 API 的 HTTP 连接池配置（每个进程共享一个客户端）
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))  # 最大并发连接数
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))  # 保持空闲的连接数
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保留秒数
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "auto")  # auto: 安装了 h2 时启用；true/false: 强制开关
+    
+    # 模型调用的时限、重试与熔断
+    CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "25"))  # 单个对话请求的总时限（秒），需小于 gunicorn worker 超时（默认 30 秒）
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))  # 单次模型请求的超时秒数（不超过剩余时限）
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))  # 超时、限流、5xx 等临时错误的最大重试次数
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # 首次重试前最长等待秒数，之后指数增长，实际等待随机抖动
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))  # 单次重试等待上限
+    LLM_BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", "30"))  # 熔断器统计错误率的时间窗口（秒）
+    LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))  # 窗口内至少多少次调用才判断错误率
+    LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))  # 错误率达到该值时熔断
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "15"))  # 熔断后多少秒放行探测请求
     
     # MySQL 数据库配置
     MYSQL_HOST = os.getenv("MYSQL_HOST", "sjc1.clusters.zeabur.com")
@@ -24,6 +41,77 @@ class Config:
         """构建 MySQL 连接 URI"""
         return f"mysql+pymysql://{self.MYSQL_USER}:{self.MYSQL_PASSWORD}@{self.MYSQL_HOST}:{self.MYSQL_PORT}/{self.MYSQL_DATABASE}?charset=utf8mb4"
     
+    # 数据库连接配置
+    DATABASE_URL = os.getenv("DATABASE_URL", "")  # 设置后覆盖 MySQL 配置，如 sqlite:///bank.db
+    DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue")  # queue: 连接池；null: 每次请求新建连接
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # 常驻连接数
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # 高峰期允许额外创建的连接数
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 连接最长存活秒数，需小于 MySQL wait_timeout
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # 等待空闲连接的最长秒数
+    DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")  # 只读副本 URI，多个用逗号分隔；留空时读写都走主库
+    DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))  # 会话写入后该秒数内的读取仍走主库（读己之写），需大于副本复制延迟
+    DB_AUTO_INIT = os.getenv("DB_AUTO_INIT", "false").lower() == "true"  # 应用启动时建表和初始化数据；默认由 python init_db.py 单独执行
+    
+    @property
+    def DATABASE_URI(self) -> str:
+        """实际使用的数据库连接 URI"""
+        return self.DATABASE_URL or self.MYSQL_URI
+    
+    # 转账重试配置（死锁、锁等待超时）
+    TRANSFER_MAX_RETRIES = int(os.getenv("TRANSFER_MAX_RETRIES", "3"))
+    TRANSFER_RETRY_BASE_DELAY = float(os.getenv("TRANSFER_RETRY_BASE_DELAY", "0.05"))  # 首次重试前等待的秒数，之后指数增长
+    
+    TRANSACTION_PAGE_MAX = int(os.getenv("TRANSACTION_PAGE_MAX", "100"))  # 交易记录单页最大条数
+    ACCOUNT_PAGE_SIZE = int(os.getenv("ACCOUNT_PAGE_SIZE", "20"))  # 账户列表默认每页条数（回复给模型的列表也按此截断）
+    ACCOUNT_PAGE_MAX = int(os.getenv("ACCOUNT_PAGE_MAX", "100"))  # 账户列表单页最大条数
+    ACCOUNT_STREAM_BATCH = int(os.getenv("ACCOUNT_STREAM_BATCH", "1000"))  # 导出账户时每批从游标读取的行数
+    BATCH_TRANSFER_MAX_ITEMS = int(os.getenv("BATCH_TRANSFER_MAX_ITEMS", "1000"))  # 单次批量转账的最大笔数
+    
+    # 交易编号生成配置
+    TXN_ID_GENERATOR = os.getenv("TXN_ID_GENERATOR", "sequence")  # sequence: 数据库号段；snowflake: 时间有序 ID
+    TXN_ID_BLOCK_SIZE = int(os.getenv("TXN_ID_BLOCK_SIZE", "100"))  # 每个进程一次申请的号段大小
+    TXN_WORKER_ID = os.getenv("TXN_WORKER_ID", "")  # snowflake 的机器号（0-1023），只适用于单进程运行；留空时每个进程从数据库租用不重复的机器号
+    
+    # 本地意图路由配置（明确的银行指令不经过模型直接执行）
+    INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+    INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.9"))  # 低于该置信度交给模型
+    INTENT_FALLBACK_THRESHOLD = float(os.getenv("INTENT_FALLBACK_THRESHOLD", "0.5"))  # 模型不可用时本地路由使用的置信度阈值（只执行只读功能）
+    
+    # 函数调用配置
+    LLM_NATIVE_TOOLS = os.getenv("LLM_NATIVE_TOOLS", "true").lower() == "true"  # 使用原生 tools/tool_calls；false 时使用 CALL: 文本格式
+    TOOL_MAX_CALLS = int(os.getenv("TOOL_MAX_CALLS", "10"))  # 单次回复最多执行的工具调用数
+    TOOL_MAX_PARALLEL = int(os.getenv("TOOL_MAX_PARALLEL", "4"))  # 并行执行只读工具调用的线程数，1 表示顺序执行
+    
     # 对话历史配置
     MAX_CONVERSATION_HISTORY = 100  # 最大对话历史条数
+    HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "1000"))  # 进程内缓存的会话数，0 表示关闭缓存
+    HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "300"))  # 会话缓存有效秒数（每次读取都会校验版本，多 worker 部署时不会读到旧历史）
+
+    # 对话消息异步写入（write-behind）：消息先进入进程内队列，由后台线程批量落库
+    CONVERSATION_WRITE_BEHIND = os.getenv("CONVERSATION_WRITE_BEHIND", "false").lower() == "true"  # 是否启用异步写入
+    CONVERSATION_FLUSH_INTERVAL_MS = int(os.getenv("CONVERSATION_FLUSH_INTERVAL_MS", "50"))  # 最早一条消息最多等待多少毫秒落库
+    CONVERSATION_FLUSH_ROWS = int(os.getenv("CONVERSATION_FLUSH_ROWS", "200"))  # 队列中消息达到该条数时立即落库，也是单次 INSERT 的最大行数
+    CONVERSATION_QUEUE_SIZE = int(os.getenv("CONVERSATION_QUEUE_SIZE", "5000"))  # 队列容量（消息条数）
+    CONVERSATION_QUEUE_TIMEOUT = float(os.getenv("CONVERSATION_QUEUE_TIMEOUT", "1"))  # 队列满时请求最多等待秒数，超时后改为同步写入
+
+    # 对话历史保留策略（python purge_conversations.py 定期执行）
+    CONVERSATION_RETENTION_DAYS = float(os.getenv("CONVERSATION_RETENTION_DAYS", "90"))  # 最后一条消息早于该天数的会话会被清理
+    PURGE_CHUNK_SIZE = int(os.getenv("PURGE_CHUNK_SIZE", "1000"))  # 每批按主键扫描的消息行数（一个短事务）
+    
+    # 账户信息缓存配置（只缓存名称、账号、类型、信用额度，余额始终实时查询）
+    ACCOUNT_CACHE_SIZE = int(os.getenv("ACCOUNT_CACHE_SIZE", "10000"))  # 进程内缓存的账户数，0 表示关闭缓存
+    ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "300"))  # 账户信息缓存有效秒数
+    ACCOUNT_NAME_CACHE_SIZE = int(os.getenv("ACCOUNT_NAME_CACHE_SIZE", "100000"))  # 检查文本是否提到账户时，缓存的候选片段查询结果数
+    ACCOUNT_NAME_MAX_LENGTH = int(os.getenv("ACCOUNT_NAME_MAX_LENGTH", "20"))  # 检查文本是否提到账户时，候选片段的最大长度
+    
+    # 通用问答回复缓存配置（只缓存不涉及账户数据的回答）
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))  # 进程内缓存的回复数，0 表示关闭缓存
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # 回复缓存有效秒数
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")  # 多 worker 共享的 SQLite 缓存文件，留空则只用进程内缓存
+    
+    # 上下文窗口配置
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 发送给模型的提示词 token 上限（估算值）
+    CONTEXT_MIN_RECENT_MESSAGES = int(os.getenv("CONTEXT_MIN_RECENT_MESSAGES", "4"))  # 无论预算多少都原样保留的最近消息数
+    CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "true").lower() == "true"  # 是否把窗口外的旧对话折叠为摘要
+    SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))  # 摘要长度上限
 
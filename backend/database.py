@@ -1,32 +1,311 @@
 """数据库连接和初始化"""
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.pool import NullPool
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+from sqlalchemy.sql import Select
 from backend.config import Config
+from backend.metrics import DB_POOL_WAIT_SECONDS
+from typing import Dict, List, Optional
+import itertools
+import os
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+class InstrumentedQueuePool(QueuePool):
+    """
+    记录连接等待时间的连接池
+    只统计等待空闲连接的时间，新建连接的耗时不计入等待时间
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkout = threading.local()
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+    
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            self._checkout.connect_time = getattr(self._checkout, "connect_time", 0.0) \
+                + time.perf_counter() - start
+    
+    def _do_get(self):
+        # QueuePool._do_get 在连接数变化时会递归调用自身，只在最外层统计一次
+        if getattr(self._checkout, "active", False):
+            return super()._do_get()
+        self._checkout.active = True
+        self._checkout.connect_time = 0.0
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            self._checkout.active = False
+            elapsed = max(time.perf_counter() - start - self._checkout.connect_time, 0.0)
+            DB_POOL_WAIT_SECONDS.observe(elapsed)
+            with self._stats_lock:
+                self.wait_count += 1
+                self.wait_time_total += elapsed
+                if elapsed > self.wait_time_max:
+                    self.wait_time_max = elapsed
+
+def create_db_engine(uri: str, pool_mode: str = None):
+    """
+    根据配置创建数据库引擎
+    MySQL 与 sqlite 文件库使用连接池；sqlite 内存库只能共享单个连接
+    """
+    pool_mode = pool_mode or Config.DB_POOL_MODE
+    url = make_url(uri)
+    options = {"echo": False}
+    
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            options["poolclass"] = StaticPool
+            return create_engine(uri, **options)
+    else:
+        options["connect_args"] = {
+            "charset": "utf8mb4",
+            "connect_timeout": 10
+        }
+    
+    if pool_mode == "null":
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_recycle=Config.DB_POOL_RECYCLE,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+            pool_pre_ping=True,  # 取出连接前检测，自动重连
+        )
+    return create_engine(uri, **options)
+
 # 创建数据库引擎
 config = Config()
-engine = create_engine(
-    config.MYSQL_URI,
-    poolclass=NullPool,
-    echo=False,
-    pool_pre_ping=True,  # 自动重连
-    connect_args={
-        "charset": "utf8mb4",
-        "connect_timeout": 10
-    }
+engine = create_db_engine(config.DATABASE_URI)
+
+# 读己之写记录的会话数上限，超过后淘汰最早的记录
+STICKY_KEYS_LIMIT = 100_000
+
+# session.info 中的路由状态
+REPLICA_READS = "replica_reads"  # 当前处于只读副本范围
+ROUTE_KEY = "route_key"  # 读己之写的键（对话会话 ID）
+REPLICA_ENGINE = "replica_engine"  # 本会话固定使用的副本，同一会话内的读取不会在副本间来回切换
+PENDING_WRITE = "pending_write"  # 当前事务执行过写操作
+WROTE = "wrote"  # 本会话提交过写操作
+
+class ReplicaRouter:
+    """
+    只读副本路由（进程内）
+    - 只读副本范围内（replica_reads）的 SELECT 发往副本，多个副本按会话轮流分配；写操作、flush、
+      SELECT ... FOR UPDATE、原生 SQL 和范围外的一切语句都发往主库
+    - 读己之写：会话提交写操作后，同一数据库会话之后的读取，以及同一对话会话在 sticky_seconds 秒内的读取
+      都走主库，转账后立即查询余额不会读到副本上尚未同步的旧数据
+    - 写入记录按进程保存，多 worker 部署时其他 worker 不知道本进程的写入，sticky_seconds 需大于复制延迟
+    """
+
+    def __init__(self, uris: List[str], sticky_seconds: float):
+        self.uris = uris
+        self.sticky_seconds = sticky_seconds
+        self.engines = [create_db_engine(uri) for uri in uris]
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._written: "OrderedDict[str, float]" = OrderedDict()  # 对话会话 ID -> 最近一次写入的时间
+        self._counter = itertools.count()
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        self.primary_statements = 0
+        self.writes_recorded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self):
+        """为一个数据库会话选择副本（轮询）"""
+        return self.engines[next(self._counter) % len(self.engines)]
+
+    def record_write(self, *keys: Optional[str]):
+        """记录这些对话会话刚提交了写操作"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                if key is None:
+                    continue
+                self._written[key] = now
+                self._written.move_to_end(key)
+                self.writes_recorded += 1
+            while self._written and (len(self._written) > STICKY_KEYS_LIMIT
+                                     or next(iter(self._written.values())) < now - self.sticky_seconds):
+                self._written.popitem(last=False)
+
+    def is_sticky(self, key: Optional[str]) -> bool:
+        """该对话会话最近写入过，读取需要走主库"""
+        if key is None:
+            return False
+        with self._lock:
+            written_at = self._written.get(key)
+        return written_at is not None and time.monotonic() - written_at < self.sticky_seconds
+
+    def route(self, session: "RoutingSession", clause) -> Optional[object]:
+        """返回只读副本范围内该语句应使用的副本引擎，需要走主库时返回 None"""
+        info = session.info
+        if session._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            with self._lock:
+                self.primary_statements += 1
+            return None
+        if info.get(WROTE) or info.get(PENDING_WRITE) or self.is_sticky(info.get(ROUTE_KEY)):
+            with self._lock:
+                self.sticky_reads += 1
+            return None
+        with self._lock:
+            self.replica_reads += 1
+        replica = info.get(REPLICA_ENGINE)
+        if replica is None:
+            replica = info[REPLICA_ENGINE] = self.pick()
+        return replica
+
+    def dispose_after_fork(self):
+        for replica in self.engines:
+            replica.dispose(close=False)
+        self._reset()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = {
+                "enabled": self.enabled,
+                "sticky_seconds": self.sticky_seconds,
+                "replica_reads": self.replica_reads,
+                "sticky_reads": self.sticky_reads,
+                "primary_statements": self.primary_statements,
+                "writes_recorded": self.writes_recorded,
+                "sticky_sessions": len(self._written),
+            }
+        stats["replicas"] = [
+            {"url": replica.url.render_as_string(hide_password=True), "pool": _pool_stats(replica.pool)}
+            for replica in self.engines
+        ]
+        return stats
+
+replica_router = ReplicaRouter(
+    [uri.strip() for uri in Config.DATABASE_REPLICA_URLS.split(",") if uri.strip()],
+    Config.DB_REPLICA_STICKY_SECONDS,
 )
 
+class RoutingSession(Session):
+    """按 ReplicaRouter 选择连接的会话；没有配置副本或不在只读副本范围内时与普通会话相同"""
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        if replica_router.enabled and self.info.get(REPLICA_READS):
+            replica = replica_router.route(self, clause)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+if replica_router.enabled:
+    @event.listens_for(RoutingSession, "do_orm_execute")
+    def _track_statement(state):
+        if state.is_insert or state.is_update or state.is_delete:
+            state.session.info[PENDING_WRITE] = True
+
+    @event.listens_for(RoutingSession, "after_flush")
+    def _track_flush(session, flush_context):
+        session.info[PENDING_WRITE] = True
+
+    @event.listens_for(RoutingSession, "after_commit")
+    def _record_commit(session):
+        if session.info.pop(PENDING_WRITE, False):
+            session.info[WROTE] = True
+            replica_router.record_write(session.info.get(ROUTE_KEY))
+
+    @event.listens_for(RoutingSession, "after_rollback")
+    def _discard_writes(session):
+        session.info.pop(PENDING_WRITE, None)
+
+@contextmanager
+def replica_reads(db: Session, enabled: bool = True):
+    """
+    在该范围内，db 的只读查询发往只读副本（没有配置副本时不起作用）
+    只用于可以接受副本复制延迟的查询，写操作仍然发往主库
+    """
+    if not enabled or REPLICA_READS in db.info:
+        yield db
+        return
+    db.info[REPLICA_READS] = True
+    try:
+        yield db
+    finally:
+        db.info.pop(REPLICA_READS, None)
+
+def bind_route_key(db: Session, key: str):
+    """设置读己之写的键：本会话的写入提交后，同一键在 DB_REPLICA_STICKY_SECONDS 秒内的读取走主库"""
+    db.info[ROUTE_KEY] = key
+
 # 创建会话工厂
 SessionLocal = scoped_session(sessionmaker(
+    class_=RoutingSession,
     autocommit=False,
     autoflush=False,
     bind=engine
 ))
 
+def dispose_engine_after_fork():
+    """
+    子进程中丢弃从父进程继承的连接
+    close=False 表示不关闭父进程仍在使用的 socket，只让子进程重新建立自己的连接
+    """
+    SessionLocal.registry.clear()
+    engine.dispose(close=False)
+    replica_router.dispose_after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=dispose_engine_after_fork)
+
+def get_pool_stats() -> Dict:
+    """获取主库连接池统计信息"""
+    return _pool_stats(engine.pool)
+
+def _pool_stats(pool) -> Dict:
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                wait_count=pool.wait_count,
+                wait_time_total=round(pool.wait_time_total, 6),
+                wait_time_avg=round(pool.wait_time_total / pool.wait_count, 6) if pool.wait_count else 0.0,
+                wait_time_max=round(pool.wait_time_max, 6),
+                timeouts=pool.timeouts,
+            )
+    return stats
+
 def get_db():
     """获取数据库会话"""
     db = SessionLocal()
@@ -36,20 +315,57 @@ def get_db():
         db.close()
 
 def init_db():
-    """初始化数据库表"""
-    from backend.model import Base, Account, Transaction, Conversation
-    
+    """
+    初始化数据库表
+    部署时由 python init_db.py 执行一次；设置 DB_AUTO_INIT=true 时应用启动时也会执行
+    """
     try:
-        # 创建所有表
-        Base.metadata.create_all(bind=engine)
-        logger.info("数据库表创建成功")
+        create_tables()
+        
+        # 已存在的表不会被 create_all 修改，补建后续新增的索引
+        ensure_indexes()
         
         # 初始化默认数据
         init_default_data()
+        
+        # 升级前已有交易记录时生成交易汇总
+        ensure_rollups()
     except Exception as e:
         logger.error(f"数据库初始化失败: {str(e)}")
         raise
 
+def create_tables():
+    """创建所有表（已存在的表跳过）"""
+    from backend.model import Base
+    
+    Base.metadata.create_all(bind=engine)
+    logger.info("数据库表创建成功")
+
+def ensure_indexes():
+    """为已存在的表补建模型中新增的索引"""
+    from backend.model import Base
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def ensure_rollups(rebuild: bool = False):
+    """
+    生成交易汇总表：汇总为空而交易记录不为空时（升级前的数据）从交易记录全量重建
+    rebuild=True 时无论是否为空都重建
+    """
+    from backend.model import Transaction
+    from backend.service.rollup_service import RollupService
+    
+    db = SessionLocal.session_factory()
+    try:
+        rollups = RollupService(db)
+        if not rebuild and (not rollups.is_empty() or db.query(Transaction.id).first() is None):
+            return
+        rollups.rebuild()
+    finally:
+        db.close()
+
 def init_default_data():
     """初始化默认账户数据"""
     from backend.model import Account
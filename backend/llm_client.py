@@ -0,0 +1,171 @@
+"""模型 API 客户端管理"""
+from backend.config import Config
+from typing import TYPE_CHECKING, Dict
+import importlib.util
+import os
+import threading
+import weakref
+import httpx
+import logging
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+class ConnectionStats:
+    """统计 HTTP 连接的新建与复用次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = weakref.WeakSet()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def record(self, response: httpx.Response):
+        """根据响应所使用的底层连接判断是否复用"""
+        stream = response.extensions.get("network_stream")
+        with self._lock:
+            self.requests += 1
+            if stream is None:
+                return
+            if stream in self._seen:
+                self.reused_connections += 1
+            else:
+                self._seen.add(stream)
+                self.new_connections += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+            }
+
+class CountingTransport(httpx.HTTPTransport):
+    """记录连接复用情况的同步传输层"""
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = super().handle_request(request)
+        self._stats.record(response)
+        return response
+
+class AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    """记录连接复用情况的异步传输层"""
+
+    def __init__(self, stats: ConnectionStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await super().handle_async_request(request)
+        self._stats.record(response)
+        return response
+
+def _http2_enabled() -> bool:
+    """判断是否启用 HTTP/2（需要安装 h2）"""
+    setting = Config.LLM_HTTP2.lower()
+    if setting == "auto":
+        return importlib.util.find_spec("h2") is not None
+    return setting in ("1", "true", "yes")
+
+class LLMClientManager:
+    """
+    进程级共享的模型 API 客户端
+    所有请求和线程复用同一个 HTTP 连接池，只有第一次请求需要建立 TLS 连接；
+    fork 出的子进程会丢弃继承的客户端并重新创建
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._client = None
+        self._async_client = None
+        self.stats = ConnectionStats()
+
+    def _transport_options(self) -> Dict:
+        return {
+            "limits": httpx.Limits(
+                max_connections=Config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY,
+            ),
+            "http2": _http2_enabled(),
+        }
+
+    def _check_pid(self):
+        """在 fork 后的子进程中首次使用时重建客户端"""
+        if self._pid != os.getpid():
+            self.reset()
+
+    def get_client(self) -> "OpenAI":
+        """获取同步客户端"""
+        self._check_pid()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+
+                    transport = CountingTransport(self.stats, **self._transport_options())
+                    self._client = OpenAI(
+                        api_key=Config.DEEPSEEK_API_KEY,
+                        base_url=Config.DEEPSEEK_BASE_URL,
+                        http_client=httpx.Client(transport=transport),
+                        # 重试由 AIService 在请求时限内统一处理
+                        max_retries=0,
+                    )
+                    logger.info(f"已创建模型 API 客户端 (pid={self._pid})")
+        return self._client
+
+    def get_async_client(self) -> "AsyncOpenAI":
+        """获取异步客户端"""
+        self._check_pid()
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    from openai import AsyncOpenAI
+
+                    transport = AsyncCountingTransport(self.stats, **self._transport_options())
+                    self._async_client = AsyncOpenAI(
+                        api_key=Config.DEEPSEEK_API_KEY,
+                        base_url=Config.DEEPSEEK_BASE_URL,
+                        http_client=httpx.AsyncClient(transport=transport),
+                        max_retries=0,
+                    )
+        return self._async_client
+
+    def reset(self):
+        """
+        丢弃当前客户端（不关闭连接）
+        fork 后父子进程共享 socket，关闭会影响父进程，因此只解除引用
+        """
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._client = None
+        self._async_client = None
+        self.stats = ConnectionStats()
+
+    def get_stats(self) -> Dict:
+        """获取连接复用统计"""
+        stats = self.stats.to_dict()
+        stats["http2"] = _http2_enabled()
+        return stats
+
+llm_clients = LLMClientManager()
+
+def preload_sdk():
+    """
+    导入 openai SDK（约占应用导入时间的一半）
+    应用导入时不加载，第一次创建客户端时才导入；gunicorn preload 模式下在 master 中提前调用，
+    各 worker 直接继承已导入的模块
+    """
+    import openai  # noqa: F401
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=llm_clients.reset)
@@ -0,0 +1,148 @@
+"""Prometheus 指标"""
+from typing import Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+import os
+import time
+
+# gunicorn 多 worker 部署时由 gunicorn.conf.py 设置该目录（必须在导入 prometheus_client 之前），
+# 各 worker 把指标写入目录下的文件，抓取时汇总所有 worker 的数据
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+POOL_WAIT_BUCKETS = (.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30)
+BATCH_ROW_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# /chat 流水线的各个阶段
+STAGES = ("history_load", "llm_call", "parse", "banking", "persist")
+
+CHAT_STAGE_SECONDS = Histogram(
+    "bank_chat_stage_seconds", "对话处理各阶段耗时", ["stage"], buckets=LATENCY_BUCKETS
+)
+CHAT_REQUEST_SECONDS = Histogram(
+    "bank_chat_request_seconds", "对话请求总耗时", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+CHAT_REQUESTS = Counter("bank_chat_requests", "对话请求数", ["endpoint", "status"])
+CHAT_ERRORS = Counter("bank_chat_errors", "对话处理各阶段的错误数", ["stage"])
+TOOL_CALLS = Counter("bank_tool_calls", "银行功能调用次数", ["tool", "result"])
+IN_FLIGHT = Gauge(
+    "bank_chat_in_flight", "正在处理的对话请求数", ["endpoint"], multiprocess_mode="livesum"
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "bank_db_pool_connections", "数据库连接池连接数", ["state"], multiprocess_mode="livesum"
+)
+LLM_RETRIES = Counter("bank_llm_retries", "模型请求重试次数")
+LLM_BREAKER_STATE = Gauge(
+    "bank_llm_breaker_state", "模型调用熔断器状态（0 关闭 / 1 探测中 / 2 熔断）", multiprocess_mode="livemax"
+)
+CHAT_FALLBACKS = Counter("bank_chat_fallbacks", "模型不可用时改走本地处理的次数", ["result"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "bank_db_pool_wait_seconds", "从连接池获取连接的等待时间", buckets=POOL_WAIT_BUCKETS
+)
+CONVERSATION_QUEUE_ROWS = Gauge(
+    "bank_conversation_queue_rows", "等待异步写入的对话消息数", multiprocess_mode="livesum"
+)
+CONVERSATION_BATCH_ROWS = Histogram(
+    "bank_conversation_batch_rows", "每次批量写入的对话消息数", buckets=BATCH_ROW_BUCKETS
+)
+
+# 预先绑定标签，热路径上不再查找子指标
+_stage_timers = {stage: CHAT_STAGE_SECONDS.labels(stage) for stage in STAGES}
+_stage_errors = {stage: CHAT_ERRORS.labels(stage) for stage in STAGES}
+
+class observe_stage:
+    """记录一个阶段的耗时；阶段内抛出异常时同时计一次该阶段的错误"""
+
+    __slots__ = ("_stage", "_start")
+
+    def __init__(self, stage: str):
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _stage_timers[self._stage].observe(time.perf_counter() - self._start)
+        if exc_type is not None:
+            _stage_errors[self._stage].inc()
+        return False
+
+class _RequestMetrics:
+    """一个接口预先绑定好标签的子指标"""
+
+    __slots__ = ("in_flight", "latency", "ok", "error")
+
+    def __init__(self, endpoint: str):
+        self.in_flight = IN_FLIGHT.labels(endpoint)
+        self.latency = CHAT_REQUEST_SECONDS.labels(endpoint)
+        self.ok = CHAT_REQUESTS.labels(endpoint, "ok")
+        self.error = CHAT_REQUESTS.labels(endpoint, "error")
+
+_request_metrics = {}
+# 连接池指标的刷新间隔（秒）
+POOL_GAUGE_INTERVAL = 1.0
+_pool_gauges_due = 0.0
+_tool_counters = {}
+
+class track_request:
+    """
+    记录一次对话请求：进行中请求数、总耗时、按结果统计的请求数
+    处理结果为错误（如返回 500）但没有抛出异常时，调用方设置 failed = True
+    """
+
+    __slots__ = ("_metrics", "_start", "failed")
+
+    def __init__(self, endpoint: str):
+        metrics = _request_metrics.get(endpoint)
+        if metrics is None:
+            metrics = _request_metrics.setdefault(endpoint, _RequestMetrics(endpoint))
+        self._metrics = metrics
+        self.failed = False
+
+    def __enter__(self):
+        self._metrics.in_flight.inc()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics = self._metrics
+        metrics.in_flight.dec()
+        metrics.latency.observe(time.perf_counter() - self._start)
+        if exc_type is not None or self.failed:
+            metrics.error.inc()
+        else:
+            metrics.ok.inc()
+        # 多 worker 部署时抓取请求只落在其中一个 worker，各 worker 在请求结束时定期写入自己的连接池状态
+        if time.monotonic() >= _pool_gauges_due:
+            update_pool_gauges()
+        return False
+
+def record_tool_call(tool: str, success: bool):
+    key = (tool, success)
+    counter = _tool_counters.get(key)
+    if counter is None:
+        counter = _tool_counters.setdefault(key, TOOL_CALLS.labels(tool, "success" if success else "error"))
+    counter.inc()
+
+def update_pool_gauges():
+    """把本 worker 的连接池状态写入指标（多进程模式下各 worker 的值相加）"""
+    global _pool_gauges_due
+    from backend.database import get_pool_stats
+
+    _pool_gauges_due = time.monotonic() + POOL_GAUGE_INTERVAL
+    stats = get_pool_stats()
+    for state in ("size", "checked_in", "checked_out", "overflow"):
+        if state in stats:
+            DB_POOL_CONNECTIONS.labels(state).set(stats[state])
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成 Prometheus 文本格式的指标"""
+    update_pool_gauges()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
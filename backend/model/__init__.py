@@ -2,7 +2,12 @@
 from backend.model.account import Account
 from backend.model.transaction import Transaction
 from backend.model.conversation import Conversation
+from backend.model.conversation_summary import ConversationSummary
+from backend.model.id_sequence import IdSequence
+from backend.model.account_daily_stat import AccountDailyStat
+from backend.model.account_monthly_stat import AccountMonthlyStat
 from backend.model.base import Base
 
-__all__ = ['Account', 'Transaction', 'Conversation', 'Base']
+__all__ = ['Account', 'Transaction', 'Conversation', 'ConversationSummary', 'IdSequence', 'AccountDailyStat',
+           'AccountMonthlyStat', 'Base']
 
@@ -1,5 +1,5 @@
 """账户模型"""
-from sqlalchemy import Column, String, Float, Integer, DateTime
+from sqlalchemy import Column, String, Float, Integer, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.model.base import Base
@@ -17,6 +17,11 @@ class Account(Base):
     created_at = Column(DateTime, default=datetime.now, comment='创建时间')
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
     
+    # 按账户类型筛选并按名称分页使用的索引
+    __table_args__ = (
+        Index('idx_type_name', 'account_type', 'name'),
+    )
+    
     # 关系
     transactions = relationship('Transaction', foreign_keys='Transaction.account_id', back_populates='account', cascade='all, delete-orphan')
     
@@ -0,0 +1,16 @@
+"""账户每日交易汇总模型"""
+from sqlalchemy import Column, Integer, Float, Date, ForeignKey
+from backend.model.base import Base
+
+class AccountDailyStat(Base):
+    """账户每日交易汇总表，转账时与交易记录在同一事务中累加"""
+    __tablename__ = 'account_daily_stats'
+    
+    account_id = Column(Integer, ForeignKey('accounts.id'), primary_key=True, comment='账户ID')
+    day = Column(Date, primary_key=True, comment='日期')
+    txn_count = Column(Integer, nullable=False, default=0, comment='交易笔数')
+    inflow = Column(Float, nullable=False, default=0.0, comment='转入金额')
+    outflow = Column(Float, nullable=False, default=0.0, comment='转出金额')
+    
+    def __repr__(self):
+        return f"<AccountDailyStat(account_id={self.account_id}, day={self.day}, count={self.txn_count})>"
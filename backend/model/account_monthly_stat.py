@@ -0,0 +1,16 @@
+"""账户每月交易汇总模型"""
+from sqlalchemy import Column, Integer, Float, Date, ForeignKey
+from backend.model.base import Base
+
+class AccountMonthlyStat(Base):
+    """账户每月交易汇总表，跨月的时间范围按整月读取，不必逐日累加"""
+    __tablename__ = 'account_monthly_stats'
+    
+    account_id = Column(Integer, ForeignKey('accounts.id'), primary_key=True, comment='账户ID')
+    month = Column(Date, primary_key=True, comment='月份（当月第一天）')
+    txn_count = Column(Integer, nullable=False, default=0, comment='交易笔数')
+    inflow = Column(Float, nullable=False, default=0.0, comment='转入金额')
+    outflow = Column(Float, nullable=False, default=0.0, comment='转出金额')
+    
+    def __repr__(self):
+        return f"<AccountMonthlyStat(account_id={self.account_id}, month={self.month}, count={self.txn_count})>"
@@ -0,0 +1,18 @@
+"""对话摘要模型"""
+from sqlalchemy import Column, String, Text, Integer, DateTime
+from datetime import datetime
+from backend.model.base import Base
+
+class ConversationSummary(Base):
+    """较早对话的滚动摘要表"""
+    __tablename__ = 'conversation_summaries'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(50), nullable=False, unique=True, comment='会话ID')
+    summary = Column(Text, nullable=False, comment='摘要内容')
+    anchor = Column(String(40), nullable=False, comment='最后一条已折叠消息的摘要哈希')
+    folded_messages = Column(Integer, nullable=False, default=0, comment='累计折叠的消息条数')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
+    
+    def __repr__(self):
+        return f"<ConversationSummary(session_id='{self.session_id}', folded={self.folded_messages})>"
@@ -0,0 +1,13 @@
+"""序列号模型"""
+from sqlalchemy import Column, String, BigInteger
+from backend.model.base import Base
+
+class IdSequence(Base):
+    """序列号表，用于按号段分配交易编号"""
+    __tablename__ = 'id_sequences'
+    
+    name = Column(String(50), primary_key=True, comment='序列名称')
+    next_value = Column(BigInteger, nullable=False, comment='下一个未分配的值')
+    
+    def __repr__(self):
+        return f"<IdSequence(name='{self.name}', next_value={self.next_value})>"
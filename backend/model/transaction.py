@@ -1,5 +1,5 @@
 """交易记录模型"""
-from sqlalchemy import Column, String, Float, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Float, Integer, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.model.base import Base
@@ -17,6 +17,11 @@ class Transaction(Base):
     description = Column(String(200), nullable=True, comment='交易描述')
     created_at = Column(DateTime, default=datetime.now, comment='创建时间')
     
+    # 按账户分页查询交易记录使用的索引
+    __table_args__ = (
+        Index('idx_account_created', 'account_id', 'created_at'),
+    )
+    
     # 关系
     account = relationship('Account', foreign_keys=[account_id], back_populates='transactions')
     target_account = relationship('Account', foreign_keys=[target_account_id], viewonly=True)
@@ -0,0 +1,229 @@
+"""账户信息缓存"""
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from backend.config import Config
+import re
+import threading
+import time
+
+class AccountMeta(NamedTuple):
+    """账户的静态信息（不含余额）"""
+    id: int
+    name: str
+    account_no: str
+    account_type: str
+    credit_limit: float
+
+class AccountCache:
+    """
+    按账户名称缓存账户静态信息（LRU + TTL）
+    余额随时变化，不进入缓存，始终从数据库读取；不存在的名称也不缓存，
+    其他 worker 新建的账户下次查询即可看到。
+    每次失效都会递增版本号，失效前开始的数据库查询结果不再写入缓存，避免旧数据覆盖失效
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, AccountMeta]]" = OrderedDict()
+        self._names_by_id: Dict[int, str] = {}
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _lookup(self, name: str) -> Optional[AccountMeta]:
+        entry = self._entries.get(name)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(name)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(name)
+        self.hits += 1
+        return entry[1]
+
+    def _remove(self, name: str):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._names_by_id.pop(entry[1].id, None)
+
+    def get_many(self, names: Iterable[str]) -> Dict[str, AccountMeta]:
+        """按名称读取，只返回命中的账户"""
+        with self._lock:
+            result = {}
+            for name in names:
+                meta = self._lookup(name)
+                if meta is not None:
+                    result[name] = meta
+            return result
+
+    def get_many_by_id(self, account_ids: Iterable[int]) -> Dict[int, AccountMeta]:
+        """按账户 ID 读取，只返回命中的账户"""
+        with self._lock:
+            result = {}
+            for account_id in account_ids:
+                name = self._names_by_id.get(account_id)
+                meta = self._lookup(name) if name is not None else None
+                if meta is None:
+                    if name is None:
+                        self.misses += 1
+                    continue
+                result[account_id] = meta
+            return result
+
+    def put_many(self, metas: List[AccountMeta], version: int):
+        """
+        写入从数据库加载的账户信息
+        version 为开始查询前读取的版本号，期间发生过失效则丢弃
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != self.version:
+                self.stale_writes += 1
+                return
+            expires = time.monotonic() + self.ttl
+            for meta in metas:
+                self._remove(meta.name)
+                self._entries[meta.name] = (expires, meta)
+                self._names_by_id[meta.id] = meta.name
+            while len(self._entries) > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._names_by_id.pop(evicted.id, None)
+
+    def invalidate(self, name: Optional[str] = None):
+        """使指定账户（不指定时为全部账户）的缓存失效"""
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            if name is None:
+                self._entries.clear()
+                self._names_by_id.clear()
+            else:
+                self._remove(name)
+
+    def get_stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "accounts": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "stale_writes": self.stale_writes,
+            }
+
+account_cache = AccountCache(
+    max_size=Config.ACCOUNT_CACHE_SIZE,
+    ttl=Config.ACCOUNT_CACHE_TTL,
+)
+
+# 一次检查最多查询的候选片段数，超出时按提到了账户处理（调用方不缓存）
+MAX_NAME_CANDIDATES = 5000
+# 每条 IN 查询包含的候选片段数
+NAME_LOOKUP_CHUNK = 500
+
+# 账户名称由字母、数字、汉字组成，候选片段只在这些字符的连续段内截取
+_NAME_RUN = re.compile(r'\w+')
+
+class AccountNameIndex:
+    """
+    判断一段文本是否提到了某个账户
+    只查询文本中可能是账户名称的片段（连续的字母、数字、汉字中不超过 max_length 个字符的子串），
+    每批用一条 WHERE name IN (...) 查询，不加载整张账户表；查询结果（存在或不存在）按 LRU + TTL 缓存。
+    本进程新建的账户立即可见，其他 worker 新建的账户最迟 TTL 秒后可见
+    """
+
+    def __init__(self, max_size: int, ttl: float, max_length: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, bool]]" = OrderedDict()
+        self.checks = 0
+        self.lookups = 0
+        self.oversized = 0
+
+    def _candidates(self, texts: Iterable[str]) -> List[str]:
+        candidates = {}
+        for text in texts:
+            for run in _NAME_RUN.findall(text or ""):
+                for start in range(len(run)):
+                    for end in range(start + 1, min(start + self.max_length, len(run)) + 1):
+                        candidates[run[start:end]] = None
+        return list(candidates)
+
+    def mentions(self, texts: Iterable[str], lookup: Callable[[List[str]], Iterable[str]]) -> bool:
+        """
+        文本中是否出现任一账户名称
+        lookup 接收一批候选片段，返回其中实际存在的账户名称
+        """
+        candidates = self._candidates(texts)
+        with self._lock:
+            self.checks += 1
+            if len(candidates) > MAX_NAME_CANDIDATES:
+                self.oversized += 1
+                return True
+            unknown = []
+            now = time.monotonic()
+            for candidate in candidates:
+                entry = self._entries.get(candidate)
+                if entry is None or entry[0] < now:
+                    unknown.append(candidate)
+                    continue
+                self._entries.move_to_end(candidate)
+                if entry[1]:
+                    return True
+
+        for offset in range(0, len(unknown), NAME_LOOKUP_CHUNK):
+            chunk = unknown[offset:offset + NAME_LOOKUP_CHUNK]
+            found = {name.lower() for name in lookup(chunk)}
+            with self._lock:
+                self.lookups += 1
+                self._remember((candidate, candidate.lower() in found) for candidate in chunk)
+            if found:
+                return True
+        return False
+
+    def _remember(self, results: Iterable[Tuple[str, bool]]):
+        if self.max_size <= 0:
+            return
+        expires = time.monotonic() + self.ttl
+        for candidate, exists in results:
+            self._entries[candidate] = (expires, exists)
+            self._entries.move_to_end(candidate)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def add(self, name: str):
+        """加入本进程新建的账户"""
+        with self._lock:
+            self._remember([(name, True)])
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "checks": self.checks,
+                "lookups": self.lookups,
+                "oversized": self.oversized,
+            }
+
+account_name_index = AccountNameIndex(
+    max_size=Config.ACCOUNT_NAME_CACHE_SIZE,
+    ttl=Config.ACCOUNT_CACHE_TTL,
+    max_length=Config.ACCOUNT_NAME_MAX_LENGTH,
+)
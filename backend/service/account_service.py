@@ -1,13 +1,58 @@
 """账户服务"""
-from typing import Optional, List
-from sqlalchemy.orm import Session
+from typing import Optional, List, Iterable, Iterator, Set, Tuple, Dict
+from sqlalchemy import update, insert, case, select, and_, or_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, aliased, joinedload
+from backend.config import Config
 from backend.model.account import Account
 from backend.model.transaction import Transaction
+from backend.service.account_cache import AccountMeta, account_cache, account_name_index
+from backend.service.id_generator import transaction_id_generator
+from backend.service.rollup_service import RollupService
 from datetime import datetime
+import base64
+import math
+import random
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 批量转账中单条 CASE 更新包含的账户数
+BATCH_UPDATE_CHUNK = 500
+
+# MySQL 死锁、锁等待超时的错误码
+RETRYABLE_MYSQL_ERRORS = (1205, 1213)
+
+def is_retryable_error(error: DBAPIError) -> bool:
+    """判断数据库错误是否为可重试的锁冲突"""
+    orig = getattr(error, "orig", None)
+    if orig is not None and orig.args and orig.args[0] in RETRYABLE_MYSQL_ERRORS:
+        return True
+    message = str(orig or error).lower()
+    return "deadlock" in message or "database is locked" in message or "serializ" in message
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """把分页位置编码为不透明的游标字符串"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("无效的分页游标") from e
+
+class ConcurrentBalanceChange(Exception):
+    """批量转账校验后账户余额被其他事务修改"""
+    
+    def __init__(self, account_id: int):
+        super().__init__(f"账户 {account_id} 余额已变化")
+        self.account_id = account_id
+
 class AccountService:
     """账户业务逻辑"""
     
@@ -22,10 +67,102 @@ class AccountService:
         """根据ID获取账户"""
         return self.db.query(Account).filter(Account.id == account_id).first()
     
+    def get_account_meta(self, name: str) -> Optional[AccountMeta]:
+        """根据名称获取账户静态信息（走缓存，不含余额）"""
+        return self.get_account_metas([name]).get(name)
+    
+    def get_account_metas(self, names: Iterable[str]) -> Dict[str, AccountMeta]:
+        """批量获取账户静态信息，未命中缓存的名称合并为一次查询"""
+        names = set(names)
+        result = account_cache.get_many(names)
+        missing = names - result.keys()
+        if missing:
+            version = account_cache.version
+            metas = self._load_metas(Account.name.in_(missing))
+            account_cache.put_many(metas, version)
+            result.update((meta.name, meta) for meta in metas)
+        return result
+    
+    def get_account_metas_by_id(self, account_ids: Iterable[int]) -> Dict[int, AccountMeta]:
+        """按账户 ID 批量获取账户静态信息"""
+        account_ids = set(account_ids)
+        result = account_cache.get_many_by_id(account_ids)
+        missing = account_ids - result.keys()
+        if missing:
+            version = account_cache.version
+            metas = self._load_metas(Account.id.in_(missing))
+            account_cache.put_many(metas, version)
+            result.update((meta.id, meta) for meta in metas)
+        return result
+    
+    def _load_metas(self, condition) -> List[AccountMeta]:
+        rows = self.db.query(
+            Account.id, Account.name, Account.account_no, Account.account_type, Account.credit_limit
+        ).filter(condition).all()
+        return [AccountMeta(*row) for row in rows]
+    
+    def get_balance(self, account_id: int) -> Optional[float]:
+        """读取账户当前余额（不经过缓存）"""
+        return self.db.query(Account.balance).filter(Account.id == account_id).scalar()
+    
+    def get_existing_names(self, names: Iterable[str]) -> Set[str]:
+        """返回给定名称中实际存在的账户名称"""
+        return set(self.get_account_metas(names))
+    
+    def mentions_account(self, texts: Iterable[str]) -> bool:
+        """文本中是否提到了任一账户名称"""
+        return account_name_index.mentions(texts, self._find_names)
+    
+    def _find_names(self, candidates: List[str]) -> List[str]:
+        """候选片段中实际存在的账户名称（一条走唯一索引的 IN 查询）"""
+        return self.db.execute(select(Account.name).where(Account.name.in_(candidates))).scalars().all()
+    
     def get_all_accounts(self) -> List[Account]:
-        """获取所有账户"""
+        """获取所有账户（会把整张表加载到内存，大表请使用 get_account_page / iter_accounts）"""
         return self.db.query(Account).all()
     
+    def _account_listing(self, account_type: Optional[str], name_prefix: Optional[str]):
+        """账户列表查询：只取展示需要的列，按名称排序"""
+        stmt = select(Account.id, Account.name, Account.account_no, Account.account_type, Account.balance)
+        if account_type:
+            stmt = stmt.where(Account.account_type == account_type)
+        if name_prefix:
+            stmt = stmt.where(Account.name.startswith(name_prefix, autoescape=True))
+        return stmt.order_by(Account.name)
+    
+    def get_account_page(self, account_type: Optional[str] = None, name_prefix: Optional[str] = None,
+                         limit: int = 20, after: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        按名称顺序分页获取账户
+        after 为上一页最后一个账户名称，按名称定位下一页，不使用 OFFSET
+        返回: (账户列表, 下一页的 after)，没有更多账户时为 None
+        """
+        stmt = self._account_listing(account_type, name_prefix)
+        if after:
+            stmt = stmt.where(Account.name > after)
+        
+        # 多取一条用于判断是否还有下一页
+        rows = self.db.execute(stmt.limit(limit + 1)).all()
+        accounts = [row._asdict() for row in rows[:limit]]
+        next_after = accounts[-1]["name"] if len(rows) > limit else None
+        return accounts, next_after
+    
+    def iter_accounts(self, account_type: Optional[str] = None, name_prefix: Optional[str] = None,
+                      batch_size: Optional[int] = None) -> Iterator[Dict]:
+        """
+        逐行遍历账户，用于导出
+        使用服务端游标分批读取，内存占用与表大小无关
+        """
+        result = self.db.execute(
+            self._account_listing(account_type, name_prefix)
+            .execution_options(yield_per=batch_size or Config.ACCOUNT_STREAM_BATCH)
+        )
+        try:
+            for row in result:
+                yield row._asdict()
+        finally:
+            result.close()
+    
     def create_account(self, name: str, account_no: str, account_type: str, 
                       balance: float = 0.0, credit_limit: float = 0.0) -> Account:
         """创建账户"""
@@ -39,15 +176,21 @@ class AccountService:
         self.db.add(account)
         self.db.commit()
         self.db.refresh(account)
+        account_cache.invalidate(name)
+        account_name_index.add(name)
         return account
     
     def update_balance(self, account_id: int, amount: float) -> bool:
         """更新账户余额"""
-        account = self.get_account_by_id(account_id)
-        if not account:
+        updated = self.db.execute(
+            update(Account)
+            .where(Account.id == account_id)
+            .values(balance=Account.balance + amount, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            self.db.rollback()
             return False
-        account.balance += amount
-        account.updated_at = datetime.now()
         self.db.commit()
         return True
     
@@ -56,71 +199,276 @@ class AccountService:
         执行转账
         返回: (是否成功, 错误信息, 交易编号)
         """
-        from_account = self.get_account_by_id(from_account_id)
-        to_account = self.get_account_by_id(to_account_id)
-        
-        if not from_account:
-            return False, f"转出账户不存在", None
-        if not to_account:
-            return False, f"转入账户不存在", None
         if from_account_id == to_account_id:
             return False, "不能向自己转账", None
         if amount <= 0:
             return False, "转账金额必须大于0", None
-        if from_account.balance < amount:
-            return False, f"余额不足。当前余额：¥{from_account.balance:,.2f}元，转账金额：¥{amount:,.2f}元", None
+        
+        names = {
+            account_id: meta.name
+            for account_id, meta in self.get_account_metas_by_id([from_account_id, to_account_id]).items()
+        }
+        if from_account_id not in names:
+            return False, f"转出账户不存在", None
+        if to_account_id not in names:
+            return False, f"转入账户不存在", None
+        
+        # 在事务外生成交易编号，缩短持锁时间
+        transaction_id = self._generate_transaction_id()
+        
+        def attempt():
+            if not self._apply_transfer(from_account_id, to_account_id, amount, transaction_id, names):
+                self.db.rollback()
+                balance = self.get_balance(from_account_id)
+                return False, f"余额不足。当前余额：¥{balance:,.2f}元，转账金额：¥{amount:,.2f}元", None
+            self.db.commit()
+            return True, "", transaction_id
         
         try:
-            # 更新余额
-            from_account.balance -= amount
-            to_account.balance += amount
-            from_account.updated_at = datetime.now()
-            to_account.updated_at = datetime.now()
-            
-            # 生成交易编号
-            transaction_id = self._generate_transaction_id()
+            return self._run_with_retries(attempt)
+        except Exception as e:
+            logger.error(f"转账失败: {str(e)}")
+            return False, f"转账失败：{str(e)}", None
+    
+    def _run_with_retries(self, operation):
+        """
+        执行一个数据库事务，遇到死锁、锁等待超时时回滚并按指数退避加随机抖动重试
+        其他异常回滚后直接抛出
+        """
+        for attempt in range(Config.TRANSFER_MAX_RETRIES + 1):
+            try:
+                return operation()
+            except DBAPIError as e:
+                self.db.rollback()
+                if not is_retryable_error(e) or attempt == Config.TRANSFER_MAX_RETRIES:
+                    raise
+                delay = Config.TRANSFER_RETRY_BASE_DELAY * (2 ** attempt)
+                logger.warning(f"转账遇到锁冲突，{delay:.3f}s 后第 {attempt + 1} 次重试: {str(e.orig)}")
+                time.sleep(delay * random.uniform(0.5, 1.5))
+            except Exception:
+                self.db.rollback()
+                raise
+    
+    def _apply_transfer(self, from_account_id: int, to_account_id: int, amount: float,
+                        transaction_id: str, names: dict) -> bool:
+        """
+        在当前事务中更新余额、写入交易记录并累加交易汇总，余额不足时返回 False
+        余额用带条件的原子 UPDATE 修改：扣款条件 balance >= amount 由数据库在行锁内判断，
+        不会出现先读后写的丢失更新；两行按账户 ID 顺序加锁，并发转账不会互相死锁
+        """
+        now = datetime.now()
+        for account_id in sorted([from_account_id, to_account_id]):
+            if account_id == from_account_id:
+                updated = self.db.execute(
+                    update(Account)
+                    .where(Account.id == from_account_id, Account.balance >= amount)
+                    .values(balance=Account.balance - amount, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not updated:
+                    return False
+            else:
+                self.db.execute(
+                    update(Account)
+                    .where(Account.id == to_account_id)
+                    .values(balance=Account.balance + amount, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+        
+        rows = [
+            {
+                "transaction_id": f"{transaction_id}_FROM",
+                "account_id": from_account_id,
+                "transaction_type": "转出",
+                "amount": amount,
+                "target_account_id": to_account_id,
+                "description": f"转账给{names[to_account_id]}",
+                "created_at": now
+            },
+            {
+                "transaction_id": f"{transaction_id}_TO",
+                "account_id": to_account_id,
+                "transaction_type": "转入",
+                "amount": amount,
+                "target_account_id": from_account_id,
+                "description": f"收到{names[from_account_id]}转账",
+                "created_at": now
+            }
+        ]
+        self.db.execute(insert(Transaction), rows)
+        # 日汇总、月汇总与交易记录在同一事务中更新
+        RollupService(self.db).record(rows)
+        return True
+    
+    def batch_transfer(self, items: List[Tuple[str, str, float]]) -> List[Dict]:
+        """
+        在一个事务中执行多笔转账
+        items: [(转出账户名, 转入账户名, 金额), ...]
+        逐笔在内存中校验（后面的转账能看到前面转账后的余额），成功的转账合并为每个账户一次余额更新，
+        交易记录批量插入；返回每一笔的结果
+        """
+        names = {name for from_name, to_name, _ in items for name in (from_name, to_name)}
+        
+        def attempt():
+            # 按 ID 顺序锁定涉及的全部账户（MySQL 行锁；sqlite 由下面带条件的 UPDATE 兜底）
+            rows = self.db.query(Account.id, Account.name, Account.balance)\
+                .filter(Account.name.in_(names))\
+                .order_by(Account.id)\
+                .with_for_update()\
+                .all()
+            accounts = {row.name: row for row in rows}
+            balances = {row.id: row.balance for row in rows}
+            deltas: Dict[int, float] = {}
+            results = []
+            transfers = []
             
-            # 创建交易记录（转出）
-            from_transaction = Transaction(
-                transaction_id=f"{transaction_id}_FROM",
-                account_id=from_account_id,
-                transaction_type="转出",
-                amount=amount,
-                target_account_id=to_account_id,
-                description=f"转账给{to_account.name}"
-            )
+            for index, (from_name, to_name, amount) in enumerate(items):
+                result = {"index": index, "from_name": from_name, "to_name": to_name,
+                          "amount": amount, "success": False, "transaction_id": None, "error": ""}
+                results.append(result)
+                from_account = accounts.get(from_name)
+                to_account = accounts.get(to_name)
+                if not from_account:
+                    result["error"] = f"转出账户「{from_name}」不存在"
+                elif not to_account:
+                    result["error"] = f"转入账户「{to_name}」不存在"
+                elif from_name == to_name:
+                    result["error"] = "不能向自己转账"
+                elif isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+                    result["error"] = "金额格式不正确"
+                elif amount <= 0:
+                    result["error"] = "转账金额必须大于0"
+                elif balances[from_account.id] < amount:
+                    result["error"] = f"余额不足。当前余额：¥{balances[from_account.id]:,.2f}元，转账金额：¥{amount:,.2f}元"
+                else:
+                    balances[from_account.id] -= amount
+                    balances[to_account.id] += amount
+                    deltas[from_account.id] = deltas.get(from_account.id, 0.0) - amount
+                    deltas[to_account.id] = deltas.get(to_account.id, 0.0) + amount
+                    transfers.append((result, from_account, to_account, amount))
             
-            # 创建交易记录（转入）
-            to_transaction = Transaction(
-                transaction_id=f"{transaction_id}_TO",
-                account_id=to_account_id,
-                transaction_type="转入",
-                amount=amount,
-                target_account_id=from_account_id,
-                description=f"收到{from_account.name}转账"
-            )
+            if not transfers:
+                self.db.rollback()
+                return results
             
-            self.db.add(from_transaction)
-            self.db.add(to_transaction)
-            self.db.commit()
+            # 先生成交易编号再修改余额：号段分配使用独立连接，sqlite 下不能在持有写锁时申请
+            for result, _, _, _ in transfers:
+                result["transaction_id"] = self._generate_transaction_id()
             
-            return True, "", transaction_id
+            now = datetime.now()
+            # 扣款账户逐个带条件更新；入账账户合并为一条 CASE 更新，语句数不随收款人数增长
+            debits = sorted(account_id for account_id, delta in deltas.items() if delta < 0)
+            credits = sorted(account_id for account_id, delta in deltas.items() if delta > 0)
+            for account_id in debits:
+                updated = self.db.execute(
+                    update(Account)
+                    .where(Account.id == account_id, Account.balance >= -deltas[account_id])
+                    .values(balance=Account.balance + deltas[account_id], updated_at=now)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not updated:
+                    # 读取余额后被其他事务扣款，整批重新校验
+                    raise ConcurrentBalanceChange(account_id)
+            for offset in range(0, len(credits), BATCH_UPDATE_CHUNK):
+                chunk = credits[offset:offset + BATCH_UPDATE_CHUNK]
+                self.db.execute(
+                    update(Account)
+                    .where(Account.id.in_(chunk))
+                    .values(
+                        balance=Account.balance + case({account_id: deltas[account_id] for account_id in chunk}, value=Account.id),
+                        updated_at=now
+                    )
+                    .execution_options(synchronize_session=False)
+                )
             
-        except Exception as e:
-            self.db.rollback()
-            logger.error(f"转账失败: {str(e)}")
-            return False, f"转账失败：{str(e)}", None
+            rows = []
+            for result, from_account, to_account, amount in transfers:
+                transaction_id = result["transaction_id"]
+                rows.append({
+                    "transaction_id": f"{transaction_id}_FROM",
+                    "account_id": from_account.id,
+                    "transaction_type": "转出",
+                    "amount": amount,
+                    "target_account_id": to_account.id,
+                    "description": f"转账给{to_account.name}",
+                    "created_at": now
+                })
+                rows.append({
+                    "transaction_id": f"{transaction_id}_TO",
+                    "account_id": to_account.id,
+                    "transaction_type": "转入",
+                    "amount": amount,
+                    "target_account_id": from_account.id,
+                    "description": f"收到{from_account.name}转账",
+                    "created_at": now
+                })
+            self.db.execute(insert(Transaction), rows)
+            RollupService(self.db).record(rows)
+            self.db.commit()
+            for result, _, _, _ in transfers:
+                result["success"] = True
+            return results
+        
+        for _ in range(Config.TRANSFER_MAX_RETRIES + 1):
+            try:
+                return self._run_with_retries(attempt)
+            except ConcurrentBalanceChange as e:
+                logger.warning(f"批量转账期间账户 {e.account_id} 余额被修改，重新校验")
+        raise RuntimeError("批量转账期间账户余额持续变化，请稍后重试")
     
     def get_transactions(self, account_id: int, limit: int = 10) -> List[Transaction]:
-        """获取账户交易记录"""
+        """获取账户交易记录（对方账户随查询一起加载）"""
         return self.db.query(Transaction)\
+            .options(joinedload(Transaction.target_account))\
             .filter(Transaction.account_id == account_id)\
-            .order_by(Transaction.created_at.desc())\
+            .order_by(Transaction.created_at.desc(), Transaction.id.desc())\
             .limit(limit)\
             .all()
     
+    def get_transaction_page(self, account_id: int, limit: int = 10,
+                             cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        按时间倒序分页获取交易记录
+        对方账户名称通过 LEFT JOIN 在同一条语句中取出；翻页按 (created_at, id) 定位，
+        走 (account_id, created_at) 索引，不使用 OFFSET
+        返回: (交易列表, 下一页游标)，没有更多记录时游标为 None
+        """
+        target = aliased(Account)
+        stmt = select(
+            Transaction.id,
+            Transaction.transaction_id,
+            Transaction.transaction_type,
+            Transaction.amount,
+            Transaction.description,
+            Transaction.created_at,
+            target.name.label("target_name"),
+        ).outerjoin(target, target.id == Transaction.target_account_id)\
+            .where(Transaction.account_id == account_id)
+        
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            stmt = stmt.where(or_(
+                Transaction.created_at < created_at,
+                and_(Transaction.created_at == created_at, Transaction.id < row_id),
+            ))
+        
+        # 多取一条用于判断是否还有下一页
+        rows = self.db.execute(
+            stmt.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit + 1)
+        ).all()
+        next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+        
+        transactions = [{
+            'id': row.transaction_id,
+            'type': row.transaction_type,
+            'amount': row.amount,
+            'timestamp': row.created_at.strftime("%Y-%m-%d %H:%M:%S") if row.created_at else None,
+            'target': row.target_name,
+            'description': row.description
+        } for row in rows[:limit]]
+        return transactions, next_cursor
+    
     def _generate_transaction_id(self) -> str:
         """生成交易编号"""
-        count = self.db.query(Transaction).count()
-        return f"TXN{1000 + count + 1}"
+        return transaction_id_generator.next_id(self.db)
 
@@ -1,83 +1,408 @@
 """AI 服务"""
-from openai import OpenAI
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Iterator, AsyncIterator, Callable, NamedTuple, Optional, Union
 from backend.config import Config
-import re
+from backend.llm_client import llm_clients
+from backend.service.banking_service import banking_tools
+from backend.metrics import LLM_RETRIES
+from backend.service.llm_metrics import LLMCall
+from backend.service.llm_resilience import Deadline, LLMUnavailable, is_transient, llm_breaker, next_retry
+from backend.service.response_cache import response_cache
+from backend.service.tool_registry import ToolCall, parse_arguments
+import asyncio
+import hashlib
+import json
 import logging
+import time
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
-class AIService:
-    """AI 相关业务逻辑"""
-    
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=Config.DEEPSEEK_API_KEY,
-            base_url=Config.DEEPSEEK_BASE_URL
+def build_system_prompt(native_tools: bool) -> str:
+    """根据工具注册表生成系统提示词"""
+    if native_tools:
+        operations = (
+            "你可以调用提供的工具办理以下业务；问题涉及多个账户时，在一次回复中同时发起多个工具调用：\n\n"
+            + "\n".join(f"{index}. {spec.title}：{spec.name}" for index, spec in enumerate(banking_tools, 1))
         )
-        self.model = Config.DEEPSEEK_MODEL
-    
-    def get_system_prompt(self) -> str:
-        """获取系统提示词"""
-        return """你是一个专业的银行智能助手，名字叫"小银"。你能够帮助用户处理各种银行业务。
-
-你可以执行以下操作（使用CALL:函数名(参数)格式调用）：
+    else:
+        operations = (
+            "你可以执行以下操作（使用CALL:函数名(参数)格式调用，问题涉及多个账户时每行写一条调用）：\n\n"
+            + banking_tools.prompt_lines()
+        )
+    return f"""你是一个专业的银行智能助手，名字叫"小银"。你能够帮助用户处理各种银行业务。
 
-1. 查询余额：CALL:get_balance(name="账户名")
-2. 查询账户信息：CALL:get_account_info(name="账户名")
-3. 转账：CALL:transfer_money(from_name="转出账户", to_name="转入账户", amount=金额)
-4. 查询交易记录：CALL:get_transaction_history(name="账户名", limit=数量)
-5. 列出所有账户：CALL:list_accounts()
+{operations}
 
 重要规则：
 - 当用户询问余额、账户信息、转账、交易记录时，必须使用对应的函数调用
+- 询问一段时间内转入、转出了多少时使用收支汇总，不要查询交易记录后自己累加
 - 转账金额必须是数字，不能包含其他字符
 - 如果用户没有明确指定账户名，可以友好地询问
 - 对于理财建议、金融知识等咨询类问题，直接回答，不需要调用函数
 - 回复要友好、专业、清晰，使用适当的emoji让回复更生动
 - 执行操作后，要清晰地展示结果
 - 记住之前的对话内容，能够理解上下文和指代关系"""
+
+# 检查文本是否提到账户名称，回复缓存据此决定能否写入
+AccountGuard = Callable[[List[str]], bool]
+
+# 系统提示词在进程内保持不变，始终作为第一条消息逐字节相同地发送，以便命中提供方的前缀缓存
+SYSTEM_PROMPT = build_system_prompt(Config.LLM_NATIVE_TOOLS)
+_TOOLS_JSON = json.dumps(banking_tools.schemas(), ensure_ascii=False, sort_keys=True).encode("utf-8")
+
+class AIReply(NamedTuple):
+    """模型回复：文本内容和原生工具调用"""
+    content: str
+    tool_calls: List[ToolCall]
+
+def _to_reply(message) -> AIReply:
+    tool_calls = [
+        ToolCall(call.function.name, parse_arguments(call.function.arguments))
+        for call in (message.tool_calls or [])
+    ]
+    return AIReply(message.content or "", tool_calls)
+
+class ToolCallAccumulator:
+    """拼接流式响应中分段到达的工具调用"""
+
+    def __init__(self):
+        self._calls: Dict[int, List[str]] = {}
+
+    def feed(self, deltas):
+        for delta in deltas or []:
+            name, arguments = self._calls.setdefault(delta.index, ["", ""])
+            if delta.function:
+                self._calls[delta.index] = [
+                    name + (delta.function.name or ""),
+                    arguments + (delta.function.arguments or ""),
+                ]
+
+    def calls(self) -> List[ToolCall]:
+        return [
+            ToolCall(name, parse_arguments(arguments))
+            for _, (name, arguments) in sorted(self._calls.items())
+            if name
+        ]
+
+class AIService:
+    """AI 相关业务逻辑"""
+    
+    def __init__(self):
+        self.model = Config.DEEPSEEK_MODEL
+    
+    @property
+    def client(self) -> "OpenAI":
+        """同步客户端，复用进程内共享的连接池；本地路由处理的请求不会创建"""
+        return llm_clients.get_client()
+    
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """异步客户端，仅在异步模式下创建"""
+        return llm_clients.get_async_client()
+    
+    def get_system_prompt(self) -> str:
+        """获取系统提示词（进程内固定不变）"""
+        return SYSTEM_PROMPT
+    
+    def _tool_options(self) -> Dict:
+        """启用原生函数调用时附带 tools 定义"""
+        return {"tools": banking_tools.schemas()} if Config.LLM_NATIVE_TOOLS else {}
+    
+    def _prefix_hash(self, messages: List[Dict]) -> str:
+        """
+        提示词固定前缀（tools 定义 + 第一条系统消息）的哈希
+        前缀逐字节不变时提供方的前缀缓存才能命中，统计中出现多个哈希说明前缀发生了变化
+        """
+        head = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        digest = hashlib.sha1(head.encode("utf-8"))
+        if Config.LLM_NATIVE_TOOLS:
+            digest.update(_TOOLS_JSON)
+        return digest.hexdigest()[:12]
+    
+    def _record_error(self, error: Exception, record: bool = True) -> Exception:
+        """
+        把请求失败计入熔断器，返回应当抛出的异常
+        临时错误（超时、连接失败、限流、5xx）包装为 LLMUnavailable，调用方可以改走本地处理；
+        record=False 时只包装不计入
+        """
+        if is_transient(error):
+            if record:
+                llm_breaker.record_failure(error)
+            if not isinstance(error, LLMUnavailable):
+                unavailable = LLMUnavailable(f"模型服务暂时不可用：{str(error)}")
+                unavailable.__cause__ = error
+                return unavailable
+        elif record:
+            # 服务端正常响应了（如参数错误），说明服务可用
+            llm_breaker.record_success()
+        return error
     
-    def chat(self, messages: List[Dict]) -> str:
-        """调用 AI 模型进行对话"""
+    def _create(self, call: LLMCall, deadline: Deadline, background: bool = False, **kwargs):
+        """
+        发起请求：熔断时直接失败，超时不超过请求剩余时限，
+        临时错误在时限内按指数退避加随机抖动重试
+        background=True 用于摘要等后台调用：熔断器非关闭状态时直接失败，结果不计入熔断统计，
+        后台调用失败不会让对话请求被熔断
+        """
+        attempt = 0
+        while True:
+            timeout = deadline.timeout()
+            if background:
+                llm_breaker.allow_background()
+            else:
+                llm_breaker.allow()
+            try:
+                response = self.client.chat.completions.create(model=self.model, timeout=timeout, **kwargs)
+            except Exception as e:
+                delay = next_retry(attempt, e, deadline)
+                error = self._record_error(e, record=not background)
+                if delay is None:
+                    raise error
+                attempt += 1
+                call.retries = attempt
+                LLM_RETRIES.inc()
+                logger.warning(f"模型请求失败，{delay:.2f}s 后第 {attempt} 次重试: {str(e)}")
+                time.sleep(delay)
+                continue
+            if not kwargs.get("stream") and not background:
+                llm_breaker.record_success()
+            return response
+    
+    async def _acreate(self, call: LLMCall, deadline: Deadline, **kwargs):
+        attempt = 0
+        while True:
+            timeout = deadline.timeout()
+            llm_breaker.allow()
+            try:
+                response = await self.async_client.chat.completions.create(model=self.model, timeout=timeout, **kwargs)
+            except Exception as e:
+                delay = next_retry(attempt, e, deadline)
+                error = self._record_error(e)
+                if delay is None:
+                    raise error
+                attempt += 1
+                call.retries = attempt
+                LLM_RETRIES.inc()
+                logger.warning(f"模型请求失败，{delay:.2f}s 后第 {attempt} 次重试: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            if not kwargs.get("stream"):
+                llm_breaker.record_success()
+            return response
+    
+    def chat(self, messages: List[Dict], cache_guard: Optional[AccountGuard] = None,
+             deadline: Optional[Deadline] = None) -> AIReply:
+        """
+        调用 AI 模型进行对话，返回回复文本和工具调用
+        与上下文无关的通用问题先查回复缓存；cache_guard 用于确认消息和回复不涉及账户，未提供时不读写缓存；
+        deadline 为所属请求的截止时间，模型暂时不可用时抛出 LLMUnavailable
+        """
+        cache_key = response_cache.key_for(messages, self.model, cache_guard)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return AIReply(cached, [])
+        call = LLMCall("chat", self.model, self._prefix_hash(messages))
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._create(
+                call,
+                deadline or Deadline(Config.CHAT_DEADLINE),
                 messages=messages,
                 temperature=0.7,
-                max_tokens=1000
+                max_tokens=1000,
+                **self._tool_options()
             )
-            return response.choices[0].message.content
+            call.usage = response.usage
+            call.finish()
+            reply = _to_reply(response.choices[0].message)
+            if cache_key:
+                response_cache.offer(cache_key, messages[-1]["content"], reply.content,
+                                     bool(reply.tool_calls), cache_guard)
+            return reply
         except Exception as e:
+            call.finish(False, str(e))
             logger.error(f"AI 调用失败: {str(e)}")
             raise
     
-    def parse_function_call(self, ai_reply: str) -> tuple:
-        """解析AI返回的函数调用指令"""
-        if "CALL:" not in ai_reply:
-            return None, None
-        
-        # 匹配函数调用格式
-        patterns = {
-            "get_balance": r'CALL:get_balance\s*\([^)]*name\s*=\s*["\']([^"\']+)["\']',
-            "get_account_info": r'CALL:get_account_info\s*\([^)]*name\s*=\s*["\']([^"\']+)["\']',
-            "transfer_money": r'CALL:transfer_money\s*\([^)]*from_name\s*=\s*["\']([^"\']+)["\']\s*,\s*to_name\s*=\s*["\']([^"\']+)["\']\s*,\s*amount\s*=\s*([\d.]+)',
-            "get_transaction_history": r'CALL:get_transaction_history\s*\([^)]*name\s*=\s*["\']([^"\']+)["\'](?:\s*,\s*limit\s*=\s*(\d+))?',
-            "list_accounts": r'CALL:list_accounts\s*\(\)'
-        }
-        
-        for func_name, pattern in patterns.items():
-            match = re.search(pattern, ai_reply, re.IGNORECASE)
-            if match:
-                if func_name == "transfer_money":
-                    return func_name, (match.group(1), match.group(2), float(match.group(3)))
-                elif func_name == "get_transaction_history":
-                    limit = int(match.group(2)) if match.group(2) else 10
-                    return func_name, (match.group(1), limit)
-                elif func_name == "list_accounts":
-                    return func_name, ()
-                else:
-                    return func_name, (match.group(1),)
-        
-        return None, None
-
+    def summarize(self, previous_summary: str, messages: List[Dict], max_tokens: int) -> str:
+        """把较早的对话折叠进已有摘要"""
+        dialogue = "\n".join(
+            f"{'用户' if msg['role'] == 'user' else '助手'}：{msg['content']}" for msg in messages
+        )
+        prompt = (
+            "请把下面的新对话合并进已有摘要，输出更新后的摘要。\n"
+            "要求：保留账户名称、金额、交易编号、用户意图等关键事实，省略寒暄，使用简洁的中文。\n\n"
+            f"已有摘要：\n{previous_summary or '（无）'}\n\n新对话：\n{dialogue}"
+        )
+        call = LLMCall("summary", self.model)
+        try:
+            response = self._create(
+                call,
+                Deadline(Config.CHAT_DEADLINE),
+                background=True,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=max_tokens
+            )
+            call.usage = response.usage
+            call.finish()
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            call.finish(False, str(e))
+            logger.error(f"AI 摘要失败: {str(e)}")
+            raise
+    
+    def chat_stream(self, messages: List[Dict], cache_guard: Optional[AccountGuard] = None,
+                    deadline: Optional[Deadline] = None) -> Iterator[Union[str, ToolCall]]:
+        """
+        流式调用 AI 模型，逐段返回生成的文本
+        工具调用的参数分多段到达，拼接完整后在流结束时以 ToolCall 返回；
+        命中回复缓存时一次返回完整回复。超过 deadline 时中断读取并抛出 LLMUnavailable
+        """
+        cache_key = response_cache.key_for(messages, self.model, cache_guard)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        call = LLMCall("stream", self.model, self._prefix_hash(messages))
+        deadline = deadline or Deadline(Config.CHAT_DEADLINE)
+        stream = None
+        try:
+            stream = self._create(
+                call,
+                deadline,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self._tool_options()
+            )
+            tool_calls = ToolCallAccumulator()
+            content = []
+            for chunk in stream:
+                deadline.check()
+                if chunk.usage:
+                    call.usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                call.first_token()
+                delta = chunk.choices[0].delta
+                tool_calls.feed(delta.tool_calls)
+                if delta.content:
+                    content.append(delta.content)
+                    yield delta.content
+            llm_breaker.record_success()
+            call.finish()
+            calls = tool_calls.calls()
+            yield from calls
+            if cache_key:
+                response_cache.offer(cache_key, messages[-1]["content"], "".join(content), bool(calls), cache_guard)
+        except Exception as e:
+            call.finish(False, str(e))
+            logger.error(f"AI 流式调用失败: {str(e)}")
+            if stream is not None:
+                raise self._record_error(e)
+            raise
+        finally:
+            # 调用方提前停止读取时也记录本次调用，并关闭连接
+            if stream is not None:
+                stream.close()
+            if not call.finished:
+                llm_breaker.release_probe()
+            call.finish(False, "cancelled")
+    
+    async def achat(self, messages: List[Dict], cache_guard: Optional[AccountGuard] = None,
+                    deadline: Optional[Deadline] = None) -> AIReply:
+        """异步调用 AI 模型进行对话，缓存、时限规则与 chat 相同（缓存读写放到线程池中执行）"""
+        cache_key = await asyncio.to_thread(response_cache.key_for, messages, self.model, cache_guard)
+        if cache_key:
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached is not None:
+                return AIReply(cached, [])
+        call = LLMCall("chat", self.model, self._prefix_hash(messages))
+        try:
+            response = await self._acreate(
+                call,
+                deadline or Deadline(Config.CHAT_DEADLINE),
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000,
+                **self._tool_options()
+            )
+            call.usage = response.usage
+            call.finish()
+            reply = _to_reply(response.choices[0].message)
+            if cache_key:
+                await asyncio.to_thread(response_cache.offer, cache_key, messages[-1]["content"],
+                                        reply.content, bool(reply.tool_calls), cache_guard)
+            return reply
+        except Exception as e:
+            call.finish(False, str(e))
+            logger.error(f"AI 调用失败: {str(e)}")
+            raise
+    
+    async def achat_stream(self, messages: List[Dict], cache_guard: Optional[AccountGuard] = None,
+                           deadline: Optional[Deadline] = None) -> AsyncIterator[Union[str, ToolCall]]:
+        """异步流式调用 AI 模型，产出格式与 chat_stream 相同"""
+        cache_key = await asyncio.to_thread(response_cache.key_for, messages, self.model, cache_guard)
+        if cache_key:
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+        call = LLMCall("stream", self.model, self._prefix_hash(messages))
+        deadline = deadline or Deadline(Config.CHAT_DEADLINE)
+        stream = None
+        try:
+            stream = await self._acreate(
+                call,
+                deadline,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self._tool_options()
+            )
+            tool_calls = ToolCallAccumulator()
+            content = []
+            async for chunk in stream:
+                deadline.check()
+                if chunk.usage:
+                    call.usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                call.first_token()
+                delta = chunk.choices[0].delta
+                tool_calls.feed(delta.tool_calls)
+                if delta.content:
+                    content.append(delta.content)
+                    yield delta.content
+            llm_breaker.record_success()
+            call.finish()
+            calls = tool_calls.calls()
+            for tool_call in calls:
+                yield tool_call
+            if cache_key:
+                await asyncio.to_thread(response_cache.offer, cache_key, messages[-1]["content"],
+                                        "".join(content), bool(calls), cache_guard)
+        except Exception as e:
+            call.finish(False, str(e))
+            logger.error(f"AI 流式调用失败: {str(e)}")
+            if stream is not None:
+                raise self._record_error(e)
+            raise
+        finally:
+            if stream is not None:
+                await stream.close()
+            if not call.finished:
+                llm_breaker.release_probe()
+            call.finish(False, "cancelled")
+    
+    def parse_function_calls(self, ai_reply: str) -> List[ToolCall]:
+        """解析回复文本中的 CALL: 指令（未使用原生函数调用时的兼容格式），返回全部调用"""
+        return banking_tools.parse_text_calls(ai_reply or "")
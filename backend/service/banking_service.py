@@ -1,8 +1,13 @@
 """银行业务服务"""
-from typing import Optional
+from datetime import date
+from typing import Optional, List, Dict
 from sqlalchemy.orm import Session
+from backend.config import Config
 from backend.service.account_service import AccountService
+from backend.service.rollup_service import RollupService, parse_period
+from backend.service.tool_registry import ToolRegistry, tool
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -13,33 +18,43 @@ class BankingService:
         self.db = db
         self.account_service = AccountService(db)
     
+    @tool("查询余额", "查询指定账户的当前余额", {"name": "账户名"})
     def get_balance(self, name: str) -> str:
         """查询账户余额"""
-        account = self.account_service.get_account_by_name(name)
-        if not account:
+        account = self.account_service.get_account_meta(name)
+        balance = self.account_service.get_balance(account.id) if account else None
+        if balance is None:
             return f"❌ 未找到账户名为「{name}」的用户信息。"
         
-        return f"✅ 账户信息查询成功\n\n账户名称：{name}\n账户号码：{account.account_no}\n账户类型：{account.account_type}\n当前余额：¥{account.balance:,.2f}元"
+        return f"✅ 账户信息查询成功\n\n账户名称：{name}\n账户号码：{account.account_no}\n账户类型：{account.account_type}\n当前余额：¥{balance:,.2f}元"
     
+    @tool("查询账户信息", "查询指定账户的账号、类型、余额和信用额度", {"name": "账户名"})
     def get_account_info(self, name: str) -> str:
         """查询账户详细信息"""
-        account = self.account_service.get_account_by_name(name)
-        if not account:
+        account = self.account_service.get_account_meta(name)
+        balance = self.account_service.get_balance(account.id) if account else None
+        if balance is None:
             return f"❌ 未找到账户名为「{name}」的用户信息。"
         
         info = f"📋 账户详细信息\n\n"
         info += f"账户名称：{name}\n"
         info += f"账户号码：{account.account_no}\n"
         info += f"账户类型：{account.account_type}\n"
-        info += f"当前余额：¥{account.balance:,.2f}元\n"
+        info += f"当前余额：¥{balance:,.2f}元\n"
         info += f"信用额度：¥{account.credit_limit:,.2f}元\n"
-        info += f"可用额度：¥{account.credit_limit - account.balance:,.2f}元"
+        info += f"可用额度：¥{account.credit_limit - balance:,.2f}元"
         return info
     
+    @tool("转账", "从一个账户向另一个账户转账", {
+        "from_name": "转出账户",
+        "to_name": "转入账户",
+        "amount": "金额"
+    }, write=True)
     def transfer_money(self, from_name: str, to_name: str, amount: float) -> str:
         """执行转账"""
-        from_account = self.account_service.get_account_by_name(from_name)
-        to_account = self.account_service.get_account_by_name(to_name)
+        accounts = self.account_service.get_account_metas([from_name, to_name])
+        from_account = accounts.get(from_name)
+        to_account = accounts.get(to_name)
         
         if not from_account:
             return f"❌ 转账失败：转出账户「{from_name}」不存在。"
@@ -64,31 +79,55 @@ class BankingService:
         if not success:
             return f"❌ {error_msg}"
         
-        # 重新获取账户信息（余额已更新）
-        from_account = self.account_service.get_account_by_id(from_account.id)
+        # 余额已更新，重新读取
+        from_balance = self.account_service.get_balance(from_account.id)
         
         result = f"✅ 转账成功！\n\n"
         result += f"交易编号：{txn_id}\n"
         result += f"转出账户：{from_name} ({from_account.account_no})\n"
         result += f"转入账户：{to_name} ({to_account.account_no})\n"
         result += f"转账金额：¥{amt:,.2f}元\n"
-        result += f"转出账户余额：¥{from_account.balance:,.2f}元"
+        result += f"转出账户余额：¥{from_balance:,.2f}元"
         
         return result
     
+    def batch_transfer(self, transfers: List[Dict]) -> Dict:
+        """
+        批量转账（工资发放、清算等）
+        transfers: [{"from_name": ..., "to_name": ..., "amount": ...}, ...]
+        返回每一笔的执行结果及汇总；amount 必须是有限的 JSON 数字，布尔值、字符串、NaN 按格式错误处理
+        """
+        items = []
+        for transfer in transfers:
+            amount = transfer.get("amount")
+            if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+                amount = None
+            else:
+                amount = float(amount)
+            items.append((transfer.get("from_name"), transfer.get("to_name"), amount))
+        
+        results = self.account_service.batch_transfer(items)
+        succeeded = sum(1 for result in results if result["success"])
+        return {
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded
+        }
+    
+    @tool("查询交易记录", "查询指定账户最近的交易记录", {"name": "账户名", "limit": "数量"})
     def get_transaction_history(self, name: str, limit: int = 10) -> str:
         """查询交易记录"""
-        account = self.account_service.get_account_by_name(name)
+        account = self.account_service.get_account_meta(name)
         if not account:
             return f"❌ 未找到账户名为「{name}」的用户信息。"
         
-        transactions = self.account_service.get_transactions(account.id, limit)
+        limit = max(1, min(int(limit), Config.TRANSACTION_PAGE_MAX))
+        transactions, _ = self.account_service.get_transaction_page(account.id, limit)
         if not transactions:
             return f"📝 {name} 的账户暂无交易记录。"
         
         result = f"📝 {name} 的交易记录（最近{len(transactions)}条）\n\n"
-        for txn in transactions:
-            txn_dict = txn.to_dict()
+        for txn_dict in transactions:
             txn_type_emoji = "📤" if txn_dict["type"] == "转出" else "📥"
             result += f"{txn_type_emoji} {txn_dict['timestamp']}\n"
             result += f"   交易编号：{txn_dict['id']}\n"
@@ -102,18 +141,79 @@ class BankingService:
         
         return result
     
-    def list_accounts(self) -> str:
-        """列出所有账户"""
-        accounts = self.account_service.get_all_accounts()
+    @tool("收支汇总", "统计指定账户一段时间内的转入、转出金额和交易笔数（如这个月转出了多少），比逐条查询交易记录更快更准", {
+        "name": "账户名",
+        "period": "时间范围：今天、昨天、本周、上周、本月、上月、今年、近N天、2026、2026-10 或 2026-10-01~2026-10-15，默认本月"
+    })
+    def get_period_summary(self, name: str, period: str = "本月") -> str:
+        """按时间范围汇总收支（读取日汇总、月汇总，不扫描交易记录）"""
+        account = self.account_service.get_account_meta(name)
+        if not account:
+            return f"❌ 未找到账户名为「{name}」的用户信息。"
+        
+        try:
+            start, end, label = parse_period(period, date.today())
+        except ValueError as e:
+            return f"❌ {str(e)}"
+        
+        summary = RollupService(self.db).get_summary(account.id, start, end)
+        period_range = f"{start}" if start == end else f"{start} 至 {end}"
+        result = f"📊 {name} {label}的收支汇总（{period_range}）\n\n" if label else f"📊 {name} {period_range} 的收支汇总\n\n"
+        if not summary["count"]:
+            return result + "该时间范围内暂无交易。"
+        result += f"交易笔数：{summary['count']}笔\n"
+        result += f"转入金额：¥{summary['inflow']:,.2f}元\n"
+        result += f"转出金额：¥{summary['outflow']:,.2f}元\n"
+        result += f"净流入：¥{summary['net']:,.2f}元"
+        return result
+    
+    def get_transaction_page(self, name: str, limit: int = 20, cursor: Optional[str] = None) -> Optional[Dict]:
+        """
+        分页查询交易记录
+        返回: {"transactions": [...], "next_cursor": ...}，账户不存在时返回 None
+        """
+        account = self.account_service.get_account_meta(name)
+        if not account:
+            return None
+        
+        limit = max(1, min(limit, Config.TRANSACTION_PAGE_MAX))
+        transactions, next_cursor = self.account_service.get_transaction_page(account.id, limit, cursor)
+        return {"transactions": transactions, "next_cursor": next_cursor}
+    
+    @tool("列出账户", "列出系统中的账户（最多一页），可按账户类型或名称前缀筛选", {
+        "account_type": "账户类型",
+        "name_prefix": "名称前缀"
+    })
+    def list_accounts(self, account_type: Optional[str] = None, name_prefix: Optional[str] = None) -> str:
+        """列出账户（最多一页，可按账户类型和名称前缀筛选）"""
+        accounts, next_after = self.account_service.get_account_page(
+            account_type, name_prefix, Config.ACCOUNT_PAGE_SIZE
+        )
         if not accounts:
+            if account_type or name_prefix:
+                return "❌ 没有符合条件的账户。"
             return "❌ 系统中暂无账户信息。"
         
         result = "📋 系统账户列表\n\n"
         for account in accounts:
-            result += f"账户名称：{account.name}\n"
-            result += f"  账户号码：{account.account_no}\n"
-            result += f"  账户类型：{account.account_type}\n"
-            result += f"  当前余额：¥{account.balance:,.2f}元\n\n"
+            result += f"账户名称：{account['name']}\n"
+            result += f"  账户号码：{account['account_no']}\n"
+            result += f"  账户类型：{account['account_type']}\n"
+            result += f"  当前余额：¥{account['balance']:,.2f}元\n\n"
         
+        if next_after:
+            result += f"⚠️ 账户较多，仅显示前 {len(accounts)} 个，可按账户类型或名称前缀缩小范围。"
         return result
+    
+    def get_account_page(self, account_type: Optional[str] = None, name_prefix: Optional[str] = None,
+                         limit: Optional[int] = None, after: Optional[str] = None) -> Dict:
+        """
+        分页查询账户列表
+        返回: {"accounts": [...], "next_after": ...}
+        """
+        limit = max(1, min(limit or Config.ACCOUNT_PAGE_SIZE, Config.ACCOUNT_PAGE_MAX))
+        accounts, next_after = self.account_service.get_account_page(account_type, name_prefix, limit, after)
+        return {"accounts": accounts, "next_after": next_after}
 
+# 可供模型调用的银行功能
+banking_tools = ToolRegistry.from_class(BankingService)
@@ -0,0 +1,418 @@
+"""聊天流程服务"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, AsyncIterator, Optional, Tuple
+from sqlalchemy.orm import Session
+from backend.config import Config
+from backend.database import ROUTE_KEY, SessionLocal, bind_route_key, replica_reads
+from backend.metrics import CHAT_FALLBACKS, observe_stage, record_tool_call, track_request
+from backend.service.ai_service import AIService
+from backend.service.banking_service import BankingService, banking_tools
+from backend.service.context_service import ContextBuilder
+from backend.service.conversation_service import ConversationService
+from backend.service.intent_router import IntentRouter
+from backend.service.llm_resilience import Deadline, LLMUnavailable
+from backend.service.tool_registry import ToolCall
+import asyncio
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 函数调用指令前缀（不区分大小写）
+CALL_MARKER = "CALL:"
+
+# 模型不可用且本地无法处理时的回复
+UNAVAILABLE_REPLY = (
+    "⚠️ 智能助手暂时繁忙，请稍后重试。\n"
+    "您也可以直接输入明确的指令，例如：张三的余额、张三的交易记录、从张三转100元给李四。"
+)
+
+def _safe_emit_length(text: str) -> int:
+    """
+    计算可以安全推送给前端的文本长度
+    末尾如果可能是 CALL: 的开头（如 "CA"），先暂缓推送，等后续内容到达再判断
+    """
+    for size in range(min(len(CALL_MARKER) - 1, len(text)), 0, -1):
+        if text[-size:].upper() == CALL_MARKER[:size]:
+            return len(text) - size
+    return len(text)
+
+class StreamFilter:
+    """
+    过滤模型的流式输出
+    普通文本按增量推送；一旦检测到 CALL: 指令就停止推送原始文本
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.sent = 0
+        self.is_call = False
+
+    def feed(self, delta: str) -> List[Tuple[str, Dict]]:
+        """输入一段模型输出，返回需要推送的事件"""
+        self.text += delta
+        if self.is_call:
+            return []
+        if CALL_MARKER.lower() in self.text.lower():
+            self.is_call = True
+            return [("tool", {})]
+        safe = _safe_emit_length(self.text)
+        if safe > self.sent:
+            event = ("delta", {"text": self.text[self.sent:safe]})
+            self.sent = safe
+            return [event]
+        return []
+
+    def mark_call(self) -> List[Tuple[str, Dict]]:
+        """模型发起了原生工具调用"""
+        if self.is_call:
+            return []
+        self.is_call = True
+        return [("tool", {})]
+
+    def flush(self) -> List[Tuple[str, Dict]]:
+        """模型输出结束，推送剩余被暂缓的文本"""
+        if self.is_call or self.sent >= len(self.text):
+            return []
+        event = ("delta", {"text": self.text[self.sent:]})
+        self.sent = len(self.text)
+        return [event]
+
+class ToolPool:
+    """并行执行只读工具调用的进程级线程池"""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def map(self, func, items: List) -> List:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=Config.TOOL_MAX_PARALLEL, thread_name_prefix="tool")
+        return list(self._executor.map(func, items))
+
+tool_pool = ToolPool()
+
+if hasattr(os, "register_at_fork"):
+    # 线程不会随 fork 复制，子进程需要新的线程池
+    os.register_at_fork(after_in_child=tool_pool._reset)
+
+class ChatService:
+    """聊天流程编排：组装上下文、调用模型、执行银行功能、保存对话历史"""
+
+    def __init__(self, db: Session, ai_service: AIService = None):
+        self.db = db
+        self.ai_service = ai_service or AIService()
+        self.banking_service = BankingService(db)
+        self.conversation_service = ConversationService(db)
+        self.context_builder = ContextBuilder(db, self.ai_service)
+
+    def build_messages(self, session_id: str, user_input: str) -> List[Dict]:
+        """按 token 预算构建发送给模型的消息列表"""
+        with observe_stage("history_load"):
+            history_messages = self.conversation_service.get_messages(session_id)
+        return self.context_builder.build(
+            session_id,
+            self.ai_service.get_system_prompt(),
+            history_messages,
+            user_input
+        )
+
+    def mentions_account(self, texts: List[str]) -> bool:
+        """回复缓存写入前检查消息和回复是否提到账户名称"""
+        return self.banking_service.account_service.mentions_account(texts)
+
+    def execute_function_call(self, func_name: str, func_args) -> str:
+        """执行银行功能"""
+        if func_name not in banking_tools:
+            raise ValueError(f"未知的操作：{func_name}")
+        banking_method = getattr(self.banking_service, func_name)
+        if func_args:
+            if isinstance(func_args, tuple):
+                return banking_method(*func_args)
+            return banking_method(func_args)
+        return banking_method()
+
+    def run_function(self, func_name: str, func_args) -> Tuple[str, int]:
+        """
+        执行银行功能
+        返回: (回复内容, HTTP 状态码)
+        """
+        with observe_stage("banking"):
+            try:
+                with replica_reads(self.db, enabled=not banking_tools.is_write(func_name)):
+                    reply = self.execute_function_call(func_name, func_args)
+                record_tool_call(func_name, True)
+                return reply, 200
+            except Exception as e:
+                record_tool_call(func_name, False)
+                logger.error(f"执行函数 {func_name} 失败: {str(e)}", exc_info=True)
+                return f"❌ 执行操作时出错：{str(e)}", 500
+
+    def _invoke_tool(self, banking_service: BankingService, call: ToolCall) -> Tuple[str, bool]:
+        """执行一次工具调用，返回: (结果文本, 是否成功)"""
+        try:
+            kwargs = banking_tools.bind(call.name, call.arguments)
+            # 只读工具在只读副本上查询，写操作（如转账）走主库
+            with replica_reads(banking_service.db, enabled=not banking_tools.is_write(call.name)):
+                reply = getattr(banking_service, call.name)(**kwargs)
+            record_tool_call(call.name, True)
+            return reply, True
+        except Exception as e:
+            record_tool_call(call.name if call.name in banking_tools else "unknown", False)
+            logger.error(f"执行函数 {call.name} 失败: {str(e)}", exc_info=True)
+            return f"❌ 执行操作时出错：{str(e)}", False
+
+    def _invoke_isolated(self, call: ToolCall) -> Tuple[str, bool]:
+        """在独立的数据库会话中执行只读工具调用（Session 不能跨线程共享）"""
+        db = SessionLocal.session_factory()
+        bind_route_key(db, self.db.info.get(ROUTE_KEY))
+        try:
+            return self._invoke_tool(BankingService(db), call)
+        finally:
+            db.close()
+
+    def _run_reads(self, calls: List[ToolCall], indexes: List[int], results: List):
+        if len(indexes) > 1 and Config.TOOL_MAX_PARALLEL > 1:
+            outputs = tool_pool.map(self._invoke_isolated, [calls[index] for index in indexes])
+        else:
+            outputs = [self._invoke_tool(self.banking_service, calls[index]) for index in indexes]
+        for index, output in zip(indexes, outputs):
+            results[index] = output
+
+    def run_tool_calls(self, calls: List[ToolCall]) -> Tuple[str, int]:
+        """
+        执行一次模型回复中的全部工具调用，结果按调用顺序拼接
+        相邻的只读调用并行执行；写操作（如转账）作为分隔点按顺序单独执行，
+        之前的查询不会看到之后的转账，之后的查询一定能看到之前的转账
+        返回: (回复内容, HTTP 状态码)，全部失败时状态码为 500
+        """
+        if len(calls) > Config.TOOL_MAX_CALLS:
+            logger.warning(f"工具调用过多（{len(calls)}），只执行前 {Config.TOOL_MAX_CALLS} 个")
+            calls = calls[:Config.TOOL_MAX_CALLS]
+
+        results = [None] * len(calls)
+        reads = []
+        with observe_stage("banking"):
+            for index, call in enumerate(calls):
+                if banking_tools.is_write(call.name):
+                    self._run_reads(calls, reads, results)
+                    reads = []
+                    results[index] = self._invoke_tool(self.banking_service, call)
+                else:
+                    reads.append(index)
+            self._run_reads(calls, reads, results)
+
+        reply = "\n\n".join(text for text, _ in results)
+        status = 200 if any(ok for _, ok in results) else 500
+        return reply, status
+
+    def save_turn(self, session_id: str, user_input: str, reply: str):
+        """在一个事务中保存本轮的用户消息和助手回复"""
+        with observe_stage("persist"):
+            self.conversation_service.add_turn(session_id, [
+                ("user", user_input),
+                ("assistant", reply)
+            ])
+        try:
+            history_messages = self.conversation_service.get_messages(session_id)
+            self.context_builder.schedule_refresh(session_id, history_messages)
+        except Exception as e:
+            logger.warning(f"检查对话摘要失败: {str(e)}")
+
+    def route_locally(self, session_id: str, user_input: str) -> Optional[Tuple[str, int]]:
+        """
+        明确的银行指令由本地意图路由直接执行，不调用模型
+        返回: (回复内容, HTTP 状态码)，未命中时返回 None
+        """
+        if not Config.INTENT_ROUTER_ENABLED:
+            return None
+        func_name, func_args = IntentRouter(self.db).route(user_input)
+        if not func_name:
+            return None
+        reply, status = self.run_function(func_name, func_args)
+        self.save_turn(session_id, user_input, reply)
+        return reply, status
+
+    def fallback(self, session_id: str, user_input: str, error: LLMUnavailable) -> Tuple[str, int]:
+        """
+        模型暂时不可用（熔断、超时、重试后仍失败）时改走本地意图路由，使用较低的置信度阈值；
+        降低阈值后 "张三给李四转100元？不对，先别转" 这类消息也会命中转账规则，因此只执行只读功能，
+        转账等写操作只在正常阈值下由 route_locally 执行；仍无法处理时返回提示，状态码 503
+        """
+        logger.warning(f"模型不可用，改走本地处理: {str(error)}")
+        if Config.INTENT_ROUTER_ENABLED:
+            router = IntentRouter(self.db, threshold=Config.INTENT_FALLBACK_THRESHOLD, read_only=True)
+            func_name, func_args = router.route(user_input)
+            if func_name:
+                CHAT_FALLBACKS.labels("routed").inc()
+                reply, status = self.run_function(func_name, func_args)
+                self.save_turn(session_id, user_input, reply)
+                return reply, status
+        CHAT_FALLBACKS.labels("unavailable").inc()
+        return UNAVAILABLE_REPLY, 503
+
+    def handle_reply(self, session_id: str, user_input: str, ai_reply: str,
+                     tool_calls: List[ToolCall] = None) -> Tuple[str, int]:
+        """
+        处理模型回复：必要时执行函数调用，并保存本轮对话
+        优先使用原生工具调用，没有时解析文本中的 CALL: 指令
+        返回: (回复内容, HTTP 状态码)
+        """
+        calls = tool_calls
+        if not calls:
+            with observe_stage("parse"):
+                calls = self.ai_service.parse_function_calls(ai_reply)
+
+        if calls:
+            reply, status = self.run_tool_calls(calls)
+            if tool_calls and ai_reply.strip():
+                # 原生工具调用附带的说明文字放在结果之前
+                reply = f"{ai_reply.strip()}\n\n{reply}"
+        else:
+            reply, status = ai_reply, 200
+
+        self.save_turn(session_id, user_input, reply)
+        return reply, status
+
+    def chat(self, session_id: str, user_input: str, deadline: Optional[Deadline] = None) -> Tuple[str, int]:
+        """
+        完整处理一轮对话
+        deadline 为请求的截止时间（默认 CHAT_DEADLINE），模型调用的超时和重试都不会超过它
+        """
+        with track_request("chat") as request:
+            reply, status = self._chat(session_id, user_input, deadline)
+            request.failed = status != 200
+            return reply, status
+
+    def _chat(self, session_id: str, user_input: str, deadline: Optional[Deadline]) -> Tuple[str, int]:
+        bind_route_key(self.db, session_id)
+        routed = self.route_locally(session_id, user_input)
+        if routed:
+            return routed
+
+        api_messages = self.build_messages(session_id, user_input)
+        try:
+            with observe_stage("llm_call"):
+                ai_reply = self.ai_service.chat(api_messages, self.mentions_account, deadline)
+        except LLMUnavailable as e:
+            return self.fallback(session_id, user_input, e)
+        return self.handle_reply(session_id, user_input, ai_reply.content, ai_reply.tool_calls)
+
+    def chat_stream(self, session_id: str, user_input: str,
+                    deadline: Optional[Deadline] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        流式处理一轮对话
+        依次产出 ("delta", {"text": ...}) 事件，最后产出 ("done", {"reply": ...})；
+        一旦检测到 CALL: 指令就停止推送原始文本，改为执行函数并在 done 中返回结果；
+        模型中途不可用时 done 中返回本地处理的结果，替换已推送的内容
+        """
+        with track_request("chat_stream") as request:
+            for event, data in self._chat_stream(session_id, user_input, deadline):
+                if event == "done":
+                    request.failed = data["error"]
+                yield event, data
+
+    def _chat_stream(self, session_id: str, user_input: str,
+                     deadline: Optional[Deadline]) -> Iterator[Tuple[str, Dict]]:
+        bind_route_key(self.db, session_id)
+        routed = self.route_locally(session_id, user_input)
+        if routed:
+            reply, status = routed
+            yield "done", {"reply": reply, "error": status != 200}
+            return
+
+        api_messages = self.build_messages(session_id, user_input)
+
+        stream_filter = StreamFilter()
+        tool_calls = []
+        try:
+            with observe_stage("llm_call"):
+                for delta in self.ai_service.chat_stream(api_messages, self.mentions_account, deadline):
+                    if isinstance(delta, ToolCall):
+                        tool_calls.append(delta)
+                        yield from stream_filter.mark_call()
+                        continue
+                    yield from stream_filter.feed(delta)
+        except LLMUnavailable as e:
+            reply, status = self.fallback(session_id, user_input, e)
+            yield "done", {"reply": reply, "error": status != 200}
+            return
+        yield from stream_filter.flush()
+
+        reply, status = self.handle_reply(session_id, user_input, stream_filter.text, tool_calls)
+        yield "done", {"reply": reply, "error": status != 200}
+
+    async def achat(self, session_id: str, user_input: str, deadline: Optional[Deadline] = None) -> Tuple[str, int]:
+        """
+        异步处理一轮对话
+        等待模型时不占用线程，数据库操作放到线程池中执行
+        """
+        with track_request("chat") as request:
+            reply, status = await self._achat(session_id, user_input, deadline)
+            request.failed = status != 200
+            return reply, status
+
+    async def _achat(self, session_id: str, user_input: str, deadline: Optional[Deadline]) -> Tuple[str, int]:
+        bind_route_key(self.db, session_id)
+        routed = await asyncio.to_thread(self.route_locally, session_id, user_input)
+        if routed:
+            return routed
+
+        api_messages = await asyncio.to_thread(self.build_messages, session_id, user_input)
+        try:
+            with observe_stage("llm_call"):
+                ai_reply = await self.ai_service.achat(api_messages, self.mentions_account, deadline)
+        except LLMUnavailable as e:
+            return await asyncio.to_thread(self.fallback, session_id, user_input, e)
+        return await asyncio.to_thread(
+            self.handle_reply, session_id, user_input, ai_reply.content, ai_reply.tool_calls
+        )
+
+    async def achat_stream(self, session_id: str, user_input: str,
+                           deadline: Optional[Deadline] = None) -> AsyncIterator[Tuple[str, Dict]]:
+        """异步流式处理一轮对话，事件格式与 chat_stream 相同"""
+        with track_request("chat_stream") as request:
+            async for event, data in self._achat_stream(session_id, user_input, deadline):
+                if event == "done":
+                    request.failed = data["error"]
+                yield event, data
+
+    async def _achat_stream(self, session_id: str, user_input: str,
+                            deadline: Optional[Deadline]) -> AsyncIterator[Tuple[str, Dict]]:
+        bind_route_key(self.db, session_id)
+        routed = await asyncio.to_thread(self.route_locally, session_id, user_input)
+        if routed:
+            reply, status = routed
+            yield "done", {"reply": reply, "error": status != 200}
+            return
+
+        api_messages = await asyncio.to_thread(self.build_messages, session_id, user_input)
+
+        stream_filter = StreamFilter()
+        tool_calls = []
+        try:
+            with observe_stage("llm_call"):
+                async for delta in self.ai_service.achat_stream(api_messages, self.mentions_account, deadline):
+                    if isinstance(delta, ToolCall):
+                        tool_calls.append(delta)
+                        events = stream_filter.mark_call()
+                    else:
+                        events = stream_filter.feed(delta)
+                    for event in events:
+                        yield event
+        except LLMUnavailable as e:
+            reply, status = await asyncio.to_thread(self.fallback, session_id, user_input, e)
+            yield "done", {"reply": reply, "error": status != 200}
+            return
+        for event in stream_filter.flush():
+            yield event
+
+        reply, status = await asyncio.to_thread(
+            self.handle_reply, session_id, user_input, stream_filter.text, tool_calls
+        )
+        yield "done", {"reply": reply, "error": status != 200}
@@ -0,0 +1,289 @@
+"""上下文窗口服务"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from backend.config import Config
+from backend.model.conversation_summary import ConversationSummary
+from backend.service.history_cache import summary_cache
+import hashlib
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_CJK = re.compile(r'[　-〿一-鿿＀-￯]')
+
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 折叠旧对话时为下一条用户消息预留的 token 数
+INPUT_RESERVE_TOKENS = 200
+# 锚点覆盖的消息条数，多条一起哈希以区分内容重复的消息
+ANCHOR_MESSAGES = 3
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+    按 DeepSeek 的经验值：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+def message_tokens(message: Dict) -> int:
+    """估算单条消息的 token 数"""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+def anchor_digest(history: List[Dict], index: int) -> str:
+    """
+    以 history[index] 结尾的若干条消息的哈希，用于定位摘要已经覆盖到哪一条
+    单条消息可能重复（如两次相同的余额查询），因此连同前几条一起计算
+    """
+    digest = hashlib.sha1()
+    for message in history[max(index - ANCHOR_MESSAGES + 1, 0):index + 1]:
+        digest.update(f"{message['role']}\n{message['content']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """从开头截断文本，保留最新的内容"""
+    while text and estimate_tokens(text) > max_tokens:
+        text = text[len(text) // 10 + 1:]
+    return text
+
+def extractive_summary(summary: str, messages: List[Dict]) -> str:
+    """不调用模型，把每条消息的开头追加到已有摘要后面"""
+    lines = [f"{'用户' if msg['role'] == 'user' else '助手'}：{msg['content'][:60]}" for msg in messages]
+    return truncate_to_tokens("\n".join(filter(None, [summary] + lines)), Config.SUMMARY_MAX_TOKENS)
+
+class ContextStats:
+    """提示词 token 统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.full_history_tokens = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def record_request(self, prompt_tokens: int, full_history_tokens: int):
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.full_history_tokens += full_history_tokens
+
+    def record_summary(self, success: bool):
+        with self._lock:
+            if success:
+                self.summaries += 1
+            else:
+                self.summary_failures += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else 0.0,
+                "avg_full_history_tokens": round(self.full_history_tokens / self.requests, 1) if self.requests else 0.0,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+            }
+
+context_stats = ContextStats()
+
+class SummaryWorker:
+    """在后台线程中更新滚动摘要，不阻塞请求"""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = set()
+
+    def submit(self, session_id: str):
+        """安排一次摘要更新；同一会话已在排队时忽略"""
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+            self._executor.submit(self._run, session_id)
+
+    def _run(self, session_id: str):
+        from backend.database import SessionLocal
+        from backend.service.ai_service import AIService
+        from backend.service.conversation_service import ConversationService
+
+        db = SessionLocal.session_factory()
+        try:
+            builder = ContextBuilder(db, AIService())
+            history = ConversationService(db).get_messages(session_id)
+            builder.refresh_summary(session_id, history)
+        except Exception as e:
+            logger.error(f"更新对话摘要失败: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+            with self._lock:
+                self._pending.discard(session_id)
+
+summary_worker = SummaryWorker()
+
+if hasattr(os, "register_at_fork"):
+    # 线程不会随 fork 复制，子进程需要新的线程池
+    os.register_at_fork(after_in_child=summary_worker._reset)
+
+class ContextBuilder:
+    """
+    按 token 预算组装发送给模型的消息
+    最近的对话原样保留，窗口外的旧对话折叠为按会话保存的滚动摘要
+    """
+
+    def __init__(self, db: Session, ai_service):
+        self.db = db
+        self.ai_service = ai_service
+
+    def get_summary(self, session_id: str) -> Tuple[str, str]:
+        """读取会话摘要，返回 (摘要, 锚点哈希)"""
+        cached = summary_cache.get(session_id)
+        if cached is None:
+            row = self.db.query(ConversationSummary.summary, ConversationSummary.anchor)\
+                .filter(ConversationSummary.session_id == session_id)\
+                .first()
+            cached = [(row.summary, row.anchor)] if row else [("", "")]
+            summary_cache.put(session_id, cached)
+        return cached[0]
+
+    def _window_start(self, history: List[Dict], budget: int) -> int:
+        """计算原样保留的最近消息的起始下标"""
+        used = 0
+        start = len(history)
+        min_start = max(len(history) - Config.CONTEXT_MIN_RECENT_MESSAGES, 0)
+        while start > 0:
+            cost = message_tokens(history[start - 1])
+            if start <= min_start and used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        # 窗口从用户消息开始，避免保留半轮对话
+        while start < min_start and history[start]["role"] != "user":
+            start += 1
+        return start
+
+    def _unfolded(self, history: List[Dict], start: int, anchor: str) -> List[Dict]:
+        """
+        窗口之外、尚未折叠进摘要的旧消息
+        从前往后查找锚点：即使误匹配到更早的位置也只会重复折叠，不会漏掉消息；
+        锚点已被历史裁剪删除时，剩余的旧消息都未折叠
+        """
+        anchor_index = -1
+        if anchor:
+            for index in range(len(history)):
+                if anchor_digest(history, index) == anchor:
+                    anchor_index = index
+                    break
+        return history[anchor_index + 1:start]
+
+    def _window(self, history: List[Dict], summary: str, anchor: str) -> Tuple[int, List[Dict]]:
+        """
+        返回原样保留的最近消息的起始下标，以及窗口之外尚未折叠进摘要的消息
+        build 和 refresh_summary 共用同一个划分，后台折叠的正好是 build 没有原样发送的消息
+        """
+        start = self._window_start(history, self._window_budget(bool(summary)))
+        if not summary and start > 0 and Config.CONTEXT_SUMMARY_ENABLED:
+            # 已有消息滑出窗口，按即将生成的摘要预留位置
+            start = self._window_start(history, self._window_budget(True))
+        return start, self._unfolded(history, start, anchor)
+
+    def _window_budget(self, with_summary: bool) -> int:
+        """窗口可用的 token 数：预算减去系统提示词、摘要上限和本轮用户消息的预留"""
+        system_tokens = estimate_tokens(self.ai_service.get_system_prompt()) + MESSAGE_OVERHEAD_TOKENS
+        summary_tokens = Config.SUMMARY_MAX_TOKENS + MESSAGE_OVERHEAD_TOKENS if with_summary else 0
+        return Config.CONTEXT_TOKEN_BUDGET - system_tokens - summary_tokens - INPUT_RESERVE_TOKENS
+
+    def build(self, session_id: str, system_prompt: str, history: List[Dict], user_input: str) -> List[Dict]:
+        """
+        组装消息列表：系统提示词、摘要、最近对话、本轮用户消息
+        滑出窗口但后台还没有折叠进摘要的消息，先以抽取式摘要附在摘要之后，不会从提示词中消失
+        """
+        system_message = {"role": "system", "content": system_prompt}
+        user_message = {"role": "user", "content": user_input}
+
+        if Config.CONTEXT_SUMMARY_ENABLED:
+            summary, anchor = self.get_summary(session_id)
+            start, unfolded = self._window(history, summary, anchor)
+        else:
+            summary, unfolded = "", []
+            start = self._window_start(history, self._window_budget(False))
+        context = extractive_summary(summary, unfolded) if unfolded else summary
+        summary_message = {"role": "system", "content": f"以下是与用户较早对话的摘要：\n{context}"} if context else None
+
+        messages = [system_message]
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(history[start:])
+        messages.append(user_message)
+
+        prompt_tokens = sum(message_tokens(msg) for msg in messages)
+        # 对照值：不做窗口裁剪时发送完整历史所需的 token 数
+        full_history_tokens = message_tokens(system_message) + message_tokens(user_message)\
+            + sum(message_tokens(msg) for msg in history)
+        context_stats.record_request(prompt_tokens, full_history_tokens)
+        logger.info(
+            f"上下文: 提示词约 {prompt_tokens} tokens（完整历史约 {full_history_tokens}），"
+            f"保留最近 {len(history) - start}/{len(history)} 条，摘要 {'有' if summary else '无'}"
+            f"{f'，{len(unfolded)} 条待折叠' if unfolded else ''}"
+        )
+
+        if unfolded:
+            summary_worker.submit(session_id)
+        return messages
+
+    def schedule_refresh(self, session_id: str, history: List[Dict]):
+        """本轮对话保存后检查是否有消息滑出窗口，有则在后台更新摘要"""
+        if not Config.CONTEXT_SUMMARY_ENABLED:
+            return
+        summary, anchor = self.get_summary(session_id)
+        _, unfolded = self._window(history, summary, anchor)
+        if unfolded:
+            summary_worker.submit(session_id)
+
+    def refresh_summary(self, session_id: str, history: List[Dict]) -> Optional[str]:
+        """把滑出窗口的新消息折叠进摘要，没有新消息时不调用模型"""
+        summary, anchor = self.get_summary(session_id)
+        start, unfolded = self._window(history, summary, anchor)
+        if not unfolded:
+            return None
+
+        try:
+            new_summary = self.ai_service.summarize(summary, unfolded, Config.SUMMARY_MAX_TOKENS)
+            context_stats.record_summary(True)
+            new_summary = truncate_to_tokens(new_summary, Config.SUMMARY_MAX_TOKENS)
+        except Exception:
+            # 模型不可用时退化为抽取式摘要（与 build 中临时附加的内容相同），保证旧对话不会直接丢失
+            context_stats.record_summary(False)
+            new_summary = extractive_summary(summary, unfolded)
+        new_anchor = anchor_digest(history, start - 1)
+
+        row = self.db.query(ConversationSummary)\
+            .filter(ConversationSummary.session_id == session_id)\
+            .first()
+        if row:
+            row.summary = new_summary
+            row.anchor = new_anchor
+            row.folded_messages += len(unfolded)
+        else:
+            self.db.add(ConversationSummary(
+                session_id=session_id,
+                summary=new_summary,
+                anchor=new_anchor,
+                folded_messages=len(unfolded)
+            ))
+        self.db.commit()
+        summary_cache.put(session_id, [(new_summary, new_anchor)])
+        logger.info(f"会话 {session_id} 摘要已更新，折叠 {len(unfolded)} 条消息")
+        return new_summary
@@ -1,8 +1,15 @@
 """对话服务"""
-from typing import List, Dict
+from collections import Counter
+from typing import List, Dict, Iterable, Optional, Tuple
+from sqlalchemy import insert, and_, or_, func, select
 from sqlalchemy.orm import Session
 from backend.model.conversation import Conversation
+from backend.model.conversation_summary import ConversationSummary
 from backend.config import Config
+from backend.database import bind_route_key, replica_reads, replica_router
+from backend.service.conversation_writer import conversation_writer
+from backend.service.history_cache import Message, history_cache, summary_cache
+from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,50 +19,186 @@ class ConversationService:
     
     def __init__(self, db: Session):
         self.db = db
+        # 本次请求写入后得到的版本，同一请求中随后读取历史时不再查询
+        self._written_versions: Dict[str, Tuple] = {}
     
     def get_messages(self, session_id: str) -> List[Dict]:
-        """获取会话的对话历史"""
-        conversations = self.db.query(Conversation)\
-            .filter(Conversation.session_id == session_id)\
-            .order_by(Conversation.created_at.asc())\
-            .limit(Config.MAX_CONVERSATION_HISTORY)\
-            .all()
+        """获取会话的对话历史（优先读取进程内缓存；启用异步写入时包含尚未落库的消息）"""
+        if conversation_writer.enabled:
+            messages = conversation_writer.read(session_id, lambda: self._load_messages(session_id))
+            messages = messages[-Config.MAX_CONVERSATION_HISTORY:]
+        else:
+            messages = self._load_messages(session_id)
         
-        return [conv.to_dict() for conv in conversations]
+        return [{'role': role, 'content': content} for role, content in messages]
+    
+    def _load_messages(self, session_id: str) -> List[Message]:
+        """
+        读取已落库的对话历史
+        命中缓存前先查询会话当前的版本（一条只走索引的聚合查询），其他 worker 写入过该会话时重新加载
+        """
+        # 只读查询开启的事务在读取后结束，调用模型期间不占用连接
+        owns_transaction = not self.db.in_transaction()
+        try:
+            # 历史在只读副本上读取；该会话刚写入过消息时走主库
+            bind_route_key(self.db, session_id)
+            with replica_reads(self.db):
+                version = None
+                if history_cache.enabled:
+                    version = self._written_versions.get(session_id) or self._versions([session_id])[session_id]
+                    messages = history_cache.get(session_id, version)
+                    if messages is not None:
+                        return messages
+                # 先读版本再读消息：两次查询之间有新消息落库时缓存的版本偏旧，下次读取会重新加载
+                since = history_cache.load_started()
+                rows = self.db.query(Conversation.role, Conversation.content)\
+                    .filter(Conversation.session_id == session_id)\
+                    .order_by(Conversation.created_at.asc(), Conversation.id.asc())\
+                    .limit(Config.MAX_CONVERSATION_HISTORY)\
+                    .all()
+        finally:
+            if owns_transaction and self.db.in_transaction():
+                self.db.rollback()
+        messages = [(row.role, row.content) for row in rows]
+        history_cache.put(session_id, messages, version, since)
+        return messages
+    
+    def _versions(self, session_ids: Iterable[str]) -> Dict[str, Tuple[int, Optional[int], Optional[int]]]:
+        """
+        会话历史的版本：(消息条数, 最小 ID, 最大 ID)
+        新消息的 ID 总是更大，清理只删除最早的消息，任一会话被写入或清理后版本都会变化
+        """
+        session_ids = list(session_ids)
+        versions = {session_id: (0, None, None) for session_id in session_ids}
+        rows = self.db.execute(
+            select(Conversation.session_id, func.count(), func.min(Conversation.id), func.max(Conversation.id))
+            .where(Conversation.session_id.in_(session_ids))
+            .group_by(Conversation.session_id)
+        )
+        for session_id, count, min_id, max_id in rows:
+            versions[session_id] = (count, min_id, max_id)
+        return versions
     
     def add_message(self, session_id: str, role: str, content: str):
         """添加消息到对话历史"""
-        conversation = Conversation(
-            session_id=session_id,
-            role=role,
-            content=content
-        )
-        self.db.add(conversation)
+        self.add_turn(session_id, [(role, content)])
+    
+    def add_turn(self, session_id: str, messages: List[Tuple[str, str]]):
+        """
+        在一个事务中保存一轮对话的多条消息
+        messages: [(角色, 内容), ...]，按时间顺序排列
+        启用异步写入时只放入写入队列；队列满且等待超时后才在本请求中同步写入
+        """
+        if not messages:
+            return
+        if conversation_writer.enabled and conversation_writer.submit(session_id, messages):
+            return
+        now = datetime.now()
+        bind_route_key(self.db, session_id)
+        # 会话在缓存中时，在同一事务中确认缓存与数据库一致后才追加；不在缓存中时不需要版本
+        cached = history_cache.version(session_id) if not conversation_writer.enabled else None
+        full = cached is not None and cached[0] + len(messages) > Config.MAX_CONVERSATION_HISTORY
+        before = self._versions([session_id])[session_id] if full else cached
+        self.db.execute(insert(Conversation), [
+            {"session_id": session_id, "role": role, "content": content, "created_at": now}
+            for role, content in messages
+        ])
         
-        # 清理旧消息，只保留最近的N条
-        try:
-            count = self.db.query(Conversation)\
-                .filter(Conversation.session_id == session_id)\
-                .count()
-            
-            if count > Config.MAX_CONVERSATION_HISTORY:
-                # 删除最旧的消息
-                oldest = self.db.query(Conversation)\
-                    .filter(Conversation.session_id == session_id)\
-                    .order_by(Conversation.created_at.asc())\
-                    .first()
-                if oldest:
-                    self.db.delete(oldest)
+        after = None
+        if cached is not None and not full:
+            # 未超出上限时不需要清理；写入后的条数和最小 ID 与缓存推算的一致，说明期间没有其他写入
+            after = self._versions([session_id])[session_id]
+            if after != (cached[0] + len(messages), cached[1] if cached[1] is not None else after[1], after[2]):
+                before = after = None
+        if after is None:
+            # 清理旧消息，只保留最近的N条
+            try:
+                self._trim_history(session_id)
+            except Exception as e:
+                logger.warning(f"清理旧消息失败: {str(e)}")
+            if full:
+                after = self._versions([session_id])[session_id]
         
-        except Exception as e:
-            logger.warning(f"清理旧消息失败: {str(e)}")
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            history_cache.invalidate(session_id)
+            raise
+        if conversation_writer.enabled:
+            # 队列中可能还有该会话更早的消息，缓存顺序无法保证，下次从数据库重新加载
+            history_cache.invalidate(session_id)
+        else:
+            history_cache.append(session_id, list(messages), before, after)
+            if after is not None:
+                self._written_versions[session_id] = after
+    
+    def write_batch(self, rows: List[Dict]) -> Dict[str, Tuple]:
+        """
+        用一条多行 INSERT 写入多个会话的消息，清理这些会话的旧消息后只提交一次（由异步写入线程调用）
+        rows: [{"session_id", "role", "content", "created_at"}, ...]，按时间顺序排列
+        返回各会话写入前后的版本 {session_id: (写入前, 写入后)}，用于同步历史缓存
+        """
+        session_ids = list(dict.fromkeys(row["session_id"] for row in rows))
+        before = self._versions(session_ids) if history_cache.enabled else {}
+        self.db.execute(insert(Conversation), rows)
+        added = Counter(row["session_id"] for row in rows)
+        for session_id in session_ids:
+            if session_id in before and before[session_id][0] + added[session_id] <= Config.MAX_CONVERSATION_HISTORY:
+                continue
+            try:
+                self._trim_history(session_id)
+            except Exception as e:
+                logger.warning(f"清理旧消息失败: {str(e)}")
+        after = self._versions(session_ids) if history_cache.enabled else {}
+        try:
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        # 异步写入线程的会话不属于任何对话，逐个记录读己之写
+        replica_router.record_write(*session_ids)
+        return {session_id: (before.get(session_id), after.get(session_id)) for session_id in session_ids}
+    
+    def _trim_history(self, session_id: str):
+        """
+        删除超出 MAX_CONVERSATION_HISTORY 的旧消息
+        沿 idx_session_created 索引找到第 N+1 新的消息，再一次性删除它及更早的消息
+        """
+        cutoff = self.db.query(Conversation.created_at, Conversation.id)\
+            .filter(Conversation.session_id == session_id)\
+            .order_by(Conversation.created_at.desc(), Conversation.id.desc())\
+            .offset(Config.MAX_CONVERSATION_HISTORY)\
+            .limit(1)\
+            .first()
+        if not cutoff:
+            return
         
-        self.db.commit()
+        self.db.query(Conversation)\
+            .filter(
+                Conversation.session_id == session_id,
+                or_(
+                    Conversation.created_at < cutoff.created_at,
+                    and_(Conversation.created_at == cutoff.created_at, Conversation.id <= cutoff.id)
+                )
+            )\
+            .delete(synchronize_session=False)
     
     def clear_conversation(self, session_id: str):
         """清除会话的对话历史"""
+        if conversation_writer.enabled and not conversation_writer.flush():
+            # 仍在队列中的消息会在清除之后写入
+            logger.warning(f"清除会话 {session_id} 前未能写完队列中的消息")
+        bind_route_key(self.db, session_id)
         self.db.query(Conversation)\
             .filter(Conversation.session_id == session_id)\
             .delete()
+        self.db.query(ConversationSummary)\
+            .filter(ConversationSummary.session_id == session_id)\
+            .delete()
         self.db.commit()
+        history_cache.invalidate(session_id)
+        history_cache.put(session_id, [], (0, None, None))
+        self._written_versions.pop(session_id, None)
+        summary_cache.invalidate(session_id)
 
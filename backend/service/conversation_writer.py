@@ -0,0 +1,256 @@
+"""对话消息异步写入（write-behind）"""
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from backend.config import Config
+from backend.metrics import CONVERSATION_BATCH_ROWS, CONVERSATION_QUEUE_ROWS
+from backend.service.history_cache import Message, history_cache
+import atexit
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 批量写入失败时的重试次数，仍然失败则丢弃该批消息
+FLUSH_MAX_RETRIES = 3
+# 读取历史期间该会话恰好有消息落库时，重新读取的次数
+READ_ATTEMPTS = 3
+
+class _Pending:
+    """一个会话尚未提交的消息"""
+
+    __slots__ = ("messages", "writes", "writing")
+
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.writes = 0  # 开始写入的批次数，读取前后不一致说明期间有消息落库
+        self.writing = False
+
+class ConversationWriter:
+    """
+    对话消息写入队列（进程内）
+    - 请求线程只把消息放入有界队列，不等待数据库；后台线程在最早的消息等待满 flush_interval 秒
+      或攒够 flush_rows 条时，把多个会话的消息用一条多行 INSERT 写入并只提交一次
+    - 队列满时请求线程最多等待 queue_timeout 秒（背压），仍然满时返回 False，由调用方同步写入；
+      该会话还有消息在队列中时为保证顺序继续排队
+    - 尚未提交的消息按会话记录，读取历史时追加在已提交的消息之后，会话总能读到自己刚写的消息
+    - 进程退出时（atexit、gunicorn worker_exit）写完队列中剩余的消息
+    """
+
+    def __init__(self, enabled: bool, flush_interval: float, flush_rows: int, max_rows: int, queue_timeout: float):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.flush_rows = max(flush_rows, 1)
+        self.max_rows = max(max_rows, self.flush_rows)
+        self.queue_timeout = queue_timeout
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._written = threading.Condition(self._lock)
+        self._queue = deque()  # (入队时间, 行数据)
+        self._pending: Dict[str, _Pending] = {}
+        self._in_flight = 0
+        self._flush_now = False
+        self._closed = False
+        self._thread = None
+        self.enqueued = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.backpressure_waits = 0
+        self.overflows = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def submit(self, session_id: str, messages: List[Message]) -> bool:
+        """
+        把一轮对话的消息放入队列
+        返回 False 表示未入队（队列持续满或已关闭），调用方应同步写入
+        """
+        now = datetime.now()
+        rows = [
+            {"session_id": session_id, "role": role, "content": content, "created_at": now}
+            for role, content in messages
+        ]
+        with self._lock:
+            if self._closed:
+                return False
+            if self._queue and len(self._queue) + len(rows) > self.max_rows:
+                self.backpressure_waits += 1
+                has_room = self._not_full.wait_for(
+                    lambda: self._closed or not self._queue or len(self._queue) + len(rows) <= self.max_rows,
+                    timeout=self.queue_timeout,
+                )
+                # 该会话还有消息在队列中时不能改为同步写入（会先于更早的消息落库），超出容量也继续排队
+                if self._closed or (not has_room and session_id not in self._pending):
+                    self.overflows += 1
+                    return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+                self._thread.start()
+            enqueued_at = time.monotonic()
+            self._queue.extend((enqueued_at, row) for row in rows)
+            self._pending.setdefault(session_id, _Pending()).messages.extend(messages)
+            self.enqueued += len(rows)
+            CONVERSATION_QUEUE_ROWS.set(len(self._queue))
+            self._not_empty.notify()
+        return True
+
+    def read(self, session_id: str, load: Callable[[], List[Message]]) -> List[Message]:
+        """
+        读取会话历史：load 读取已提交的消息（缓存或数据库），再追加尚未提交的消息
+        该会话的消息正在落库时先等待提交完成；读取期间有新的落库则重新读取，避免消息重复或遗漏
+        """
+        for _ in range(READ_ATTEMPTS):
+            with self._lock:
+                entry = self._pending.get(session_id)
+                if entry is not None and entry.writing:
+                    self._written.wait_for(lambda: not entry.writing, timeout=self.queue_timeout)
+                    # 写完后该会话可能已没有未提交的消息
+                    entry = self._pending.get(session_id)
+                if entry is not None:
+                    pending, writes = list(entry.messages), entry.writes
+            messages = load()
+            if entry is None:
+                return messages
+            with self._lock:
+                if self._pending.get(session_id) is entry and entry.writes == writes and not entry.writing:
+                    return messages + pending
+            # load 可能把落库前读到的旧历史写回了缓存
+            history_cache.invalidate(session_id)
+        logger.warning(f"会话 {session_id} 读取期间消息持续落库，返回的历史可能不完整")
+        return messages + pending
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """立即写入队列中的全部消息并等待完成，超时返回 False"""
+        with self._lock:
+            if not self._queue and not self._in_flight:
+                return True
+            self._flush_now = True
+            self._not_empty.notify()
+            return self._written.wait_for(lambda: not self._queue and not self._in_flight, timeout=timeout)
+
+    def shutdown(self, timeout: float = 10.0):
+        """停止接收新消息，写完队列中剩余的消息后结束后台线程"""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(f"对话消息未能在 {timeout:.0f}s 内写完，剩余 {len(self._queue)} 条")
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._closed:
+                    self._not_empty.wait()
+                if not self._queue:
+                    return
+                # 等到最早的消息满 flush_interval，或攒够一批、收到立即写入/关闭请求
+                while len(self._queue) < self.flush_rows and not self._flush_now and not self._closed:
+                    remaining = self._queue[0][0] + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+                batch = [self._queue.popleft()[1] for _ in range(min(len(self._queue), self.flush_rows))]
+                if not self._queue:
+                    self._flush_now = False
+                self._in_flight = len(batch)
+                sessions = dict.fromkeys(row["session_id"] for row in batch)
+                for session_id in sessions:
+                    entry = self._pending.get(session_id)
+                    if entry is not None:
+                        entry.writes += 1
+                        entry.writing = True
+                CONVERSATION_QUEUE_ROWS.set(len(self._queue))
+                self._not_full.notify_all()
+            versions = self._write(batch)
+            self._finish(batch, versions)
+
+    def _write(self, batch: List[Dict]) -> Optional[Dict[str, Tuple]]:
+        """写入一批消息，失败时按指数退避重试；返回各会话写入前后的版本，写入失败返回 None"""
+        from backend.database import SessionLocal
+        from backend.service.conversation_service import ConversationService
+
+        for attempt in range(FLUSH_MAX_RETRIES + 1):
+            db = SessionLocal.session_factory()
+            try:
+                versions = ConversationService(db).write_batch(batch)
+                CONVERSATION_BATCH_ROWS.observe(len(batch))
+                return versions
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                logger.warning(f"批量写入对话消息失败（第 {attempt + 1} 次）: {str(e)}")
+            finally:
+                db.close()
+            if attempt < FLUSH_MAX_RETRIES:
+                time.sleep(min(max(self.flush_interval, 0.05) * (2 ** attempt), 1.0))
+        logger.error(f"批量写入对话消息多次失败，丢弃 {len(batch)} 条消息")
+        return None
+
+    def _finish(self, batch: List[Dict], versions: Optional[Dict[str, Tuple]]):
+        """已提交的消息追加到历史缓存并从未提交列表中移除；写入失败（versions 为 None）时使缓存失效"""
+        written = versions is not None
+        by_session: Dict[str, List[Message]] = {}
+        for row in batch:
+            by_session.setdefault(row["session_id"], []).append((row["role"], row["content"]))
+        with self._lock:
+            for session_id, messages in by_session.items():
+                if written:
+                    history_cache.append(session_id, messages, *versions[session_id])
+                else:
+                    history_cache.invalidate(session_id)
+                entry = self._pending.get(session_id)
+                if entry is None:
+                    continue
+                del entry.messages[:len(messages)]
+                entry.writing = False
+                if not entry.messages:
+                    del self._pending[session_id]
+            if written:
+                self.batches += 1
+                self.rows_written += len(batch)
+            else:
+                self.dropped += len(batch)
+            self._in_flight = 0
+            self._written.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "queued": len(self._queue),
+                "in_flight": self._in_flight,
+                "pending_sessions": len(self._pending),
+                "enqueued": self.enqueued,
+                "batches": self.batches,
+                "rows_written": self.rows_written,
+                "avg_batch_rows": round(self.rows_written / self.batches, 1) if self.batches else 0.0,
+                "backpressure_waits": self.backpressure_waits,
+                "overflows": self.overflows,
+                "failures": self.failures,
+                "dropped": self.dropped,
+            }
+
+conversation_writer = ConversationWriter(
+    enabled=Config.CONVERSATION_WRITE_BEHIND,
+    flush_interval=Config.CONVERSATION_FLUSH_INTERVAL_MS / 1000,
+    flush_rows=Config.CONVERSATION_FLUSH_ROWS,
+    max_rows=Config.CONVERSATION_QUEUE_SIZE,
+    queue_timeout=Config.CONVERSATION_QUEUE_TIMEOUT,
+)
+
+# 进程正常退出时写完队列
+atexit.register(conversation_writer.shutdown)
+
+if hasattr(os, "register_at_fork"):
+    # 线程不会随 fork 复制，子进程使用新的空队列（父进程中未写入的消息由父进程负责）
+    os.register_at_fork(after_in_child=conversation_writer._reset)
@@ -0,0 +1,159 @@
+"""对话历史缓存"""
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+from backend.config import Config
+import threading
+import time
+
+# 缓存中的消息：(角色, 内容)
+Message = Tuple[str, str]
+
+class HistoryCache:
+    """
+    按 session_id 缓存最近的对话历史（LRU + TTL）
+    只保存 (角色, 内容) 元组，不持有 ORM 对象；写入由 ConversationService 先落库再同步到缓存
+    每项可带一个版本（由调用方从数据库读取，如会话消息的条数和 ID 范围），读取时版本不一致视为未命中，
+    其他 worker 写入的消息因此不会被本进程的旧缓存遮住
+    """
+
+    def __init__(self, max_sessions: int, ttl: float, max_messages: int):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Hashable], List[Message]]]" = OrderedDict()
+        # 最近写入过的会话 -> 写入序号，用于丢弃加载期间会话被写入的结果
+        self._writes: "OrderedDict[str, int]" = OrderedDict()
+        self._write_seq = 0
+        self._forgotten_seq = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.skipped_puts = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sessions > 0
+
+    def get(self, session_id: str, version: Optional[Hashable] = None) -> Optional[List[Message]]:
+        """读取会话历史，未命中、已过期或与 version 不一致时返回 None"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and version is not None and entry[1] != version:
+                del self._entries[session_id]
+                self.stale += 1
+                entry = None
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[session_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return list(entry[2])
+
+    def version(self, session_id: str) -> Optional[Hashable]:
+        """缓存中会话历史的版本，不在缓存中返回 None（不计入命中统计）"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry[1] if entry is not None else None
+
+    def load_started(self) -> int:
+        """开始从数据库加载前调用，返回值传给 put 的 since"""
+        with self._lock:
+            return self._write_seq
+
+    def put(self, session_id: str, messages: List[Message], version: Optional[Hashable] = None,
+            since: Optional[int] = None):
+        """
+        写入从数据库加载的完整会话历史
+        since 为 load_started 的返回值：加载开始后本进程写入过该会话时不写入，避免缓存缺少最新的消息
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if since is not None and self._written_since(session_id, since):
+                self.skipped_puts += 1
+                return
+            self._entries[session_id] = (time.monotonic() + self.ttl, version, list(messages[-self.max_messages:]))
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def append(self, session_id: str, messages: List[Message], before: Optional[Hashable] = None,
+               after: Optional[Hashable] = None):
+        """
+        追加已落库的消息；会话不在缓存中时忽略，下次读取再从数据库加载
+        before/after 为写入前后的版本：缓存的版本不是 before 时（其他 worker 也写入过）移除该会话
+        """
+        with self._lock:
+            self._record_write(session_id)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if entry[1] != before:
+                del self._entries[session_id]
+                return
+            history = entry[2]
+            history.extend(messages)
+            if len(history) > self.max_messages:
+                del history[:len(history) - self.max_messages]
+            self._entries[session_id] = (entry[0], after, history)
+
+    def invalidate(self, session_id: str):
+        """移除会话缓存"""
+        with self._lock:
+            self._record_write(session_id)
+            self._entries.pop(session_id, None)
+
+    def _record_write(self, session_id: str):
+        self._write_seq += 1
+        self._writes[session_id] = self._write_seq
+        self._writes.move_to_end(session_id)
+        while len(self._writes) > max(self.max_sessions, 1):
+            _, seq = self._writes.popitem(last=False)
+            self._forgotten_seq = seq
+
+    def _written_since(self, session_id: str, since: int) -> bool:
+        seq = self._writes.get(session_id)
+        if seq is not None:
+            return seq > since
+        # 写入记录已被淘汰，无法确认时按写入过处理
+        return self._forgotten_seq > since
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._writes.clear()
+
+    def get_stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "sessions": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "stale": self.stale,
+                "skipped_puts": self.skipped_puts,
+                "evictions": self.evictions,
+            }
+
+history_cache = HistoryCache(
+    max_sessions=Config.HISTORY_CACHE_SIZE,
+    ttl=Config.HISTORY_CACHE_TTL,
+    max_messages=Config.MAX_CONVERSATION_HISTORY,
+)
+
+# 滚动摘要缓存：每个会话一项 (摘要, 锚点哈希)
+summary_cache = HistoryCache(
+    max_sessions=Config.HISTORY_CACHE_SIZE,
+    ttl=Config.HISTORY_CACHE_TTL,
+    max_messages=1,
+)
@@ -0,0 +1,176 @@
+"""交易编号生成"""
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from backend.config import Config
+from backend.model.id_sequence import IdSequence
+from backend.model.transaction import Transaction
+from abc import ABC, abstractmethod
+from typing import Optional
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_SEQUENCE = "transaction"
+# snowflake 机器号租约使用的序列
+WORKER_SEQUENCE = "snowflake_worker"
+
+class TransactionIdGenerator(ABC):
+    """交易编号生成器接口"""
+
+    @abstractmethod
+    def next_id(self, db: Session) -> str:
+        """生成一个交易编号"""
+
+    @abstractmethod
+    def reset(self):
+        """fork 后丢弃从父进程继承的状态"""
+
+class SequenceIdGenerator(TransactionIdGenerator):
+    """
+    数据库号段分配
+    每个进程一次从 id_sequences 表申请一段连续编号，用完前在内存中分配，
+    平均每次生成是常数时间，且跨进程不重复；编号格式与历史数据一致（TXN1001）
+    """
+
+    def __init__(self, block_size: int, sequence_name: str = TRANSACTION_SEQUENCE, start: Optional[int] = None):
+        self.block_size = block_size
+        self.sequence_name = sequence_name
+        self.start = start
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def next_id(self, db: Session) -> str:
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._allocate_block(db)
+            value = self._next
+            self._next += 1
+        return f"TXN{value}"
+
+    def _allocate_block(self, db: Session):
+        """
+        在独立事务中申请号段，不受调用方事务回滚影响
+        先 UPDATE 再读取，行锁（MySQL）或写锁（sqlite）保证并发申请互不重叠
+        """
+        bind = db.get_bind()
+        engine = bind.engine if isinstance(bind, Connection) else bind
+        for _ in range(3):
+            with engine.begin() as conn:
+                updated = conn.execute(
+                    update(IdSequence)
+                    .where(IdSequence.name == self.sequence_name)
+                    .values(next_value=IdSequence.next_value + self.block_size)
+                ).rowcount
+                if updated:
+                    end = conn.execute(
+                        select(IdSequence.next_value).where(IdSequence.name == self.sequence_name)
+                    ).scalar_one()
+                    return end - self.block_size, end
+            self._init_sequence(engine)
+        raise RuntimeError(f"无法分配序列号段: {self.sequence_name}")
+
+    def _init_sequence(self, engine):
+        """
+        首次使用时创建序列，未指定起始值时接在旧的 COUNT(*) 编号之后，避免与历史交易编号冲突
+        """
+        try:
+            with engine.begin() as conn:
+                start = self.start
+                if start is None:
+                    start = 1000 + conn.execute(select(func.count()).select_from(Transaction)).scalar_one() + 1
+                conn.execute(insert(IdSequence).values(
+                    name=self.sequence_name,
+                    next_value=start
+                ))
+            logger.info(f"已创建序列 {self.sequence_name}")
+        except IntegrityError:
+            # 其他进程已经创建
+            pass
+
+class SnowflakeIdGenerator(TransactionIdGenerator):
+    """
+    时间有序 ID：41 位毫秒时间戳 + 10 位机器号 + 12 位毫秒内序号
+    用 36 进制编码以符合交易编号的长度限制（如 T0QZ5K3B9W001）
+    机器号：未配置 TXN_WORKER_ID 时，每个进程（包括 fork 出的每个 gunicorn worker）首次生成编号时
+    从 id_sequences 表租用一个，之后不再访问数据库；租用按序递增取模 1024，
+    同时存活的进程不超过 1024 个时互不相同，多进程、多机部署都不会重复。
+    配置了 TXN_WORKER_ID 时直接使用，只适用于该机器号只有一个进程的部署（单进程运行）
+    """
+
+    EPOCH_MS = 1704067200000  # 2024-01-01 00:00:00 UTC
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+    MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+    def __init__(self, worker_id: str = ""):
+        self._configured_worker_id = worker_id
+        self._leases = SequenceIdGenerator(1, WORKER_SEQUENCE, start=0)
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+        self._leases.reset()
+        if self._configured_worker_id:
+            self.worker_id: Optional[int] = int(self._configured_worker_id) & ((1 << self.WORKER_BITS) - 1)
+        else:
+            # fork 后子进程重新租用，不能沿用父进程的机器号
+            self.worker_id = None
+
+    def _lease_worker_id(self, db: Session) -> int:
+        value, _ = self._leases._allocate_block(db)
+        worker_id = value & ((1 << self.WORKER_BITS) - 1)
+        logger.info(f"进程 {os.getpid()} 租用 snowflake 机器号 {worker_id}")
+        return worker_id
+
+    def next_id(self, db: Session) -> str:
+        with self._lock:
+            if self.worker_id is None:
+                self.worker_id = self._lease_worker_id(db)
+            now = int(time.time() * 1000)
+            if now < self._last_ms:
+                # 时钟回拨时沿用上一个时间戳，避免生成重复 ID
+                now = self._last_ms
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & self.MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 本毫秒内的序号已用完，等待下一毫秒
+                    while now <= self._last_ms:
+                        time.sleep(0.0001)
+                        now = int(time.time() * 1000)
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            value = ((now - self.EPOCH_MS) << (self.WORKER_BITS + self.SEQUENCE_BITS)) \
+                | (self.worker_id << self.SEQUENCE_BITS) | self._sequence
+        return "T" + _to_base36(value).rjust(12, "0")
+
+def _to_base36(value: int) -> str:
+    digits = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    result = ""
+    while value:
+        value, remainder = divmod(value, 36)
+        result = digits[remainder] + result
+    return result or "0"
+
+def create_transaction_id_generator() -> TransactionIdGenerator:
+    """根据配置创建交易编号生成器"""
+    if Config.TXN_ID_GENERATOR == "snowflake":
+        return SnowflakeIdGenerator(Config.TXN_WORKER_ID)
+    return SequenceIdGenerator(Config.TXN_ID_BLOCK_SIZE)
+
+transaction_id_generator = create_transaction_id_generator()
+
+if hasattr(os, "register_at_fork"):
+    # 子进程不能继承父进程尚未用完的号段，否则会分配出重复编号
+    os.register_at_fork(after_in_child=lambda: transaction_id_generator.reset())
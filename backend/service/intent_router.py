@@ -0,0 +1,167 @@
+"""本地意图路由"""
+from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session
+from backend.config import Config
+from backend.service.account_service import AccountService
+from backend.service.banking_service import banking_tools
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 账户名称：中英文、数字，最长 20 个字符
+_NAME = r'\w{1,20}?'
+_QUERY_PREFIX = r'(?:查询|查看|查一查|查|看看|看下|看)?'
+# 收支汇总的时间范围，原样交给 parse_period 解析
+_PERIOD = r'今天|今日|昨天|本周|这周|上周|本月|这个?月|上个?月|今年|本年|去年|(?:最近|近)\d{1,3}天'
+
+# 意图规则：(函数名, 正则, 基础置信度)
+INTENT_PATTERNS = [
+    ("list_accounts",
+     re.compile(r'(?:列出|显示|查看|查询|看看)?(?:所有|全部)的?账户(?:列表|信息)?|账户列表'),
+     1.0),
+    ("get_balance",
+     re.compile(_QUERY_PREFIX + r'(?P<name>' + _NAME + r')的?(?:账户)?余额(?:是多少|有多少|还有多少|多少)?'),
+     1.0),
+    ("get_account_info",
+     re.compile(_QUERY_PREFIX + r'(?P<name>' + _NAME + r')的?账户(?:信息|详情|详细信息)'),
+     1.0),
+    ("get_transaction_history",
+     re.compile(_QUERY_PREFIX + r'(?P<name>' + _NAME + r')的?(?:交易记录|交易明细|流水)'
+                r'(?:[（(]?最近(?P<limit>\d{1,3})条[)）]?)?'),
+     1.0),
+    ("get_period_summary",
+     re.compile(_QUERY_PREFIX + r'(?P<name>' + _NAME + r')的?(?P<period>' + _PERIOD + r')的?'
+                r'(?:一共|总共|总计)?(?:转出|转入|支出|收入|收支)(?:了|情况|汇总|统计)?(?:多少钱?|多少元)?'),
+     1.0),
+    ("transfer_money",
+     re.compile(r'从?(?P<from_name>' + _NAME + r')(?:转账|转)(?P<amount>\d+(?:\.\d{1,2})?)元?(?:给|到)(?P<to_name>\w{1,20})'),
+     0.95),
+    ("transfer_money",
+     re.compile(r'(?P<from_name>' + _NAME + r')(?:给|向)(?P<to_name>' + _NAME + r')转账?(?P<amount>\d+(?:\.\d{1,2})?)元?'),
+     0.95),
+]
+
+_LEADING_FILLERS = re.compile(r'^(?:请问|请|麻烦你?|帮我|帮忙|我要|我想)+')
+_TRAILING_FILLERS = re.compile(r'(?:吧|呢|啊|谢谢)+$')
+_PUNCTUATION = re.compile(r'[\s，,。.！!？?~～]+')
+
+class RouterStats:
+    """路由命中统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fallbacks = 0
+        self.hits_by_function: Dict[str, int] = {}
+
+    def record_hit(self, func_name: str):
+        with self._lock:
+            self.hits += 1
+            self.hits_by_function[func_name] = self.hits_by_function.get(func_name, 0) + 1
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.fallbacks
+            return {
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "hits_by_function": dict(self.hits_by_function),
+            }
+
+router_stats = RouterStats()
+
+def normalize_message(text: str) -> str:
+    """去掉标点、空白和常见客套词"""
+    text = _PUNCTUATION.sub('', text)
+    text = text.replace('一下', '')
+    text = _LEADING_FILLERS.sub('', text)
+    text = _TRAILING_FILLERS.sub('', text)
+    return text
+
+class IntentRouter:
+    """
+    在调用模型之前识别明确的银行指令
+    只有账户名称存在、且整句都能被规则解释时才直接执行，其余情况交给模型处理
+    """
+
+    def __init__(self, db: Session, threshold: float = None, read_only: bool = False):
+        """read_only=True 时只匹配只读功能（按工具注册表的 write 标记），转账等写操作一律交给调用方处理"""
+        self.account_service = AccountService(db)
+        self.threshold = Config.INTENT_ROUTER_THRESHOLD if threshold is None else threshold
+        self.read_only = read_only
+
+    def match(self, user_input: str, min_confidence: float = 0.0) -> Tuple[Optional[str], Optional[tuple], float]:
+        """
+        匹配用户消息，低于 min_confidence 的规则不再校验账户
+        返回: (函数名, 参数, 置信度)，未识别时函数名为 None
+        """
+        text = normalize_message(user_input)
+        if not text:
+            return None, None, 0.0
+
+        candidates = []
+        for func_name, pattern, base_confidence in INTENT_PATTERNS:
+            if self.read_only and banking_tools.is_write(func_name):
+                continue
+            match = pattern.search(text)
+            if not match:
+                continue
+            # 置信度 = 规则基础置信度 × 规则覆盖的字符比例
+            confidence = base_confidence * (match.end() - match.start()) / len(text)
+            if confidence < min_confidence:
+                continue
+            candidates.append((confidence, func_name, match))
+
+        if not candidates:
+            return None, None, 0.0
+
+        # 按置信度从高到低尝试，第一个账户名称全部存在的规则生效
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        for confidence, func_name, match in candidates:
+            args = self._build_args(func_name, match.groupdict())
+            if args is not None:
+                return func_name, args, confidence
+        return None, None, 0.0
+
+    def _build_args(self, func_name: str, groups: Dict) -> Optional[tuple]:
+        """校验账户名称并构造函数参数，校验失败返回 None"""
+        names = [groups[key] for key in ("name", "from_name", "to_name") if groups.get(key)]
+        if names and self.account_service.get_existing_names(names) != set(names):
+            return None
+
+        if func_name == "list_accounts":
+            return ()
+        if func_name == "transfer_money":
+            if groups["from_name"] == groups["to_name"]:
+                return None
+            return groups["from_name"], groups["to_name"], float(groups["amount"])
+        if func_name == "get_transaction_history":
+            return groups["name"], int(groups["limit"]) if groups.get("limit") else 10
+        if func_name == "get_period_summary":
+            return groups["name"], groups["period"]
+        return (groups["name"],)
+
+    def route(self, user_input: str) -> Tuple[Optional[str], Optional[tuple]]:
+        """
+        判断消息能否绕过模型直接执行
+        返回: (函数名, 参数)，置信度低于阈值时返回 (None, None)
+        """
+        try:
+            func_name, args, confidence = self.match(user_input, self.threshold)
+        except Exception as e:
+            logger.warning(f"意图路由失败，交给模型处理: {str(e)}")
+            func_name, confidence = None, 0.0
+
+        if func_name and confidence >= self.threshold:
+            router_stats.record_hit(func_name)
+            logger.info(f"意图路由命中: {func_name} (置信度 {confidence:.2f})")
+            return func_name, args
+        router_stats.record_fallback()
+        return None, None
@@ -0,0 +1,138 @@
+"""模型调用统计"""
+from collections import deque
+from typing import Dict, Optional
+import json
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 计算延迟分位数时保留的最近调用数
+RECENT_CALLS = 1000
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def _cached_tokens(usage) -> int:
+    """
+    提供方从前缀缓存中命中的 prompt token 数
+    OpenAI 格式为 prompt_tokens_details.cached_tokens，DeepSeek 为 prompt_cache_hit_tokens
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    return cached or 0
+
+class LLMCall:
+    """
+    单次模型调用的计时与用量记录
+    流式调用在收到第一段内容时调用 first_token()，结束时调用 finish()
+    """
+
+    def __init__(self, kind: str, model: str, prefix: str = ""):
+        self.kind = kind
+        self.model = model
+        self.prefix = prefix
+        self.retries = 0
+        self.usage = None
+        self._start = time.perf_counter()
+        self._first_token: Optional[float] = None
+        self._finished = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def first_token(self):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+
+    def finish(self, success: bool = True, error: str = ""):
+        """记录本次调用，重复调用时忽略"""
+        if self._finished:
+            return
+        self._finished = True
+        end = time.perf_counter()
+        usage = self.usage
+        record = {
+            "kind": self.kind,
+            "model": self.model,
+            "success": success,
+            "latency_ms": round((end - self._start) * 1000, 1),
+            "ttft_ms": round(((self._first_token or end) - self._start) * 1000, 1),
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "cached_tokens": _cached_tokens(usage) if usage is not None else 0,
+            "retries": self.retries,
+            "prefix": self.prefix,
+        }
+        if error:
+            record["error"] = error
+        llm_stats.record(record)
+        logger.info("llm_call " + json.dumps(record, ensure_ascii=False))
+
+class LLMStats:
+    """进程内模型调用汇总"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.calls_by_kind: Dict[str, int] = {}
+        self.calls_by_model: Dict[str, int] = {}
+        self.prefixes: Dict[str, int] = {}
+        self._latencies = deque(maxlen=RECENT_CALLS)
+        self._ttfts = deque(maxlen=RECENT_CALLS)
+
+    def record(self, record: Dict):
+        with self._lock:
+            self.calls += 1
+            if not record["success"]:
+                self.errors += 1
+            self.retries += record["retries"]
+            self.prompt_tokens += record["prompt_tokens"]
+            self.completion_tokens += record["completion_tokens"]
+            self.cached_tokens += record["cached_tokens"]
+            self.calls_by_kind[record["kind"]] = self.calls_by_kind.get(record["kind"], 0) + 1
+            self.calls_by_model[record["model"]] = self.calls_by_model.get(record["model"], 0) + 1
+            if record["prefix"]:
+                self.prefixes[record["prefix"]] = self.prefixes.get(record["prefix"], 0) + 1
+            self._latencies.append(record["latency_ms"])
+            self._ttfts.append(record["ttft_ms"])
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                # 提供方前缀缓存命中的 prompt token 比例
+                "prompt_cache_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+                "latency_ms": {
+                    "p50": _percentile(self._latencies, 0.5),
+                    "p95": _percentile(self._latencies, 0.95),
+                    "p99": _percentile(self._latencies, 0.99),
+                },
+                "ttft_ms": {
+                    "p50": _percentile(self._ttfts, 0.5),
+                    "p95": _percentile(self._ttfts, 0.95),
+                },
+                "calls_by_kind": dict(self.calls_by_kind),
+                "calls_by_model": dict(self.calls_by_model),
+                # 不同的提示词前缀哈希；正常情况下只有一个，出现多个说明前缀缓存无法命中
+                "prompt_prefixes": dict(self.prefixes),
+            }
+
+llm_stats = LLMStats()
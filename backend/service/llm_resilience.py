@@ -0,0 +1,215 @@
+"""模型调用的时限、重试与熔断"""
+from collections import deque
+from typing import Dict, Mapping, Optional
+from backend.config import Config
+from backend.metrics import LLM_BREAKER_STATE
+import os
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 客户端可以通过该请求头缩短本次请求的时限（秒），不能超过 CHAT_DEADLINE
+DEADLINE_HEADER = "X-Request-Timeout"
+# 剩余时间不足该秒数时不再发起重试
+MIN_ATTEMPT_SECONDS = 1.0
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+class LLMUnavailable(Exception):
+    """模型暂时不可用（熔断、超时或重试后仍然失败），调用方可以改走本地处理"""
+
+class CircuitOpenError(LLMUnavailable):
+    """熔断器打开，直接失败不发起请求"""
+
+class DeadlineExceeded(LLMUnavailable):
+    """请求时限已到"""
+
+class Deadline:
+    """
+    一次 HTTP 请求的截止时间，从收到请求时开始计时
+    模型请求的超时、重试等待都不超过剩余时间
+    """
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> "Deadline":
+        """按 CHAT_DEADLINE 创建，请求头 X-Request-Timeout 更短时以请求头为准"""
+        seconds = Config.CHAT_DEADLINE
+        value = headers.get(DEADLINE_HEADER)
+        if value:
+            try:
+                seconds = min(seconds, max(float(value), 0.0))
+            except ValueError:
+                pass
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def check(self):
+        if time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded("请求处理超时")
+
+    def timeout(self) -> float:
+        """单次模型请求的超时：不超过 LLM_TIMEOUT，也不超过剩余时间"""
+        self.check()
+        return min(Config.LLM_TIMEOUT, self.remaining())
+
+def is_transient(error: Exception) -> bool:
+    """判断模型请求错误是否为可重试的临时错误（超时、连接失败、限流、服务端错误）"""
+    if isinstance(error, LLMUnavailable):
+        return True
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+def retry_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间：指数退避加完全随机抖动"""
+    return random.uniform(0, min(Config.LLM_RETRY_MAX_DELAY, Config.LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+def next_retry(attempt: int, error: Exception, deadline: Deadline) -> Optional[float]:
+    """
+    决定是否重试，返回等待秒数；不应重试时返回 None
+    只重试临时错误，等待后剩余时间仍需足够完成一次请求
+    """
+    if attempt >= Config.LLM_MAX_RETRIES or not is_transient(error) or isinstance(error, CircuitOpenError):
+        return None
+    delay = retry_delay(attempt)
+    if deadline.remaining() - delay < MIN_ATTEMPT_SECONDS:
+        return None
+    return delay
+
+class CircuitBreaker:
+    """
+    模型调用熔断器（进程内）
+    - closed：正常调用，统计最近 window 秒内的结果，调用数达到 min_calls 且错误率达到 error_rate 时打开
+    - open：直接失败，cooldown 秒后进入 half_open
+    - half_open：只放行一个探测请求，成功则关闭，失败则重新打开
+    只有临时错误（超时、连接失败、限流、5xx）计为失败，参数错误等不影响熔断
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, window: float, min_calls: int, error_rate: float, cooldown: float):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._results = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+        self.last_error = ""
+
+    def _set_state(self, state: str):
+        self.state = state
+        LLM_BREAKER_STATE.set(self._STATE_VALUES[state])
+
+    def _trim(self, now: float):
+        while self._results and self._results[0][0] < now - self.window:
+            self._results.popleft()
+
+    def allow(self):
+        """发起请求前调用，熔断时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+                self._probing = False
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError("模型服务暂时不可用（熔断中）")
+
+    def allow_background(self):
+        """后台调用（如对话摘要）只在关闭状态下放行，不占用 half_open 的探测名额"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            self.rejected += 1
+        raise CircuitOpenError("模型服务暂时不可用（熔断中）")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("模型服务恢复，熔断器关闭")
+                self._set_state(self.CLOSED)
+                self._results.clear()
+                self._probing = False
+                return
+            now = time.monotonic()
+            self._results.append((now, True))
+            self._trim(now)
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.last_error = str(error)[:200]
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            if self.state == self.OPEN:
+                return
+            self._results.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._results if not ok)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.error_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self._set_state(self.OPEN)
+        self._opened_at = now
+        self._probing = False
+        self._results.clear()
+        self.opened += 1
+        logger.warning(f"模型调用错误率过高，熔断 {self.cooldown:.0f}s: {self.last_error}")
+
+    def release_probe(self):
+        """half_open 的探测请求没有产生结果（如调用方取消）时释放名额"""
+        with self._lock:
+            self._probing = False
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            failures = sum(1 for _, ok in self._results if not ok)
+            return {
+                "state": self.state,
+                "window_calls": len(self._results),
+                "window_failures": failures,
+                "error_rate": round(failures / len(self._results), 4) if self._results else 0.0,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "retry_in": round(max(self.cooldown - (now - self._opened_at), 0.0), 1) if self.state == self.OPEN else 0.0,
+                "last_error": self.last_error,
+            }
+
+llm_breaker = CircuitBreaker(
+    window=Config.LLM_BREAKER_WINDOW,
+    min_calls=Config.LLM_BREAKER_MIN_CALLS,
+    error_rate=Config.LLM_BREAKER_ERROR_RATE,
+    cooldown=Config.LLM_BREAKER_COOLDOWN,
+)
+
+if hasattr(os, "register_at_fork"):
+    # 子进程重新开始统计，避免继承父进程中被持有的锁
+    os.register_at_fork(after_in_child=llm_breaker._reset)
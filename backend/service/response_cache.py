@@ -0,0 +1,223 @@
+"""模型回复缓存"""
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from backend.config import Config
+from backend.service.intent_router import normalize_message
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 超过该长度的消息通常带有具体情境，不缓存
+MAX_MESSAGE_LENGTH = 200
+# 依赖上下文或涉及个人账户的消息不缓存
+_BYPASS_WORDS = re.compile(r'它|他|她|这个|那个|刚才|上面|之前|上一|继续|我的|余额|转账|账户|交易|流水|卡号')
+# 回复中出现金额或函数调用说明涉及账户数据，不缓存
+_ACCOUNT_DATA = re.compile(r'CALL:|¥|￥', re.IGNORECASE)
+# 每写入多少次清理一次磁盘上的过期条目
+_PURGE_INTERVAL = 100
+
+class DiskStore:
+    """
+    SQLite 文件存储，多个 gunicorn worker 共享同一个文件
+    每个线程使用自己的连接，fork 后的子进程重新打开
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reset()
+
+    def _reset(self):
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._writes = 0
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._reset()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            if not self._initialized:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache "
+                    "(key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """返回 (过期时间, 回复)，过期时间为 time.time() 时间戳"""
+        row = self._connection().execute(
+            "SELECT expires_at, reply FROM response_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return row
+
+    def put(self, key: str, reply: str, expires_at: float):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, reply, expires_at) VALUES (?, ?, ?)",
+            (key, reply, expires_at)
+        )
+        self._writes += 1
+        if self._writes % _PURGE_INTERVAL == 0:
+            conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM response_cache")
+
+class ResponseCache:
+    """
+    缓存不涉及账户数据的通用回答（如"什么是定期存款"）
+    键为规范化后的用户消息 + 系统提示词哈希 + 模型名称，提示词或模型变化后旧条目自然失效；
+    进程内 LRU + TTL，可选 SQLite 文件作为多 worker 共享的二级存储
+    """
+
+    def __init__(self, max_entries: int, ttl: float, path: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = DiskStore(path) if path and max_entries > 0 else None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._prompt_hashes: Dict[str, str] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.stores = 0
+        self.rejected = 0
+        self.disk_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _prompt_hash(self, system_prompt: str) -> str:
+        digest = self._prompt_hashes.get(system_prompt)
+        if digest is None:
+            digest = hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()
+            self._prompt_hashes = {system_prompt: digest}
+        return digest
+
+    def key_for(self, messages: List[Dict], model: str,
+                mentions_account: Optional[Callable[[List[str]], bool]] = None) -> Optional[str]:
+        """
+        计算缓存键，不适合缓存的消息返回 None
+        只缓存与上下文无关的问题：消息不能指代前文，也不能涉及账户操作；
+        与 offer 相同，消息提到账户名称或没有提供账户名称检查时不读缓存
+        """
+        if not self.enabled:
+            return None
+        user_message = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else ""
+        text = normalize_message(user_message).lower()
+        if not text or len(text) > MAX_MESSAGE_LENGTH or _BYPASS_WORDS.search(text) \
+                or mentions_account is None or mentions_account([user_message]):
+            with self._lock:
+                self.bypasses += 1
+            return None
+        system_prompt = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        raw = f"{model}\n{self._prompt_hash(system_prompt)}\n{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的回复，先查内存再查磁盘"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except sqlite3.Error as e:
+                row = None
+                self._record_disk_error(e)
+            if row is not None:
+                expires_at, reply = row
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, reply, now + max(expires_at - time.time(), 0))
+                return reply
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def offer(self, key: str, user_message: str, reply: str, has_tool_calls: bool,
+              mentions_account: Optional[Callable[[List[str]], bool]]):
+        """
+        模型回复后尝试写入缓存
+        包含函数调用、金额或账户名称的回复不写入；没有提供账户名称检查时也不写入
+        """
+        if has_tool_calls or not reply or _ACCOUNT_DATA.search(reply) \
+                or mentions_account is None or mentions_account([user_message, reply]):
+            with self._lock:
+                self.rejected += 1
+            return
+
+        with self._lock:
+            self.stores += 1
+            self._remember(key, reply, time.monotonic() + self.ttl)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, reply, time.time() + self.ttl)
+            except sqlite3.Error as e:
+                self._record_disk_error(e)
+
+    def _remember(self, key: str, reply: str, expires: float):
+        self._entries[key] = (expires, reply)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _record_disk_error(self, error: Exception):
+        with self._lock:
+            self.disk_errors += 1
+        logger.warning(f"回复缓存文件读写失败: {str(error)}")
+
+    def clear(self):
+        """清空缓存（包括磁盘）"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self) -> Dict:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk": self.disk.path if self.disk else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "bypasses": self.bypasses,
+                "stores": self.stores,
+                "rejected": self.rejected,
+                "disk_errors": self.disk_errors,
+            }
+
+response_cache = ResponseCache(
+    max_entries=Config.RESPONSE_CACHE_SIZE,
+    ttl=Config.RESPONSE_CACHE_TTL,
+    path=Config.RESPONSE_CACHE_PATH,
+)
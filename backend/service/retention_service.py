@@ -0,0 +1,147 @@
+"""对话历史保留策略：清理长期不活跃的会话"""
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, TextIO
+from sqlalchemy.orm import Session
+from backend.model.conversation import Conversation
+from backend.model.conversation_summary import ConversationSummary
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 判定结果缓存的会话数上限，超过后清空（同一会话的消息在主键上大致相邻）
+SESSION_MEMO_LIMIT = 100_000
+# 一条 IN 查询中的会话数上限
+SESSION_QUERY_BATCH = 500
+
+class ConversationPurger:
+    """
+    按主键顺序分批删除不活跃会话（最后一条消息早于 cutoff）的消息
+    - 每批是一个短事务：按主键读取 chunk_size 行，挑出属于不活跃会话的行，按主键删除后立即提交，
+      只锁定被删除的行，不会长时间阻塞 /chat 的写入
+    - 只删除早于 cutoff 的消息：清理期间会话恢复活跃时，新消息不受影响，可以在线上流量期间运行
+    - 消息主键随时间递增，扫描到整批都不早于 cutoff 时结束
+    - 提供 archive 时先把要删除的行写入归档（JSONL）并刷新到磁盘，再提交删除
+    """
+
+    def __init__(self, db: Session, cutoff: datetime, chunk_size: int,
+                 archive: Optional[TextIO] = None, dry_run: bool = False, pause: float = 0.0):
+        self.db = db
+        self.cutoff = cutoff
+        self.chunk_size = max(chunk_size, 1)
+        self.archive = archive
+        self.dry_run = dry_run
+        self.pause = pause
+        self._idle: Set[str] = set()
+        self._active: Set[str] = set()
+        self.scanned = 0
+        self.purged = 0
+        self.sessions = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+
+    def run(self, progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """执行清理，每批结束后调用 progress(统计)，返回最终统计"""
+        last_id = 0
+        while True:
+            rows = self.db.query(Conversation.id, Conversation.session_id, Conversation.created_at)\
+                .filter(Conversation.id > last_id)\
+                .order_by(Conversation.id.asc())\
+                .limit(self.chunk_size)\
+                .all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            self.scanned += len(rows)
+            self.chunks += 1
+
+            expired = [row for row in rows if row.created_at is not None and row.created_at < self.cutoff]
+            if not expired:
+                self.db.rollback()
+                break
+            idle = self._idle_sessions({row.session_id for row in expired})
+            ids = [row.id for row in expired if row.session_id in idle]
+            if ids:
+                self._purge(ids, idle)
+            else:
+                self.db.rollback()
+
+            if progress:
+                progress(self.get_stats())
+            if self.pause:
+                time.sleep(self.pause)
+        return self.get_stats()
+
+    def _idle_sessions(self, session_ids: Set[str]) -> Set[str]:
+        """返回其中不活跃的会话：没有不早于 cutoff 的消息（沿 idx_session_created 索引判断）"""
+        if len(self._idle) + len(self._active) > SESSION_MEMO_LIMIT:
+            self._idle.clear()
+            self._active.clear()
+        unknown = list(session_ids - self._idle - self._active)
+        for start in range(0, len(unknown), SESSION_QUERY_BATCH):
+            batch = unknown[start:start + SESSION_QUERY_BATCH]
+            active = {
+                row.session_id for row in self.db.query(Conversation.session_id)
+                .filter(Conversation.session_id.in_(batch), Conversation.created_at >= self.cutoff)
+                .distinct()
+                .all()
+            }
+            self._active.update(active)
+            newly_idle = set(batch) - active
+            self._idle.update(newly_idle)
+            self.sessions += len(newly_idle)
+            if newly_idle and not self.dry_run:
+                # 不活跃会话的滚动摘要一并清理
+                self.db.query(ConversationSummary)\
+                    .filter(ConversationSummary.session_id.in_(newly_idle),
+                            ConversationSummary.updated_at < self.cutoff)\
+                    .delete(synchronize_session=False)
+        return session_ids & self._idle
+
+    def _purge(self, ids: List[int], sessions: Set[str]):
+        if self.dry_run:
+            self.purged += len(ids)
+            self.db.rollback()
+            return
+        if self.archive is not None:
+            self._archive(ids)
+        try:
+            self.db.query(Conversation)\
+                .filter(Conversation.id.in_(ids))\
+                .delete(synchronize_session=False)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self.purged += len(ids)
+
+    def _archive(self, ids: List[int]):
+        """把即将删除的行写入归档；写入并刷新后才提交删除，中断时行不会丢失（重跑可能重复归档）"""
+        rows = self.db.query(Conversation)\
+            .filter(Conversation.id.in_(ids))\
+            .order_by(Conversation.id.asc())\
+            .all()
+        for row in rows:
+            self.archive.write(json.dumps({
+                "id": row.id,
+                "session_id": row.session_id,
+                "role": row.role,
+                "content": row.content,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+            }, ensure_ascii=False) + "\n")
+        self.archive.flush()
+        self.db.expunge_all()
+
+    def get_stats(self) -> Dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "cutoff": self.cutoff.isoformat(timespec="seconds"),
+            "dry_run": self.dry_run,
+            "chunks": self.chunks,
+            "scanned": self.scanned,
+            "sessions": self.sessions,
+            "purged": self.purged,
+            "elapsed": round(elapsed, 3),
+            "rows_per_second": round(self.purged / elapsed, 1) if elapsed > 0 else 0.0,
+        }
@@ -0,0 +1,280 @@
+"""账户交易汇总：按日、按月预先累计转入转出金额和笔数"""
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import insert, select, update, case, func
+from sqlalchemy.orm import Session
+from backend.model.account_daily_stat import AccountDailyStat
+from backend.model.account_monthly_stat import AccountMonthlyStat
+from backend.model.transaction import Transaction
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 全量重建时单条 INSERT 的最大行数
+REBUILD_INSERT_CHUNK = 1000
+# 单次汇总查询允许的最长天数
+MAX_PERIOD_DAYS = 3660
+
+# 时间范围关键词（中文别名和英文写法）
+PERIOD_ALIASES = {
+    "today": ("今天", "今日"),
+    "yesterday": ("昨天", "昨日"),
+    "this_week": ("本周", "这周", "这星期", "这个星期"),
+    "last_week": ("上周", "上星期", "上个星期"),
+    "this_month": ("本月", "这月", "这个月", "当月"),
+    "last_month": ("上月", "上个月"),
+    "this_year": ("今年", "本年"),
+    "last_year": ("去年",),
+}
+_ALIAS_INDEX = {alias: key for key, aliases in PERIOD_ALIASES.items() for alias in aliases + (key,)}
+_RECENT_DAYS = re.compile(r'^(?:近|最近|last_?)(\d{1,4})(?:天|日|_?days?)$')
+_YEAR = re.compile(r'^(\d{4})年?$')
+_MONTH = re.compile(r'^(\d{4})[-/年](\d{1,2})月?$')
+_DAY = r'(\d{4})[-/](\d{1,2})[-/](\d{1,2})'
+_RANGE = re.compile(r'^' + _DAY + r'\s*(?:~|至|到|—|--)\s*' + _DAY + r'$')
+
+Stat = Tuple[int, float, float]
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def next_month(day: date) -> date:
+    """day 所在月份的下一个月第一天"""
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def parse_period(period: str, today: date) -> Tuple[date, date, str]:
+    """
+    解析时间范围，返回 (开始日期, 结束日期（含）, 名称)；直接给出日期的范围名称为空
+    支持：今天、昨天、本周、上周、本月、上月、今年、去年、近N天、2026、2026-10、2026-10-01~2026-10-15
+    无法识别时抛出 ValueError
+    """
+    text = (period or "本月").strip().replace(" ", "")
+    key = _ALIAS_INDEX.get(text.lower())
+    if key == "today":
+        return today, today, "今天"
+    if key == "yesterday":
+        day = today - timedelta(days=1)
+        return day, day, "昨天"
+    if key == "this_week":
+        return today - timedelta(days=today.weekday()), today, "本周"
+    if key == "last_week":
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6), "上周"
+    if key == "this_month":
+        return month_start(today), today, "本月"
+    if key == "last_month":
+        end = month_start(today) - timedelta(days=1)
+        return month_start(end), end, "上月"
+    if key == "this_year":
+        return today.replace(month=1, day=1), today, "今年"
+    if key == "last_year":
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31), "去年"
+
+    match = _RECENT_DAYS.match(text.lower())
+    if match:
+        days = int(match.group(1))
+        if not 1 <= days <= MAX_PERIOD_DAYS:
+            raise ValueError(f"天数需在 1 到 {MAX_PERIOD_DAYS} 之间")
+        return today - timedelta(days=days - 1), today, f"近{days}天"
+
+    try:
+        match = _YEAR.match(text)
+        if match:
+            year = int(match.group(1))
+            return date(year, 1, 1), date(year, 12, 31), f"{year}年"
+        match = _MONTH.match(text)
+        if match:
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+            return start, next_month(start) - timedelta(days=1), f"{start:%Y年%m月}"
+        match = _RANGE.match(text)
+        if match:
+            values = [int(value) for value in match.groups()]
+            start, end = date(*values[:3]), date(*values[3:])
+        else:
+            start = end = date(*[int(value) for value in re.match(r'^' + _DAY + r'$', text).groups()])
+    except (AttributeError, ValueError):
+        raise ValueError(f"无法识别的时间范围「{period}」，可以使用本月、上月、近7天或 2026-10-01~2026-10-15")
+    if start > end:
+        raise ValueError("开始日期不能晚于结束日期")
+    if (end - start).days >= MAX_PERIOD_DAYS:
+        raise ValueError(f"时间范围不能超过 {MAX_PERIOD_DAYS} 天")
+    return start, end, ""
+
+def aggregate(rows: Iterable[Dict]) -> Tuple[Dict[Tuple[int, date], List], Dict[Tuple[int, date], List]]:
+    """把交易记录行合并为 {(账户ID, 日期): [笔数, 转入, 转出]} 和按月份的同样结构"""
+    daily: Dict[Tuple[int, date], List] = {}
+    monthly: Dict[Tuple[int, date], List] = {}
+    for row in rows:
+        day = row["created_at"].date()
+        inflow = row["amount"] if row["transaction_type"] == "转入" else 0.0
+        outflow = row["amount"] if row["transaction_type"] == "转出" else 0.0
+        for totals, key in ((daily, (row["account_id"], day)), (monthly, (row["account_id"], month_start(day)))):
+            stat = totals.setdefault(key, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += inflow
+            stat[2] += outflow
+    return daily, monthly
+
+class RollupService:
+    """
+    账户交易汇总服务
+    - 转账写入交易记录时，在同一事务中把笔数和金额累加到日汇总、月汇总（每张表一条多行 upsert），
+      两个账户的余额行已被锁定，同一账户的累加不会并发冲突
+    - 查询一段时间的收支时，整月部分读月汇总、首尾不足一个月的部分读日汇总，
+      耗时只和天数有关，与交易笔数无关
+    - 汇总与交易记录不一致时（如升级前的历史数据、手工修改交易记录），可以用 rebuild 全量重建
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record(self, rows: List[Dict]):
+        """在当前事务中把新写入的交易记录累加到汇总表，不提交"""
+        daily, monthly = aggregate(rows)
+        self._upsert(AccountDailyStat, AccountDailyStat.day, daily)
+        self._upsert(AccountMonthlyStat, AccountMonthlyStat.month, monthly)
+
+    def _upsert(self, model, period_column, totals: Dict[Tuple[int, date], List]):
+        """按 (账户, 日期) 累加：MySQL 用 ON DUPLICATE KEY UPDATE，sqlite/PostgreSQL 用 ON CONFLICT"""
+        if not totals:
+            return
+        values = [
+            {"account_id": account_id, period_column.key: period,
+             "txn_count": count, "inflow": inflow, "outflow": outflow}
+            for (account_id, period), (count, inflow, outflow) in sorted(totals.items())
+        ]
+        dialect = self.db.get_bind().dialect.name
+        if dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+            stmt = mysql_insert(model).values(values)
+            self.db.execute(stmt.on_duplicate_key_update(
+                txn_count=model.txn_count + stmt.inserted.txn_count,
+                inflow=model.inflow + stmt.inserted.inflow,
+                outflow=model.outflow + stmt.inserted.outflow,
+            ))
+        elif dialect in ("sqlite", "postgresql"):
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+            stmt = dialect_insert(model).values(values)
+            self.db.execute(stmt.on_conflict_do_update(
+                index_elements=[model.account_id, period_column],
+                set_={
+                    "txn_count": model.txn_count + stmt.excluded.txn_count,
+                    "inflow": model.inflow + stmt.excluded.inflow,
+                    "outflow": model.outflow + stmt.excluded.outflow,
+                },
+            ))
+        else:
+            # 其他数据库：逐行先累加，没有该行时再插入
+            for value in values:
+                updated = self.db.execute(
+                    update(model)
+                    .where(model.account_id == value["account_id"], period_column == value[period_column.key])
+                    .values(txn_count=model.txn_count + value["txn_count"],
+                            inflow=model.inflow + value["inflow"],
+                            outflow=model.outflow + value["outflow"])
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if not updated:
+                    self.db.execute(insert(model), [value])
+
+    def rebuild(self) -> Dict:
+        """
+        从交易记录全量重建日汇总和月汇总并提交
+        日汇总由数据库按 (账户, 日期) 分组后直接 INSERT ... SELECT，月汇总再由日汇总分组生成
+        """
+        started = time.perf_counter()
+        try:
+            self.db.query(AccountMonthlyStat).delete(synchronize_session=False)
+            self.db.query(AccountDailyStat).delete(synchronize_session=False)
+
+            day = func.date(Transaction.created_at)
+            self.db.execute(
+                insert(AccountDailyStat).from_select(
+                    ["account_id", "day", "txn_count", "inflow", "outflow"],
+                    select(
+                        Transaction.account_id,
+                        day,
+                        func.count(),
+                        func.sum(case((Transaction.transaction_type == "转入", Transaction.amount), else_=0.0)),
+                        func.sum(case((Transaction.transaction_type == "转出", Transaction.amount), else_=0.0)),
+                    )
+                    .where(Transaction.created_at.isnot(None))
+                    .group_by(Transaction.account_id, day)
+                )
+            )
+
+            # 日汇总的行数是账户数 × 有交易的天数，在内存中按月合并
+            monthly: Dict[Tuple[int, date], List] = {}
+            daily_rows = 0
+            for row in self.db.query(AccountDailyStat.account_id, AccountDailyStat.day, AccountDailyStat.txn_count,
+                                     AccountDailyStat.inflow, AccountDailyStat.outflow):
+                daily_rows += 1
+                stat = monthly.setdefault((row.account_id, month_start(row.day)), [0, 0.0, 0.0])
+                stat[0] += row.txn_count
+                stat[1] += row.inflow
+                stat[2] += row.outflow
+            values = [
+                {"account_id": account_id, "month": month, "txn_count": count, "inflow": inflow, "outflow": outflow}
+                for (account_id, month), (count, inflow, outflow) in sorted(monthly.items())
+            ]
+            for offset in range(0, len(values), REBUILD_INSERT_CHUNK):
+                self.db.execute(insert(AccountMonthlyStat), values[offset:offset + REBUILD_INSERT_CHUNK])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        elapsed = time.perf_counter() - started
+        logger.info(f"交易汇总重建完成：{daily_rows} 个账户日、{len(values)} 个账户月，耗时 {elapsed:.2f}s")
+        return {"daily_rows": daily_rows, "monthly_rows": len(values), "elapsed": round(elapsed, 3)}
+
+    def is_empty(self) -> bool:
+        return self.db.query(AccountDailyStat.account_id).first() is None
+
+    def get_summary(self, account_id: int, start: date, end: date) -> Dict:
+        """
+        汇总账户在 [start, end] 内的交易笔数、转入、转出金额
+        整月部分读月汇总，首尾不足一个月的部分读日汇总
+        """
+        first_full = start if start.day == 1 else next_month(start)
+        end_exclusive = end + timedelta(days=1)
+        last_full = month_start(end_exclusive)
+        totals = [0, 0.0, 0.0]
+        if first_full < last_full:
+            self._add(totals, self._sum(AccountMonthlyStat, AccountMonthlyStat.month, account_id, first_full, last_full))
+            day_ranges = [(start, first_full), (last_full, end_exclusive)]
+        else:
+            day_ranges = [(start, end_exclusive)]
+        for range_start, range_end in day_ranges:
+            if range_start < range_end:
+                self._add(totals, self._sum(AccountDailyStat, AccountDailyStat.day, account_id, range_start, range_end))
+        count, inflow, outflow = totals
+        return {
+            "account_id": account_id,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "count": count,
+            "inflow": round(inflow, 2),
+            "outflow": round(outflow, 2),
+            "net": round(inflow - outflow, 2),
+        }
+
+    def _sum(self, model, period_column, account_id: int, start: date, end: date) -> Stat:
+        """沿主键 (account_id, 日期) 范围扫描求和，end 不含"""
+        row = self.db.query(
+            func.coalesce(func.sum(model.txn_count), 0),
+            func.coalesce(func.sum(model.inflow), 0.0),
+            func.coalesce(func.sum(model.outflow), 0.0),
+        ).filter(model.account_id == account_id, period_column >= start, period_column < end).one()
+        return int(row[0]), float(row[1]), float(row[2])
+
+    @staticmethod
+    def _add(totals: List, stat: Stat):
+        for index, value in enumerate(stat):
+            totals[index] += value
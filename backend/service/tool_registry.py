@@ -0,0 +1,201 @@
+"""工具注册表"""
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Union, get_args, get_origin, get_type_hints
+import inspect
+import json
+import math
+import re
+
+# Python 类型到 JSON Schema 类型的映射
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+# 文本形式的函数调用：CALL:函数名(参数=值, ...)，不区分大小写
+_CALL_PATTERN = re.compile(r'CALL:\s*(\w+)\s*\(([^)]*)\)?', re.IGNORECASE)
+_ARG_PATTERN = re.compile(r'(\w+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^,\s)]+))')
+
+class ToolCall(NamedTuple):
+    """模型发起的一次工具调用"""
+    name: str
+    arguments: Dict[str, Any]
+
+class ToolParam(NamedTuple):
+    name: str
+    type: type
+    description: str
+    required: bool
+
+class ToolSpec(NamedTuple):
+    name: str
+    title: str
+    description: str
+    params: List[ToolParam]
+    write: bool
+
+def tool(title: str, description: str, params: Dict[str, str] = None, write: bool = False):
+    """
+    把方法标记为可供模型调用的工具
+    title 用于系统提示词中的简短说明，params 为参数名到参数说明的映射；
+    write=True 表示会修改数据，同一轮中的写操作按顺序逐个执行
+    """
+    def decorator(func):
+        func._tool = {"title": title, "description": description, "params": params or {}, "write": write}
+        return func
+    return decorator
+
+def _unwrap_optional(annotation) -> type:
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+_TRUE_VALUES = ("true", "1")
+_FALSE_VALUES = ("false", "0")
+
+def _convert(param_type: type, value: Any) -> Any:
+    """
+    把模型给出的参数值转换为声明的类型，无法准确转换时抛出 ValueError
+    bool 只接受 true/false/1/0（"false" 不会变成 True），数值不接受布尔值、NaN 和无穷大
+    """
+    if param_type is bool:
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in _TRUE_VALUES:
+            return True
+        if text in _FALSE_VALUES:
+            return False
+        raise ValueError(value)
+    if param_type in (int, float):
+        if isinstance(value, bool):
+            raise ValueError(value)
+        number = float(value.strip() if isinstance(value, str) else value)
+        if not math.isfinite(number):
+            raise ValueError(value)
+        if param_type is int:
+            if not number.is_integer():
+                raise ValueError(value)
+            return int(number)
+        return number
+    if param_type is str:
+        if isinstance(value, (dict, list)):
+            raise ValueError(value)
+        return str(value)
+    return value
+
+def parse_arguments(raw: Optional[str]) -> Dict[str, Any]:
+    """解析模型返回的 JSON 参数，格式错误时返回空字典（由参数校验报告缺少的参数）"""
+    try:
+        arguments = json.loads(raw) if raw else {}
+    except ValueError:
+        return {}
+    return arguments if isinstance(arguments, dict) else {}
+
+class ToolRegistry:
+    """根据带 @tool 标记的方法生成 OpenAI tools 定义，并负责参数校验"""
+
+    def __init__(self, specs: List[ToolSpec]):
+        self._specs = {spec.name: spec for spec in specs}
+        self._schemas = [self._schema(spec) for spec in specs]
+
+    @classmethod
+    def from_class(cls, target: type) -> "ToolRegistry":
+        """按定义顺序收集类中的工具方法，参数类型取自类型注解"""
+        specs = []
+        for name, func in vars(target).items():
+            meta = getattr(func, "_tool", None)
+            if meta is None:
+                continue
+            hints = get_type_hints(func)
+            params = []
+            for param in list(inspect.signature(func).parameters.values())[1:]:
+                params.append(ToolParam(
+                    name=param.name,
+                    type=_unwrap_optional(hints.get(param.name, str)),
+                    description=meta["params"].get(param.name, param.name),
+                    required=param.default is inspect.Parameter.empty,
+                ))
+            specs.append(ToolSpec(name, meta["title"], meta["description"], params, meta["write"]))
+        return cls(specs)
+
+    @staticmethod
+    def _schema(spec: ToolSpec) -> Dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": spec.name,
+                "description": spec.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        param.name: {"type": _JSON_TYPES.get(param.type, "string"), "description": param.description}
+                        for param in spec.params
+                    },
+                    "required": [param.name for param in spec.params if param.required],
+                },
+            },
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def __iter__(self) -> Iterator[ToolSpec]:
+        return iter(self._specs.values())
+
+    def schemas(self) -> List[Dict]:
+        """OpenAI tools 参数"""
+        return self._schemas
+
+    def is_write(self, name: str) -> bool:
+        spec = self._specs.get(name)
+        return spec is None or spec.write
+
+    def bind(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """校验并转换参数类型，返回可直接传给方法的关键字参数；未知参数忽略"""
+        spec = self._specs.get(name)
+        if spec is None:
+            raise ValueError(f"未知的操作：{name}")
+        kwargs = {}
+        for param in spec.params:
+            value = arguments.get(param.name)
+            if value is None or value == "":
+                if param.required:
+                    raise ValueError(f"缺少参数：{param.name}")
+                continue
+            try:
+                kwargs[param.name] = _convert(param.type, value)
+            except (TypeError, ValueError):
+                raise ValueError(f"参数 {param.name} 格式不正确：{value}")
+        return kwargs
+
+    def parse_text_calls(self, text: str) -> List[ToolCall]:
+        """解析文本中的 CALL: 指令，按出现顺序返回全部已注册工具的调用"""
+        if "call:" not in text.lower():
+            return []
+        calls = []
+        for match in _CALL_PATTERN.finditer(text):
+            name = match.group(1).lower()
+            if name not in self._specs:
+                continue
+            arguments = {}
+            for arg in _ARG_PATTERN.finditer(match.group(2)):
+                double_quoted, single_quoted, bare = arg.group(2), arg.group(3), arg.group(4)
+                arguments[arg.group(1)] = next(
+                    value for value in (double_quoted, single_quoted, bare) if value is not None
+                )
+            calls.append(ToolCall(name, arguments))
+        return calls
+
+    def prompt_lines(self) -> str:
+        """系统提示词中的 CALL: 调用格式说明"""
+        lines = []
+        for index, spec in enumerate(self, 1):
+            args = ", ".join(
+                f'{param.name}="{param.description}"' if param.type is str else f"{param.name}={param.description}"
+                for param in spec.params
+            )
+            line = f"{index}. {spec.title}：CALL:{spec.name}({args})"
+            optional = [param.name for param in spec.params if not param.required]
+            if optional:
+                line += f"（{'、'.join(optional)} 可省略）"
+            lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,284 @@
+"""/chat 端到端压测
+
+在本进程内启动模拟模型服务（benchmarks/mock_llm_server.py）和应用，不访问 DeepSeek 和生产数据库；
+N 个并发会话各自保持 cookie，按比例混合发送余额查询、转账和闲聊消息。
+报告延迟分位数、每秒请求数、每请求 SQL 数、每请求模型调用数和错误数，并与保存的基线对比。
+
+用法：
+    python benchmarks/bench_chat_load.py --sessions 20 --turns 10
+    python benchmarks/bench_chat_load.py --database-url mysql+pymysql://root:pw@127.0.0.1/bank --stream
+    python benchmarks/bench_chat_load.py --save-baseline            # 记录当前结果为基线
+    python benchmarks/bench_chat_load.py --check                    # 比基线差超过容差时退出码为 1
+    python benchmarks/bench_chat_load.py --url http://127.0.0.1:8080 # 压测已启动的服务（不统计 SQL 数）
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_llm_server import MockLLM, add_arguments, load_script, start_server
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "chat_load.json")
+
+MESSAGES = {
+    "balance": ["张三还有多少钱", "帮我查一下李四的余额", "王五账户余额是多少", "看看张三账上剩多少钱"],
+    "transfer": ["从张三转1元给李四", "帮我把1块钱从李四转到王五", "王五给张三转1元", "张三向王五转账1元"],
+    "chat": ["什么是定期存款？", "理财有什么建议", "你好", "信用卡和借记卡有什么区别", "怎么开通网上银行"],
+}
+
+# 与基线对比的指标：越小越好的为 True
+COMPARED = {"p50_ms": True, "p95_ms": True, "p99_ms": True, "rps": False, "queries_per_request": True}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="/chat 端到端压测")
+    parser.add_argument("--database-url", default=None, help="数据库 URI，默认使用临时 sqlite 文件")
+    parser.add_argument("--url", default=None, help="压测已启动的应用，不在本进程内启动")
+    parser.add_argument("--llm-url", default=None, help="使用已启动的模拟模型服务")
+    parser.add_argument("--sessions", type=int, default=20, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=10, help="每个会话发送的消息数")
+    parser.add_argument("--mix", default="balance=4,transfer=2,chat=4", help="消息类型比例")
+    parser.add_argument("--stream", action="store_true", help="压测 /chat/stream")
+    parser.add_argument("--no-router", action="store_true", help="关闭本地意图路由，全部消息经过模型")
+    parser.add_argument("--no-response-cache", action="store_true", help="关闭回复缓存")
+    parser.add_argument("--text-tools", action="store_true", help="使用 CALL: 文本格式的函数调用")
+    parser.add_argument("--seed", type=int, default=42, help="消息随机种子")
+    parser.add_argument("--name", default="default", help="基线场景名称")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--check", action="store_true", help="比基线差超过容差时以退出码 1 结束")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化比例")
+    parser.add_argument("--min-delta-ms", type=float, default=50, help="延迟增加不超过该毫秒数时不算退化")
+    add_arguments(parser)
+    return parser.parse_args()
+
+args = parse_args()
+
+def parse_mix(spec: str):
+    weights = {}
+    for item in spec.split(","):
+        kind, _, weight = item.partition("=")
+        if kind.strip() not in MESSAGES:
+            raise SystemExit(f"未知的消息类型：{kind}（可选 {', '.join(MESSAGES)}）")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {kind: [] for kind in MESSAGES}
+        self.errors = []
+
+    def record(self, kind: str, latency: float, error: str = ""):
+        with self._lock:
+            self.latencies[kind].append(latency)
+            if error:
+                self.errors.append(f"{kind}: {error}")
+
+def send(client, kind: str, message: str):
+    """发送一条消息，返回错误说明（成功时为空）"""
+    if not args.stream:
+        response = client.post("/chat", json={"message": message})
+        if response.status_code != 200:
+            return f"HTTP {response.status_code} {response.json().get('reply', '')[:80]}"
+        return ""
+    with client.stream("POST", "/chat/stream", json={"message": message}) as response:
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}"
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "done":
+                data = json.loads(line[6:])
+                return data["reply"][:80] if data.get("error") else ""
+    return "流式响应未结束"
+
+def run_session(base_url: str, index: int, weights, results: Results, start_barrier: threading.Barrier):
+    import httpx
+
+    rng = random.Random(args.seed + index)
+    kinds, kind_weights = list(weights), list(weights.values())
+    with httpx.Client(base_url=base_url, timeout=120) as client:
+        start_barrier.wait()
+        for _ in range(args.turns):
+            kind = rng.choices(kinds, kind_weights)[0]
+            message = rng.choice(MESSAGES[kind])
+            start = time.perf_counter()
+            try:
+                error = send(client, kind, message)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            results.record(kind, time.perf_counter() - start, error)
+
+def start_app():
+    """在本进程内启动应用（多线程 WSGI 服务），返回 (地址, SQL 计数器, 数据库引擎)"""
+    from sqlalchemy import event
+    from werkzeug.serving import make_server
+    from app import app
+    from backend.database import engine, init_db
+    from backend.llm_client import preload_sdk
+
+    init_db()
+    # 与 gunicorn 部署一致，压测开始前导入 openai
+    preload_sdk()
+
+    # 每个请求的访问日志和 llm_call 日志会干扰输出
+    logging.disable(logging.INFO)
+    queries = [0]
+    lock = threading.Lock()
+
+    def count(*_):
+        with lock:
+            queries[0] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="app", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", queries, engine
+
+def compare(report, baseline) -> bool:
+    """打印与基线的对比，返回是否出现超过容差的退化"""
+    if baseline["config"] != report["config"]:
+        print("注意：基线的压测参数与本次不同，对比仅供参考")
+    regressed = False
+    print(f"\n与基线对比（{baseline['recorded_at']}，容差 {args.tolerance:.0%}）：")
+    for key, lower_is_better in COMPARED.items():
+        old, new = baseline["results"].get(key), report["results"].get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = change > args.tolerance if lower_is_better else change < -args.tolerance
+        # 本地路由和模型调用的延迟相差两个数量级，分位数落在两者交界时会大幅跳动
+        if key.endswith("_ms") and new - old <= args.min_delta_ms:
+            worse = False
+        regressed = regressed or worse
+        print(f"  {key:<20} {old:>10} -> {new:<10} {change:+.1%}{'  ← 退化' if worse else ''}")
+    if report["results"]["errors"] > baseline["results"].get("errors", 0):
+        print(f"  errors               {baseline['results'].get('errors', 0)} -> {report['results']['errors']}  ← 退化")
+        regressed = True
+    return regressed
+
+def main():
+    weights = parse_mix(args.mix)
+
+    llm = None
+    llm_url = args.llm_url
+    if not args.url and not llm_url:
+        llm = MockLLM(latency=args.latency, token_rate=args.token_rate, script=load_script(args.script))
+        llm_url = start_server(llm).base_url
+
+    queries, engine = None, None
+    if args.url:
+        base_url = args.url
+    else:
+        os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+        os.environ["DEEPSEEK_BASE_URL"] = llm_url
+        os.environ.setdefault("DEEPSEEK_API_KEY", "mock")
+        os.environ["INTENT_ROUTER_ENABLED"] = "false" if args.no_router else "true"
+        os.environ["LLM_NATIVE_TOOLS"] = "false" if args.text_tools else "true"
+        if args.no_response_cache:
+            os.environ["RESPONSE_CACHE_SIZE"] = "0"
+        base_url, queries, engine = start_app()
+        print(f"数据库: {engine.url.render_as_string(hide_password=True)}")
+    print(f"应用: {base_url}  模型服务: {llm_url or '（外部）'}")
+    print(f"{args.sessions} 个会话 × {args.turns} 条消息，比例 {args.mix}，{'流式' if args.stream else '非流式'}")
+
+    results = Results()
+    barrier = threading.Barrier(args.sessions + 1)
+    threads = [
+        threading.Thread(target=run_session, args=(base_url, i, weights, results, barrier))
+        for i in range(args.sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    queries_before = queries[0] if queries else 0
+    llm_before = llm.requests if llm else 0
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [value for values in results.latencies.values() for value in values]
+    total = len(latencies)
+    report = {
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "mix": args.mix,
+            "stream": args.stream,
+            "router": not args.no_router,
+            "response_cache": not args.no_response_cache,
+            "native_tools": not args.text_tools,
+            "latency": args.latency,
+            "token_rate": args.token_rate,
+            "database": engine.url.get_backend_name() if engine is not None else "external",
+        },
+        "results": {
+            "requests": total,
+            "errors": len(results.errors),
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "queries_per_request": round((queries[0] - queries_before) / total, 2) if queries and total else None,
+            "llm_calls_per_request": round((llm.requests - llm_before) / total, 2) if llm and total else None,
+            "by_kind": {
+                kind: {
+                    "requests": len(values),
+                    "p50_ms": round(percentile(values, 0.5) * 1000, 1),
+                    "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                }
+                for kind, values in results.latencies.items() if values
+            },
+        },
+    }
+
+    r = report["results"]
+    print(f"\n请求 {r['requests']}  错误 {r['errors']}  耗时 {r['elapsed_s']}s  {r['rps']} 请求/秒")
+    print(f"延迟 p50 {r['p50_ms']}ms  p95 {r['p95_ms']}ms  p99 {r['p99_ms']}ms")
+    print(f"每请求 SQL {r['queries_per_request']}  每请求模型调用 {r['llm_calls_per_request']}")
+    for kind, stats in r["by_kind"].items():
+        print(f"  {kind:<10} {stats['requests']:>5} 次  p50 {stats['p50_ms']}ms  p95 {stats['p95_ms']}ms")
+    for error in results.errors[:10]:
+        print(f"  错误: {error}")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    regressed = False
+    if args.save_baseline:
+        report["recorded_at"] = datetime.now().isoformat(timespec="seconds")
+        baselines[args.name] = report
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\n已保存基线 {args.name} -> {args.baseline}")
+    elif args.name in baselines:
+        regressed = compare(report, baselines[args.name])
+    else:
+        print(f"\n没有名为 {args.name} 的基线，使用 --save-baseline 记录")
+
+    if args.check and regressed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
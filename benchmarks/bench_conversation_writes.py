@@ -0,0 +1,117 @@
+"""对话历史写入基准测试
+
+对比旧的逐条写入（每条消息 COUNT + 查询最旧 + 删除 + 提交）、
+按轮批量写入（一次插入 + 一次范围删除 + 一次提交）与异步写入（请求线程只入队，
+后台线程多行 INSERT 批量提交，CONVERSATION_WRITE_BEHIND=true）的耗时、查询数和提交数。
+异步写入的"每轮"是请求线程上的耗时，"写完"包括等待队列全部落库。
+
+用法：
+    python benchmarks/bench_conversation_writes.py --rows 2000000 --turns 500
+    python benchmarks/bench_conversation_writes.py --database-url mysql+pymysql://...
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="对话历史写入基准测试")
+    parser.add_argument("--database-url", default=None, help="数据库 URI，默认使用临时 sqlite 文件")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="预先填充的历史消息行数")
+    parser.add_argument("--sessions", type=int, default=10_000, help="预填充数据分布的会话数")
+    parser.add_argument("--turns", type=int, default=300, help="每种写入方式执行的对话轮数")
+    return parser.parse_args()
+
+args = parse_args()
+os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert
+from backend.config import Config
+from backend.database import engine, SessionLocal
+from backend.model import Base, Conversation
+from backend.service.conversation_service import ConversationService
+from backend.service.conversation_writer import conversation_writer
+from backend.service.history_cache import history_cache
+
+def seed(rows: int, sessions: int):
+    """批量填充历史数据"""
+    Base.metadata.create_all(bind=engine)
+    start = datetime.now() - timedelta(days=30)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            batch.append({
+                "session_id": f"seed-{i % sessions}",
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"历史消息 {i}",
+                "created_at": start + timedelta(seconds=i),
+            })
+            if len(batch) == 10_000:
+                conn.execute(insert(Conversation), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Conversation), batch)
+
+def legacy_add_message(db, session_id: str, role: str, content: str):
+    """旧的逐条写入流程"""
+    db.add(Conversation(session_id=session_id, role=role, content=content))
+    count = db.query(Conversation).filter(Conversation.session_id == session_id).count()
+    if count > Config.MAX_CONVERSATION_HISTORY:
+        oldest = db.query(Conversation)\
+            .filter(Conversation.session_id == session_id)\
+            .order_by(Conversation.created_at.asc())\
+            .first()
+        if oldest:
+            db.delete(oldest)
+    db.commit()
+
+def run(label: str, write_turn, turns: int):
+    queries = []
+    commits = []
+    on_query = lambda *a: queries.append(1)
+    on_commit = lambda *a: commits.append(1)
+    event.listen(engine, "before_cursor_execute", on_query)
+    event.listen(engine, "commit", on_commit)
+    start = time.perf_counter()
+    for i in range(turns):
+        # 复用预填充的会话，使每轮都触发历史裁剪
+        write_turn(f"seed-{i % 50}", f"问题 {i}", f"回答 {i}")
+    elapsed = time.perf_counter() - start
+    conversation_writer.flush(timeout=60)
+    drained = time.perf_counter() - start
+    event.remove(engine, "before_cursor_execute", on_query)
+    event.remove(engine, "commit", on_commit)
+    print(f"{label:<10} {turns} 轮  每轮 {elapsed / turns * 1000:.2f}ms  写完 {drained:.3f}s  "
+          f"每轮查询 {len(queries) / turns:.1f}  提交 {len(commits)} 次")
+
+def main():
+    print(f"数据库: {engine.url.render_as_string(hide_password=True)}")
+    seed_start = time.perf_counter()
+    seed(args.rows, args.sessions)
+    print(f"已填充 {args.rows} 行（{time.perf_counter() - seed_start:.1f}s）")
+
+    db = SessionLocal()
+    history_cache.clear()
+
+    def legacy_turn(session_id, question, answer):
+        legacy_add_message(db, session_id, "user", question)
+        legacy_add_message(db, session_id, "assistant", answer)
+
+    service = ConversationService(db)
+
+    def turn_api(session_id, question, answer):
+        service.add_turn(session_id, [("user", question), ("assistant", answer)])
+
+    run("逐条写入", legacy_turn, args.turns)
+    run("按轮写入", turn_api, args.turns)
+    conversation_writer.enabled = True
+    run("异步写入", turn_api, args.turns)
+    conversation_writer.shutdown()
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""指标埋点开销基准测试
+
+分别测量单个阶段计时、一次 /chat 请求的完整埋点（请求计数 + 5 个阶段 + 工具计数）的耗时，
+并与一次本地路由的 ChatService.chat 请求（不调用模型）对比，确认埋点不会拖慢热路径。
+
+用法：
+    python benchmarks/bench_metrics_overhead.py
+    python benchmarks/bench_metrics_overhead.py --multiprocess    # gunicorn 多 worker 模式（指标写入 mmap 文件）
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="指标埋点开销基准测试")
+    parser.add_argument("--database-url", default=None, help="数据库 URI，默认使用临时 sqlite 文件")
+    parser.add_argument("--iterations", type=int, default=100_000, help="每项埋点测量的次数")
+    parser.add_argument("--requests", type=int, default=500, help="端到端对比执行的请求数")
+    parser.add_argument("--multiprocess", action="store_true", help="启用 Prometheus 多进程模式")
+    return parser.parse_args()
+
+args = parse_args()
+os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+if args.multiprocess:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp()
+else:
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+from backend import metrics
+from backend.metrics import STAGES, observe_stage, record_tool_call, track_request
+
+def per_op_us(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def baseline():
+    pass
+
+def single_stage():
+    with observe_stage("llm_call"):
+        pass
+
+def full_request():
+    """一次包含函数调用的 /chat 请求产生的全部埋点"""
+    with track_request("chat") as request:
+        for stage in STAGES:
+            with observe_stage(stage):
+                pass
+        record_tool_call("get_balance", True)
+        request.failed = False
+
+def end_to_end(requests: int) -> float:
+    """本地路由的余额查询（数据库读写，不调用模型）的平均耗时，单位微秒"""
+    from backend.database import SessionLocal, init_db
+    from backend.service.chat_service import ChatService
+
+    init_db()
+    db = SessionLocal()
+    try:
+        service = ChatService(db)
+        service.chat("bench-warmup", "张三的余额")
+        start = time.perf_counter()
+        for i in range(requests):
+            reply, status = service.chat(f"bench-{i % 50}", "张三的余额")
+            assert status == 200, reply
+        return (time.perf_counter() - start) / requests * 1e6
+    finally:
+        db.close()
+
+def main():
+    mode = "多进程" if metrics.MULTIPROCESS else "单进程"
+    print(f"模式：{mode}，每项 {args.iterations} 次")
+    empty = per_op_us(baseline, args.iterations)
+    stage = per_op_us(single_stage, args.iterations) - empty
+    request = per_op_us(full_request, args.iterations) - empty
+    print(f"单个阶段计时：{stage:8.2f} µs")
+    print(f"单次请求全部埋点：{request:8.2f} µs")
+
+    chat_us = end_to_end(args.requests)
+    print(f"本地路由请求耗时：{chat_us:8.1f} µs（含埋点）")
+    print(f"埋点占比：{request / chat_us * 100:.2f}%")
+
+    body, _ = metrics.render_metrics()
+    print(f"/metrics 输出 {len(body)} 字节")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""应用启动耗时基准测试
+
+在全新的 Python 进程中分别测量两种启动方式：
+- legacy：旧的启动流程，导入时加载 openai，create_app 中建表并检查默认数据（DB_AUTO_INIT=true）
+- current：当前流程，建表由 init_db.py 单独执行，openai 在第一次调用模型时才导入
+
+每种方式报告导入应用耗时、第一个 /health 请求、第一个本地路由请求和第一个需要调用模型的请求
+（使用 benchmarks/mock_llm_server.py，延迟为 0）。--gunicorn 时再对比 preload_app 开关下
+gunicorn worker 从 fork 到可以处理请求的耗时。
+
+用法：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --database-url mysql+pymysql://root:pw@db-host/bank --gunicorn
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+from benchmarks.mock_llm_server import MockLLM, start_server
+os.environ["DEEPSEEK_BASE_URL"] = start_server(MockLLM(latency=0, token_rate=0)).base_url
+timings = {}
+start = time.perf_counter()
+if os.environ.get("BENCH_EAGER_OPENAI"):
+    import openai
+from app import app
+timings["import_app"] = time.perf_counter() - start
+client = app.test_client()
+for label, method, path, body in (
+    ("first_health", "get", "/health", None),
+    ("first_routed_chat", "post", "/chat", {"message": "张三的余额"}),
+    ("first_llm_chat", "post", "/chat", {"message": "什么是定期存款"}),
+):
+    start = time.perf_counter()
+    response = getattr(client, method)(path, json=body)
+    assert response.status_code == 200, response.data
+    timings[label] = time.perf_counter() - start
+print("TIMINGS " + json.dumps(timings))
+'''
+
+MODES = {
+    "legacy": {"DB_AUTO_INIT": "true", "BENCH_EAGER_OPENAI": "1"},
+    "current": {"DB_AUTO_INIT": "false"},
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="应用启动耗时基准测试")
+    parser.add_argument("--database-url", default=None, help="数据库 URI，默认使用临时 sqlite 文件")
+    parser.add_argument("--runs", type=int, default=5, help="每种方式启动的次数")
+    parser.add_argument("--gunicorn", action="store_true", help="同时测量 gunicorn worker 启动耗时")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker 数")
+    return parser.parse_args()
+
+def base_env(database_url: str) -> dict:
+    env = dict(os.environ)
+    env.update(DATABASE_URL=database_url, DEEPSEEK_API_KEY=env.get("DEEPSEEK_API_KEY", "mock"))
+    env.pop("BENCH_EAGER_OPENAI", None)
+    return env
+
+def probe(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("TIMINGS "))
+    return json.loads(line[len("TIMINGS "):])
+
+def gunicorn_boot(env: dict, workers: int, preload: bool) -> dict:
+    """启动 gunicorn，等所有 worker 就绪后返回耗时，然后停止"""
+    env = dict(env, GUNICORN_PRELOAD="true" if preload else "false")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", "127.0.0.1:0", "--log-level", "info", "app:app"],
+        cwd=ROOT, env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True,
+    )
+    boots = []
+    try:
+        for line in process.stderr:
+            match = re.search(r"启动耗时 (\d+)ms", line)
+            if match:
+                boots.append(float(match.group(1)))
+                if len(boots) == workers:
+                    break
+        ready = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {"all_ready_s": ready, "worker_boot_ms": statistics.mean(boots) if boots else float("nan")}
+
+def main():
+    args = parse_args()
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    env = base_env(database_url)
+    # 当前流程要求部署时先执行一次 init_db.py
+    subprocess.run([sys.executable, "init_db.py"], cwd=ROOT, env=env, capture_output=True, check=True)
+    print(f"数据库: {re.sub(r'//[^@/]*@', '//***@', database_url)}，每种方式 {args.runs} 次，取中位数")
+
+    print(f"\n{'':<10}{'导入应用':>10}{'首个/health':>14}{'首个本地路由':>14}{'首个模型请求':>14}")
+    for mode, overrides in MODES.items():
+        runs = [probe(dict(env, **overrides)) for _ in range(args.runs)]
+        median = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+        print(f"{mode:<10}{median['import_app']:>9.0f}ms{median['first_health']:>12.0f}ms"
+              f"{median['first_routed_chat']:>12.0f}ms{median['first_llm_chat']:>12.0f}ms")
+
+    if args.gunicorn:
+        print(f"\ngunicorn {args.workers} 个 worker：")
+        for preload in (False, True):
+            result = gunicorn_boot(dict(env, DB_AUTO_INIT="false"), args.workers, preload)
+            print(f"  preload={'on ' if preload else 'off'}  worker 启动 {result['worker_boot_ms']:6.0f}ms"
+                  f"  全部就绪 {result['all_ready_s'] * 1000:6.0f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""批量转账金额格式检查
+
+通过 POST /transfers/batch 提交布尔值、NaN、字符串等格式不正确的金额，检查：
+- 这些转账逐笔返回「金额格式不正确」，整批仍返回 200
+- 余额不变，没有写入交易记录
+- 同批中格式正确的转账照常执行
+
+用法：
+    python benchmarks/check_batch_transfer_amounts.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+workdir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bank.db")
+os.environ["ACCOUNT_CACHE_SIZE"] = "0"
+os.environ.setdefault("DEEPSEEK_API_KEY", "sk-batch-check")
+
+from sqlalchemy import func, select
+from app import create_app
+from backend.database import SessionLocal, init_db
+from backend.model import Account, Transaction
+
+failures = []
+
+def check(label: str, ok: bool, detail: str = ""):
+    print(f"  {'✓' if ok else '✗'} {label}{'：' + detail if detail else ''}")
+    if not ok:
+        failures.append(label)
+
+def snapshot():
+    db = SessionLocal.session_factory()
+    try:
+        balances = dict(db.execute(select(Account.name, Account.balance)).all())
+        count = db.execute(select(func.count()).select_from(Transaction)).scalar()
+        return balances, count
+    finally:
+        db.close()
+
+def post(client, body: str):
+    return client.post("/transfers/batch", data=body, content_type="application/json")
+
+if __name__ == '__main__':
+    init_db()
+    client = create_app().test_client()
+    cases = [("true", "布尔值"), ("NaN", "NaN"), ("Infinity", "无穷大"), ('"100"', "字符串")]
+
+    print("格式不正确的金额：")
+    for raw, label in cases:
+        before = snapshot()
+        response = post(client, f'{{"transfers": [{{"from_name": "张三", "to_name": "李四", "amount": {raw}}}]}}')
+        result = (response.get_json() or {}).get("results", [{}])[0]
+        check(f"{label} 返回 200", response.status_code == 200, str(response.status_code))
+        check(f"{label} 逐笔报告格式错误", result.get("error") == "金额格式不正确", result.get("error", ""))
+        check(f"{label} 不修改余额和交易记录", snapshot() == before)
+
+    print("\n同批中格式正确的转账：")
+    before, count = snapshot()
+    response = post(client, '{"transfers": [{"from_name": "张三", "to_name": "李四", "amount": true}, '
+                            '{"from_name": "张三", "to_name": "李四", "amount": 100}]}')
+    body = response.get_json() or {}
+    after, after_count = snapshot()
+    check("一笔成功一笔失败", (body.get("succeeded"), body.get("failed")) == (1, 1), str(body.get("results")))
+    check("只转出 ¥100", before["张三"] - after["张三"] == 100, f"{before['张三']} -> {after['张三']}")
+    check("写入两条交易记录", after_count - count == 2, f"{after_count - count} 条")
+
+    print(f"\n结果: {'通过' if not failures else '失败（' + '、'.join(failures) + '）'}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,124 @@
+"""只读副本路由检查
+
+用两个 sqlite 文件模拟主库和只读副本：初始化主库后复制一份作为副本，之后副本不再同步（相当于复制延迟无限大），
+通过读到的是新数据还是旧数据判断每次查询走了哪个库。检查：
+- 只读工具和对话历史在副本上读取，转账和消息写入只落在主库
+- 转账后同一个数据库会话、同一个对话会话在 DB_REPLICA_STICKY_SECONDS 秒内读到自己的写入
+- 超过该时间后，以及其他对话会话，读取回到副本
+
+用法：
+    python benchmarks/check_replica_routing.py
+    python benchmarks/check_replica_routing.py --sticky 2
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="只读副本路由检查")
+    parser.add_argument("--sticky", type=float, default=1.0, help="读己之写的秒数（DB_REPLICA_STICKY_SECONDS）")
+    return parser.parse_args()
+
+args = parse_args()
+workdir = tempfile.mkdtemp()
+primary_path = os.path.join(workdir, "primary.db")
+replica_path = os.path.join(workdir, "replica.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + primary_path
+os.environ["DATABASE_REPLICA_URLS"] = "sqlite:///" + replica_path
+os.environ["DB_REPLICA_STICKY_SECONDS"] = str(args.sticky)
+os.environ["HISTORY_CACHE_SIZE"] = "0"  # 对话历史每次都从数据库读取
+os.environ["ACCOUNT_CACHE_SIZE"] = "0"
+os.environ["CONVERSATION_WRITE_BEHIND"] = "false"
+os.environ.setdefault("DEEPSEEK_API_KEY", "sk-replica-check")
+
+from sqlalchemy import create_engine, func, select
+from backend.database import SessionLocal, create_tables, engine, init_default_data, replica_router
+from backend.model import Account, Transaction
+from backend.service.chat_service import ChatService
+
+failures = []
+
+def check(label: str, ok: bool, detail: str = ""):
+    print(f"  {'✓' if ok else '✗'} {label}{'：' + detail if detail else ''}")
+    if not ok:
+        failures.append(label)
+
+def balance_in_reply(reply: str) -> str:
+    for line in reply.splitlines():
+        if "当前余额" in line:
+            return line.split("：", 1)[1]
+    return reply
+
+def chat(session_id: str, message: str) -> str:
+    """每轮使用新的数据库会话，与一次 HTTP 请求相同"""
+    db = SessionLocal.session_factory()
+    try:
+        reply, _ = ChatService(db).chat(session_id, message)
+        return reply
+    finally:
+        db.close()
+
+def history_length(session_id: str) -> int:
+    db = SessionLocal.session_factory()
+    try:
+        return len(ChatService(db).conversation_service.get_messages(session_id))
+    finally:
+        db.close()
+
+def count_transactions(path: str) -> int:
+    with create_engine("sqlite:///" + path).connect() as conn:
+        return conn.execute(select(func.count()).select_from(Transaction)).scalar()
+
+if __name__ == '__main__':
+    print(f"主库: {primary_path}\n副本: {replica_path}（初始化后复制，之后不再同步）\n读己之写: {args.sticky}s\n")
+    create_tables()
+    init_default_data()
+    engine.dispose()
+    shutil.copyfile(primary_path, replica_path)
+
+    with create_engine("sqlite:///" + primary_path).connect() as conn:
+        initial = conn.execute(select(Account.balance).where(Account.name == "张三")).scalar()
+    replica_balance = f"¥{initial:,.2f}元"
+
+    print("对话会话 A 转账后立即查询：")
+    reply = chat("session-a", "从张三转100元给李四")
+    check("转账成功", "转账成功" in reply, reply.splitlines()[0])
+    fresh_balance = f"¥{initial - 100:,.2f}元"
+    check("转账写入主库", count_transactions(primary_path) == 2, f"主库 {count_transactions(primary_path)} 条交易记录")
+    check("副本没有写入", count_transactions(replica_path) == 0, f"副本 {count_transactions(replica_path)} 条交易记录")
+    got = balance_in_reply(chat("session-a", "张三的余额"))
+    check("同一对话会话读到自己的写入", got == fresh_balance, got)
+    check("对话历史读到刚写入的消息", history_length("session-a") == 4, f"{history_length('session-a')} 条")
+
+    print("\n其他对话会话：")
+    got = balance_in_reply(chat("session-b", "张三的余额"))
+    check("余额查询走副本（旧数据）", got == replica_balance, got)
+
+    print(f"\n等待 {args.sticky}s 后对话会话 A 再次查询：")
+    time.sleep(args.sticky + 0.1)
+    got = balance_in_reply(chat("session-a", "张三的余额"))
+    check("余额查询回到副本", got == replica_balance, got)
+    time.sleep(args.sticky + 0.1)
+    check("对话历史回到副本", history_length("session-a") == 0, f"{history_length('session-a')} 条（副本中没有消息）")
+
+    print("\n同一个数据库会话中先转账再查询：")
+    db = SessionLocal.session_factory()
+    try:
+        service = ChatService(db)
+        service.run_function("transfer_money", ("张三", "李四", 50.0))
+        got = balance_in_reply(service.run_function("get_balance", ("张三",))[0])
+        check("转账后的查询走主库", got == f"¥{initial - 150:,.2f}元", got)
+    finally:
+        db.close()
+
+    stats = replica_router.get_stats()
+    print(f"\n路由统计: 副本读取 {stats['replica_reads']}  读己之写 {stats['sticky_reads']}  "
+          f"主库语句 {stats['primary_statements']}")
+    print(f"结果: {'通过' if not failures else '失败（' + '、'.join(failures) + '）'}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,256 @@
+"""模拟 OpenAI 兼容的模型服务（压测用）
+
+实现 POST /chat/completions（也接受 /v1/chat/completions），支持普通和流式响应：
+- 首 token 延迟和生成速度可配置，生成耗时按回复长度 / token 速度计算
+- 按剧本回复：依次用正则匹配最后一条用户消息，返回第一条匹配的回复，可以是 CALL: 指令
+- 请求带 tools 时把 CALL: 指令转换为原生 tool_calls，与应用的 LLM_NATIVE_TOOLS 设置保持一致
+
+用法：
+    python benchmarks/mock_llm_server.py --port 9100 --latency 0.3 --token-rate 50
+    python benchmarks/mock_llm_server.py --script my_script.json
+    DEEPSEEK_BASE_URL=http://127.0.0.1:9100 gunicorn app:app
+
+剧本文件为 JSON 数组，如 [{"match": "余额", "reply": "CALL:get_balance(name=\\"张三\\")"}]，
+最后一项通常使用 "match": "" 作为兜底回复。
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+
+DEFAULT_SCRIPT = [
+    {"match": r"余额|多少钱", "reply": 'CALL:get_balance(name="{name}")'},
+    {"match": r"转", "reply": 'CALL:transfer_money(from_name="{name}", to_name="{other}", amount=1)'},
+    {"match": r"交易|流水|记录", "reply": 'CALL:get_transaction_history(name="{name}", limit=5)'},
+    {"match": "", "reply": "您好！我是银行智能助手。定期存款是指存入时约定存期、到期支取本息的存款方式，"
+                           "一般利率高于活期存款，适合短期内不需要动用的资金。请问还有什么可以帮您？"},
+]
+
+ACCOUNT_NAMES = ("张三", "李四", "王五")
+
+_CALL_PATTERN = re.compile(r'CALL:\s*(\w+)\s*\(([^)]*)\)')
+_ARG_PATTERN = re.compile(r'(\w+)\s*=\s*(?:"([^"]*)"|([^,\s)]+))')
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数（中文约一字一 token）"""
+    return max(len(text), 1)
+
+def _to_tool_calls(reply: str) -> List[Dict]:
+    """把 CALL: 指令转换为原生 tool_calls"""
+    calls = []
+    for index, match in enumerate(_CALL_PATTERN.finditer(reply)):
+        arguments = {}
+        for arg in _ARG_PATTERN.finditer(match.group(2)):
+            quoted, bare = arg.group(2), arg.group(3)
+            if quoted is not None:
+                arguments[arg.group(1)] = quoted
+            else:
+                arguments[arg.group(1)] = float(bare) if re.fullmatch(r"-?\d+(\.\d+)?", bare) else bare
+        calls.append({
+            "index": index,
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": match.group(1), "arguments": json.dumps(arguments, ensure_ascii=False)},
+        })
+    return calls
+
+class MockLLM:
+    """回复剧本和速度设置，多个请求线程共享"""
+
+    def __init__(self, latency: float = 0.3, token_rate: float = 50.0, script: Optional[List[Dict]] = None,
+                 model: str = "mock-chat", chunk_tokens: int = 4):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.script = [(re.compile(item["match"]), item["reply"]) for item in (script or DEFAULT_SCRIPT)]
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self.requests = 0
+        self.stream_requests = 0
+
+    def reply_for(self, messages: List[Dict]) -> str:
+        user_message = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        # 按在消息中出现的先后取账户名称，第一个为操作账户，第二个为对方账户
+        mentioned = sorted((n for n in ACCOUNT_NAMES if n in user_message), key=user_message.index)
+        name = mentioned[0] if mentioned else ACCOUNT_NAMES[0]
+        other = mentioned[1] if len(mentioned) > 1 else ACCOUNT_NAMES[(ACCOUNT_NAMES.index(name) + 1) % len(ACCOUNT_NAMES)]
+        for pattern, reply in self.script:
+            if pattern.search(user_message):
+                return reply.replace("{name}", name).replace("{other}", other)
+        return ""
+
+    def respond(self, body: Dict) -> Tuple[str, List[Dict], Dict]:
+        """返回 (文本内容, tool_calls, usage)"""
+        with self._lock:
+            self.requests += 1
+            if body.get("stream"):
+                self.stream_requests += 1
+        messages = body.get("messages", [])
+        reply = self.reply_for(messages)
+        tool_calls = _to_tool_calls(reply) if body.get("tools") and "CALL:" in reply else []
+        content = "" if tool_calls else reply
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = estimate_tokens(reply)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            # 系统提示词部分按前缀缓存命中计
+            "prompt_tokens_details": {"cached_tokens": estimate_tokens(messages[0].get("content") or "") if messages else 0},
+        }
+        return content, tool_calls, usage
+
+    def completion_id(self) -> str:
+        return f"chatcmpl-mock-{next(self._counter)}"
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    @property
+    def llm(self) -> MockLLM:
+        return self.server.llm
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": self.llm.model, "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        content, tool_calls, usage = self.llm.respond(body)
+        time.sleep(self.llm.latency)
+        if body.get("stream"):
+            self._stream(body, content, tool_calls, usage)
+            return
+
+        if self.llm.token_rate > 0:
+            time.sleep(usage["completion_tokens"] / self.llm.token_rate)
+        message = {"role": "assistant", "content": content}
+        if tool_calls:
+            message["tool_calls"] = [{k: v for k, v in call.items() if k != "index"} for call in tool_calls]
+        self._send_json(200, {
+            "id": self.llm.completion_id(),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", self.llm.model),
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, body: Dict, content: str, tool_calls: List[Dict], usage: Dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = self.llm.completion_id()
+        model = body.get("model", self.llm.model)
+
+        def chunk(delta: Dict, finish_reason=None, chunk_usage=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [] if chunk_usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if chunk_usage:
+                payload["usage"] = chunk_usage
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        step = max(self.llm.chunk_tokens, 1)
+        delay = step / self.llm.token_rate if self.llm.token_rate > 0 else 0
+        try:
+            chunk({"role": "assistant", "content": ""})
+            for start in range(0, len(content), step):
+                chunk({"content": content[start:start + step]})
+                time.sleep(delay)
+            for call in tool_calls:
+                chunk({"tool_calls": [call]})
+                time.sleep(delay)
+            chunk({}, finish_reason="tool_calls" if tool_calls else "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk({}, chunk_usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, llm: MockLLM):
+        super().__init__(address, MockHandler)
+        self.llm = llm
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def start_server(llm: MockLLM, host: str = "127.0.0.1", port: int = 0) -> MockServer:
+    """在后台线程中启动模拟服务，port=0 时随机选择端口"""
+    server = MockServer((host, port), llm)
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+def load_script(path: Optional[str]) -> Optional[List[Dict]]:
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.3, help="首 token 延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="生成速度（token/秒，0 为不限速）")
+    parser.add_argument("--script", default=None, help="回复剧本 JSON 文件，默认使用内置剧本")
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 OpenAI 兼容的模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    llm = MockLLM(latency=args.latency, token_rate=args.token_rate, script=load_script(args.script))
+    server = MockServer((args.host, args.port), llm)
+    print(f"模拟模型服务: {server.base_url}（延迟 {args.latency}s，{args.token_rate} token/s）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""交易编号并发压力测试
+
+多个进程 × 多个线程同时转账，检查生成的交易编号没有重复、没有因编号冲突失败的转账。
+
+用法：
+    python benchmarks/stress_transaction_ids.py --processes 4 --threads 8 --transfers 200
+    python benchmarks/stress_transaction_ids.py --generator snowflake
+    python benchmarks/stress_transaction_ids.py --database-url mysql+pymysql://...
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="交易编号并发压力测试")
+    parser.add_argument("--database-url", default=None, help="数据库 URI，默认使用临时 sqlite 文件")
+    parser.add_argument("--generator", default="sequence", choices=["sequence", "snowflake"])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--transfers", type=int, default=100, help="每个线程执行的转账次数")
+    parser.add_argument("--accounts", type=int, default=50)
+    return parser.parse_args()
+
+args = parse_args()
+os.environ["DATABASE_URL"] = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "stress.db")
+os.environ["TXN_ID_GENERATOR"] = args.generator
+
+from sqlalchemy import func
+from backend.database import engine, SessionLocal
+from backend.model import Base, Transaction
+from backend.service.account_service import AccountService
+
+def setup_accounts(count: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal.session_factory()
+    service = AccountService(db)
+    for i in range(count):
+        service.create_account(f"压测{i}", f"9{i:015d}", "储蓄账户", balance=1_000_000.0)
+    db.close()
+
+def worker(results):
+    failures = []
+
+    def run_thread():
+        db = SessionLocal.session_factory()
+        service = AccountService(db)
+        ids = [a.id for a in service.get_all_accounts()]
+        for _ in range(args.transfers):
+            from_id, to_id = random.sample(ids, 2)
+            success, error, _ = service.transfer(from_id, to_id, 1.0)
+            if not success:
+                failures.append(error)
+        db.close()
+
+    threads = [threading.Thread(target=run_thread) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(failures)
+
+def main():
+    setup_accounts(args.accounts)
+    engine.dispose()
+
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    start = time.perf_counter()
+    processes = [ctx.Process(target=worker, args=(results,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    failures = []
+    for _ in processes:
+        failures.extend(results.get())
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal.session_factory()
+    total = db.query(func.count(Transaction.id)).scalar()
+    distinct = db.query(func.count(func.distinct(Transaction.transaction_id))).scalar()
+    db.close()
+
+    attempted = args.processes * args.threads * args.transfers
+    id_conflicts = [f for f in failures if "UNIQUE" in f.upper() or "Duplicate" in f]
+    print(f"生成器: {args.generator}  转账请求: {attempted}  耗时: {elapsed:.2f}s")
+    print(f"成功转账: {total // 2}  失败: {len(failures)}（其中编号冲突 {len(id_conflicts)}）")
+    print(f"交易记录: {total}  不重复编号: {distinct}")
+    ok = total == distinct and not id_conflicts
+    print("结果: " + ("通过，编号无重复" if ok else "失败，存在重复编号"))
+    if failures and not id_conflicts:
+        print(f"其他失败示例: {failures[0]}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
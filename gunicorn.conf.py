@@ -0,0 +1,63 @@
+"""gunicorn 配置（gunicorn 启动时自动加载当前目录下的本文件）"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Prometheus 多进程模式：各 worker 把指标写入该目录，/metrics 汇总所有 worker 的数据
+# 必须在导入应用（以及 prometheus_client）之前设置
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), f"bank-metrics-{os.getpid()}")
+# preload 模式下应用在 on_starting 之前导入，目录需要提前存在
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# master 导入一次应用，worker fork 后直接继承已导入的模块，不必各自重新导入。
+# 继承的数据库连接池、模型 API 客户端等由各模块的 os.register_at_fork 钩子在子进程中丢弃
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+def on_starting(server):
+    """清理上次运行留下的指标文件"""
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+def when_ready(server):
+    """preload 模式下 master 已导入应用：提前导入 openai，并关闭 master 自己打开过的数据库连接"""
+    if not server.cfg.preload_app:
+        return
+    from backend.database import engine
+    from backend.llm_client import preload_sdk
+
+    start = time.perf_counter()
+    preload_sdk()
+    engine.dispose()
+    server.log.info(f"master 预加载完成，额外耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+
+def pre_fork(server, worker):
+    worker.boot_started = time.perf_counter()
+
+def post_worker_init(worker):
+    """输出 worker 从 fork 到可以处理请求的耗时"""
+    preload = worker.cfg.preload_app
+    worker.log.info(
+        f"worker {worker.pid} 启动耗时 {(time.perf_counter() - worker.boot_started) * 1000:.0f}ms"
+        f"（preload={'on' if preload else 'off'}）"
+    )
+    if not preload:
+        # 不在启动路径上导入 openai，后台导入以免第一个需要模型的请求等待
+        from backend.llm_client import preload_sdk
+
+        threading.Thread(target=preload_sdk, name="preload-sdk", daemon=True).start()
+
+def worker_exit(server, worker):
+    """worker 退出前写完异步写入队列中的对话消息"""
+    from backend.service.conversation_writer import conversation_writer
+
+    conversation_writer.shutdown()
+
+def child_exit(server, worker):
+    """worker 退出后不再计入进行中请求数等实时指标"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
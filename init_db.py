@@ -1,15 +1,39 @@
-"""数据库初始化脚本"""
-from backend.database import init_db
+"""数据库初始化脚本
+
+部署时执行一次（应用启动时不再建表）：创建数据表、补建索引、初始化默认账户数据、生成交易汇总。
+每一步都可以重复执行，已存在的表、索引和账户会跳过；交易汇总只在为空时从交易记录生成。
+
+用法：
+    python init_db.py
+    python init_db.py --skip-seed    # 只建表和索引，不创建默认账户
+    python init_db.py --rebuild-rollups    # 从交易记录全量重建日汇总、月汇总
+"""
+from backend.database import create_tables, ensure_indexes, ensure_rollups, engine, init_default_data
+import argparse
 import logging
+import time
 
 logging.basicConfig(level=logging.INFO)
 
+def run_step(label: str, step):
+    start = time.perf_counter()
+    step()
+    print(f"  {label:<12} {(time.perf_counter() - start) * 1000:8.1f}ms")
+
 if __name__ == '__main__':
-    print("开始初始化数据库...")
+    parser = argparse.ArgumentParser(description="数据库初始化")
+    parser.add_argument("--skip-seed", action="store_true", help="不创建默认账户")
+    parser.add_argument("--rebuild-rollups", action="store_true", help="从交易记录全量重建交易汇总")
+    args = parser.parse_args()
+
+    print(f"开始初始化数据库 {engine.url.render_as_string(hide_password=True)} ...")
     try:
-        init_db()
+        run_step("创建数据表", create_tables)
+        run_step("补建索引", ensure_indexes)
+        if not args.skip_seed:
+            run_step("默认账户", init_default_data)
+        run_step("交易汇总", lambda: ensure_rollups(rebuild=args.rebuild_rollups))
         print("数据库初始化成功！")
     except Exception as e:
         print(f"数据库初始化失败: {str(e)}")
         raise
-
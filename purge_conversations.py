@@ -0,0 +1,74 @@
+"""对话历史清理脚本
+
+删除最后一条消息早于保留期限（默认 CONVERSATION_RETENTION_DAYS 天）的会话的全部消息和滚动摘要。
+按主键分批、每批一个短事务，可以在线上流量期间运行，适合用 cron 或平台的定时任务每天执行一次。
+
+用法：
+    python purge_conversations.py
+    python purge_conversations.py --days 30 --archive archive/conversations-20261018.jsonl.gz
+    python purge_conversations.py --dry-run          # 只统计，不删除
+    python purge_conversations.py --sleep-ms 50      # 每批之间暂停，降低对数据库的压力
+"""
+from datetime import datetime, timedelta
+from backend.config import Config
+from backend.database import SessionLocal, engine
+from backend.service.retention_service import ConversationPurger
+import argparse
+import gzip
+import os
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+def open_archive(path: str):
+    """以追加方式打开归档文件，.gz 结尾时使用 gzip 压缩"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith(".gz"):
+        return gzip.open(path, "at", encoding="utf-8")
+    return open(path, "a", encoding="utf-8")
+
+_last_progress = 0.0
+
+def print_progress(stats: dict):
+    """最多每秒输出一次进度"""
+    global _last_progress
+    now = time.monotonic()
+    if now - _last_progress < 1.0:
+        return
+    _last_progress = now
+    print(f"  已扫描 {stats['scanned']} 行，清理 {stats['purged']} 行 / {stats['sessions']} 个会话，"
+          f"{stats['rows_per_second']:.0f} 行/秒")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="清理不活跃会话的对话历史")
+    parser.add_argument("--days", type=float, default=Config.CONVERSATION_RETENTION_DAYS,
+                        help="保留最近多少天内有消息的会话")
+    parser.add_argument("--chunk-size", type=int, default=Config.PURGE_CHUNK_SIZE, help="每批扫描的行数")
+    parser.add_argument("--archive", default=None, help="把删除的消息追加到该 JSONL 文件（.gz 结尾时压缩）")
+    parser.add_argument("--sleep-ms", type=float, default=0, help="每批之间暂停的毫秒数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计将被清理的行数，不删除")
+    args = parser.parse_args()
+
+    cutoff = datetime.now() - timedelta(days=args.days)
+    print(f"清理数据库 {engine.url.render_as_string(hide_password=True)} 中 {cutoff:%Y-%m-%d %H:%M:%S} 之后"
+          f"没有消息的会话{'（只统计）' if args.dry_run else ''} ...")
+
+    db = SessionLocal.session_factory()
+    archive = open_archive(args.archive) if args.archive and not args.dry_run else None
+    try:
+        purger = ConversationPurger(db, cutoff, args.chunk_size, archive=archive,
+                                    dry_run=args.dry_run, pause=args.sleep_ms / 1000)
+        stats = purger.run(print_progress)
+    finally:
+        if archive is not None:
+            archive.close()
+        db.close()
+
+    print(f"{'将清理' if args.dry_run else '已清理'} {stats['purged']} 行 / {stats['sessions']} 个会话，"
+          f"扫描 {stats['scanned']} 行（{stats['chunks']} 批），耗时 {stats['elapsed']:.1f}s，"
+          f"{stats['rows_per_second']:.0f} 行/秒")
+    if archive is not None:
+        print(f"归档文件: {args.archive}")